@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+คลังข้อมูลแบบ columnar แบ่งตามเดือน สำหรับ log ที่โตขึ้นเรื่อยๆ
+
+เดือนที่ปิดแล้วจะถูกย้ายออกจาก CSV ไปเก็บเป็นไฟล์ NumPy (.npy) ต่อคอลัมน์:
+  archive/<series>/<YYYY-MM>/ts.npy            int64 (epoch microseconds)
+  archive/<series>/<YYYY-MM>/<col>.npy         float32 สำหรับค่าตัวเลข
+  archive/<series>/<YYYY-MM>/<col>.codes.npy   int16 สำหรับคอลัมน์ข้อความ (dictionary-encoded, -1 = ไม่มีค่า)
+  archive/<series>/<YYYY-MM>/meta.json         จำนวนแถว ช่วงเวลา และ dictionary ของคอลัมน์ข้อความ
+
+CSV เดิมจะเหลือเฉพาะเดือนปัจจุบัน (live tail) ส่วน CsvStore ใน storage.py อ่านรวม
+archive + live tail ให้อัตโนมัติ งานวิเคราะห์หลายปีใช้ load_columns() ซึ่ง memory-map
+เฉพาะคอลัมน์และเดือนที่ต้องการ
+
+ใช้งาน:
+  python archive.py compact [series ...]   # ย้ายเดือนที่ปิดแล้วเข้าคลัง
+  python archive.py info                   # แสดงเดือนที่อยู่ในคลัง
+"""
+import os
+import sys
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from storage import ARCHIVE_DIR, SERIES, TIMEZONE_THAILAND, parse_ts
+
+# --- ค่าคงที่ ---
+NA_STRINGS = ("", "N/A", "None", "nan")
+
+
+def _parse_float(text):
+    text = (text or "").replace(",", "").replace("cms", "").strip()
+    if text in NA_STRINGS:
+        return np.nan
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _fmt_float(value):
+    return "N/A" if np.isnan(value) else str(value)
+
+
+def _fmt_cms(value):
+    return "N/A" if np.isnan(value) else f"{value:,.2f} cms"
+
+
+# series -> [(คอลัมน์, ชนิด, ฟังก์ชันแปลงกลับเป็นข้อความ)]
+# ชนิด "f4" = float32, "dict" = dictionary-encoded string
+SCHEMAS = {
+    "chaopraya": [("storage", "f4", _fmt_cms)],
+    "inburi":    [("water_level", "f4", _fmt_float), ("bank_level", "f4", _fmt_float),
+                  ("status", "dict", None), ("below_bank", "f4", _fmt_float), ("time", "dict", None)],
+    "weather":   [("event", "dict", None), ("value", "f4", _fmt_float), ("issued", "dict", None),
+                  ("location", "dict", None)],
+    "stations":  [("station", "dict", None), ("storage", "f4", _fmt_float),
+                  ("level", "f4", _fmt_float), ("obs_time", "dict", None)],
+}
+
+
+def _month_key(dt):
+    return dt.astimezone(TIMEZONE_THAILAND).strftime("%Y-%m")
+
+
+def _to_us(dt):
+    return int(round(dt.timestamp() * 1_000_000))
+
+
+def _from_us(us):
+    return datetime.fromtimestamp(int(us) / 1_000_000, tz=timezone.utc).astimezone(TIMEZONE_THAILAND)
+
+
+def series_dir(series):
+    return os.path.join(ARCHIVE_DIR, series)
+
+
+def has_archive(series):
+    return os.path.isdir(series_dir(series))
+
+
+def list_months(series):
+    """เดือนที่อยู่ในคลังของ series นี้ เรียงจากเก่าไปใหม่"""
+    if not has_archive(series):
+        return []
+    return sorted(m for m in os.listdir(series_dir(series))
+                  if os.path.exists(os.path.join(series_dir(series), m, "meta.json")))
+
+
+def _read_meta(series, month):
+    with open(os.path.join(series_dir(series), month, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _months_overlapping(series, start=None, end=None):
+    lo = _to_us(start) if start is not None else None
+    hi = _to_us(end) if end is not None else None
+    for month in list_months(series):
+        meta = _read_meta(series, month)
+        if lo is not None and meta["max_ts"] < lo:
+            continue
+        if hi is not None and meta["min_ts"] > hi:
+            continue
+        yield month, meta
+
+
+def load_columns(series, columns=None, start=None, end=None, decode=False):
+    """
+    คืน dict คอลัมน์ -> numpy array (รวม "ts" เป็น epoch µs) ของช่วง [start, end]
+    อ่านเฉพาะคอลัมน์และเดือนที่ต้องการแบบ memory-map
+    decode=True จะแปลงคอลัมน์ dict กลับเป็น array ของข้อความ (ไม่เช่นนั้นคืน codes + "<col>.dict")
+    """
+    schema = {name: kind for name, kind, _ in SCHEMAS[series]}
+    columns = list(columns or schema)
+    parts = {name: [] for name in ["ts"] + columns}
+    dictionaries = {name: [] for name in columns if schema[name] == "dict"}
+
+    for month, meta in _months_overlapping(series, start, end):
+        base = os.path.join(series_dir(series), month)
+        ts = np.load(os.path.join(base, "ts.npy"), mmap_mode="r")
+        lo = 0 if start is None else int(np.searchsorted(ts, _to_us(start), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, _to_us(end), side="right"))
+        parts["ts"].append(ts[lo:hi])
+        for name in columns:
+            if name not in meta["dictionaries"] and not os.path.exists(os.path.join(base, f"{name}.npy")):
+                # คอลัมน์ที่เพิ่มภายหลัง (เช่น weather.location) ไม่มีในเดือนที่เก็บไว้ก่อน
+                size = hi - lo
+                parts[name].append(np.full(size, -1, dtype=np.int32) if schema[name] == "dict"
+                                   else np.full(size, np.nan, dtype=np.float32))
+                continue
+            if schema[name] == "dict":
+                codes = np.load(os.path.join(base, f"{name}.codes.npy"), mmap_mode="r")[lo:hi]
+                # รวม dictionary ของแต่ละเดือนเป็นชุดเดียวโดยเลื่อน code
+                offset = len(dictionaries[name])
+                dictionaries[name].extend(meta["dictionaries"][name])
+                parts[name].append(np.where(codes < 0, -1, codes.astype(np.int32) + offset))
+            else:
+                parts[name].append(np.load(os.path.join(base, f"{name}.npy"), mmap_mode="r")[lo:hi])
+
+    result = {}
+    for name, chunks in parts.items():
+        if len(chunks) == 1:
+            result[name] = chunks[0]
+        elif chunks:
+            result[name] = np.concatenate(chunks)
+        else:
+            result[name] = np.empty(0, dtype=np.int64 if name == "ts" or name in dictionaries else np.float32)
+    for name, values in dictionaries.items():
+        if decode:
+            lookup = np.array(values + [None], dtype=object)
+            result[name] = lookup[result[name]]
+        else:
+            result[f"{name}.dict"] = values
+    return result
+
+
+def iter_rows(series, start=None, end=None):
+    """แถวจากคลังในรูปแบบเดียวกับ CsvStore.iter_rows: (datetime, [ค่าเป็นข้อความ])"""
+    schema = SCHEMAS[series]
+    cols = load_columns(series, start=start, end=end, decode=True)
+    rendered = []
+    for name, kind, fmt in schema:
+        if kind == "dict":
+            rendered.append(["N/A" if v is None else v for v in cols[name]])
+        else:
+            rendered.append([fmt(v) for v in cols[name]])
+    for i, us in enumerate(cols["ts"]):
+        yield _from_us(us), [column[i] for column in rendered]
+
+
+def nearest(series, target, tolerance):
+    """หาแถวในคลังที่ใกล้ target ที่สุดภายใน tolerance ด้วย binary search ต่อเดือน"""
+    rows = list(iter_rows(series, target - tolerance, target + tolerance))
+    if not rows:
+        return None
+    return min(rows, key=lambda r: abs(r[0] - target))
+
+
+def _write_month(series, month, rows):
+    """เขียน rows (เรียงตามเวลาแล้ว) เป็นไฟล์ของเดือนนั้น แทนที่ของเดิมแบบ atomic ต่อไฟล์"""
+    base = os.path.join(series_dir(series), month)
+    os.makedirs(base, exist_ok=True)
+    ts = np.array([us for us, _ in rows], dtype=np.int64)
+    meta = {"rows": len(rows), "min_ts": int(ts[0]), "max_ts": int(ts[-1]), "dictionaries": {}}
+
+    arrays = {"ts": ts}
+    for i, (name, kind, _) in enumerate(SCHEMAS[series]):
+        values = [vals[i] if i < len(vals) else None for _, vals in rows]
+        if kind == "dict":
+            vocab, codes = {}, []
+            for v in values:
+                if v is None or v == "":
+                    codes.append(-1)
+                else:
+                    codes.append(vocab.setdefault(v, len(vocab)))
+            arrays[f"{name}.codes"] = np.array(codes, dtype=np.int16)
+            meta["dictionaries"][name] = list(vocab)
+        else:
+            arrays[name] = np.array([_parse_float(v) for v in values], dtype=np.float32)
+
+    for name, arr in arrays.items():
+        tmp = os.path.join(base, f".{name}.npy.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(base, f"{name}.npy"))
+    tmp = os.path.join(base, ".meta.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(base, "meta.json"))
+
+
+def compact(series, now=None):
+    """
+    ย้ายแถวของเดือนที่ปิดแล้วจาก CSV ของ series เข้าคลัง
+    คืนจำนวนแถวที่ย้าย (CSV จะเหลือเฉพาะเดือนปัจจุบันและแถวที่อ่านไม่ได้)
+    """
+    path = SERIES[series]["file"]
+    if not os.path.exists(path):
+        return 0
+    current_month = _month_key(now or datetime.now(TIMEZONE_THAILAND))
+    ncols = len(SERIES[series]["columns"])
+
+    by_month, keep = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split(",", ncols)
+            try:
+                dt = parse_ts(parts[0])
+            except ValueError:
+                keep.append(line)
+                continue
+            month = _month_key(dt)
+            if month >= current_month or len(parts) < 2:
+                keep.append(line)
+                continue
+            by_month.setdefault(month, []).append((_to_us(dt), parts[1:]))
+
+    moved = 0
+    for month, rows in sorted(by_month.items()):
+        if month in list_months(series):
+            # รวมกับของเดิมในคลัง (เช่นมีแถวเดือนเก่าถูก append เข้ามาทีหลัง)
+            rows = [(_to_us(dt), vals) for dt, vals in
+                    iter_rows(series, *_month_bounds(series, month))] + rows
+        merged = {}
+        for us, vals in sorted(rows, key=lambda r: r[0]):
+            merged.setdefault((us, tuple(vals)), (us, vals))
+        _write_month(series, month, list(merged.values()))
+        moved += len(by_month[month])
+        print(f"[INFO] {series} {month}: เก็บเข้าคลัง {len(by_month[month])} แถว")
+
+    if moved:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(keep)
+        os.replace(tmp, path)
+    return moved
+
+
+def last_ts(series):
+    """เวลาของแถวล่าสุดในคลัง (None ถ้าคลังว่าง)"""
+    months = list_months(series)
+    return _month_bounds(series, months[-1])[1] if months else None
+
+
+def _month_bounds(series, month):
+    meta = _read_meta(series, month)
+    return _from_us(meta["min_ts"]), _from_us(meta["max_ts"])
+
+
+def info():
+    for series in SERIES:
+        for month in list_months(series):
+            meta = _read_meta(series, month)
+            print(f"{series:<10} {month}  {meta['rows']:>7} แถว")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("compact", "info"):
+        print("usage: python archive.py compact [series ...] | info")
+        return 2
+    if argv[0] == "info":
+        info()
+        return 0
+    for series in argv[1:] or list(SERIES):
+        compact(series)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
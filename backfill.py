@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+เติมข้อมูลย้อนหลังที่ขาดหายใน log (เช่นรอบที่ workflow ไม่ได้รัน หรือเพิ่มสถานีใหม่)
+
+1) หาช่วงที่ขาด: ระยะห่างระหว่างแถวติดกันเกิน --max-gap (รวมช่วงต้น/ท้ายของ --since)
+2) แบ่งช่วงที่ขาดเป็นงานย่อยไม่เกิน --chunk แล้วดึงพร้อมกันด้วย worker pool ที่จำกัดจำนวน
+   (--workers) และจำกัดอัตรา request (--rate ต่อวินาที รวมทุก worker)
+3) รวมผลเข้า log ตามลำดับเวลา ไม่ซ้ำกับแถวเดิม (แถวเดิมมีก่อน) ผ่าน store.replace_range
+4) บันทึกความคืบหน้าลง backfill_state.json หลังทุกงาน ถ้าหยุดกลางคัน รันใหม่จะทำต่อจากเดิม
+
+แหล่งข้อมูลย้อนหลังกำหนดด้วย URL template ต่อแหล่ง (ยังไม่มี endpoint สาธารณะที่ยืนยันได้
+จึงไม่มีค่าเริ่มต้น) โดย {start} และ {end} ถูกแทนด้วยเวลา "YYYY-MM-DD HH:MM" (เวลาไทย):
+  BACKFILL_CHAOPRAYA_URL   เช่น https://example/api/history?station=C13&start={start}&end={end}
+  BACKFILL_INBURI_URL
+ผลลัพธ์เป็น JSON ที่มีรายการของ {"datetime": ..., "value": ...} (รองรับ data.graph_data
+แบบ thaiwater, data หรือ list ตรงๆ และ key ชื่ออื่นที่ใช้บ่อย ดู parse_history)
+
+ทดสอบ offline ได้ด้วย benchmarks/history_stub.py (ชุดทดสอบอัตโนมัติ: python benchmarks/test_backfill.py)
+
+ใช้งาน:
+  python backfill.py plan [--since 30d] [source ...]   # แสดงช่วงที่ขาด
+  python backfill.py run  [--since 30d] [--workers 4] [--rate 2] [--fresh] [source ...]
+  python backfill.py status
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import requests
+
+from http_client import get_session
+from storage import TIMEZONE_THAILAND, get_store, parse_ts
+
+# --- ค่าคงที่ ---
+STATE_FILE      = os.getenv("BACKFILL_STATE_PATH", "backfill_state.json")
+DEFAULT_SINCE   = "30d"
+DEFAULT_MAX_GAP = timedelta(hours=26)    # workflow รันวันละครั้ง: ขาดเกิน 26 ชม. ถือว่าหายไป 1 รอบ
+DEFAULT_CHUNK   = timedelta(days=7)
+DEFAULT_WORKERS = 4
+DEFAULT_RATE    = 2.0                    # request ต่อวินาที (รวมทุก worker)
+RESOLUTION      = timedelta(hours=1)     # เก็บไม่เกิน 1 แถวต่อช่วงนี้ ไม่ให้ log หนาแน่นกว่าปกติมาก
+DEDUP_WINDOW    = timedelta(minutes=30)  # แถวที่ดึงมาใกล้แถวเดิมเกินนี้ถือว่าซ้ำ
+MAX_ATTEMPTS    = 3
+REQUEST_TIMEOUT = 20
+TIME_FORMAT     = "%Y-%m-%d %H:%M"
+
+
+def _fmt_chaopraya(value, item):
+    return [f"{value:,.2f} cms"]
+
+
+def _fmt_inburi(value, item):
+    bank = item.get("bank_level")
+    below = round(bank - value, 2) if isinstance(bank, (int, float)) else "N/A"
+    return [value, bank if bank is not None else "N/A", "N/A", below, item["_dt"].strftime("%H:%M น.")]
+
+
+# แหล่ง -> series ใน storage, env ของ URL template และวิธีแปลงค่าเป็นคอลัมน์ของ series
+SOURCES = {
+    "chaopraya": {"series": "chaopraya", "url_env": "BACKFILL_CHAOPRAYA_URL", "format": _fmt_chaopraya},
+    "inburi":    {"series": "inburi",    "url_env": "BACKFILL_INBURI_URL",    "format": _fmt_inburi},
+}
+
+DATETIME_KEYS = ("datetime", "date_time", "waterlevel_datetime", "date", "ts", "time")
+VALUE_KEYS    = ("value", "waterlevel_msl", "storage", "water_level", "discharge")
+
+
+# ── หาช่วงที่ขาด ──
+def find_gaps(spans, start, end, max_gap=DEFAULT_MAX_GAP):
+    """
+    คืน [(gap_start, gap_end)] ของช่วงที่ไม่มีข้อมูลนานเกิน max_gap ภายใน [start, end]
+    spans คือ (first_seen, last_seen) จาก store.iter_runs: ภายใน run ถือว่ามีข้อมูลต่อเนื่อง
+    """
+    spans = sorted((max(first, start), min(last, end)) for first, last in spans
+                   if last >= start and first <= end)
+    gaps = []
+    prev = start
+    for first, last in spans + [(end, end)]:
+        if first - prev > max_gap:
+            gaps.append((prev, first))
+        prev = max(prev, last)
+    return gaps
+
+
+def split_range(start, end, chunk=DEFAULT_CHUNK):
+    while start < end:
+        stop = min(end, start + chunk)
+        yield start, stop
+        start = stop
+
+
+def plan(sources, since, until=None, max_gap=DEFAULT_MAX_GAP, chunk=DEFAULT_CHUNK):
+    """สร้างรายการงาน [{id, source, start, end}] จากช่วงที่ขาดของแต่ละแหล่ง"""
+    until = until or datetime.now(TIMEZONE_THAILAND)
+    store = get_store()
+    tasks = []
+    for source in sources:
+        series = SOURCES[source]["series"]
+        spans = [(first, last) for first, last, _, _ in store.iter_runs(series, since, until)]
+        for gap_start, gap_end in find_gaps(spans, since, until, max_gap):
+            for lo, hi in split_range(gap_start, gap_end, chunk):
+                tasks.append({"id": f"{source}:{lo.isoformat()}:{hi.isoformat()}", "source": source,
+                              "start": lo.isoformat(), "end": hi.isoformat()})
+    return tasks
+
+
+# ── checkpoint ──
+def load_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, STATE_FILE)
+
+
+# ── ดึงข้อมูล ──
+class RateLimiter:
+    """เว้นระยะระหว่าง request ขั้นต่ำ 1/rate วินาที (ใช้ร่วมกันทุก thread)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+    def pause(self, seconds):
+        """หยุดทุก worker ชั่วคราว (เช่นได้ 429 Retry-After)"""
+        with self.lock:
+            self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+def _find_list(payload):
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ("graph_data", "data", "list", "items", "results"):
+            if key in payload:
+                found = _find_list(payload[key])
+                if found is not None:
+                    return found
+    return None
+
+
+def parse_history(payload):
+    """แปลง JSON ของแหล่งข้อมูลย้อนหลังเป็น [(datetime, float, item)] เรียงตามเวลา"""
+    rows = []
+    for item in _find_list(payload) or []:
+        if not isinstance(item, dict):
+            continue
+        ts_text = next((item[k] for k in DATETIME_KEYS if item.get(k)), None)
+        raw = next((item[k] for k in VALUE_KEYS if item.get(k) not in (None, "")), None)
+        if ts_text is None or raw is None:
+            continue
+        try:
+            dt = parse_ts(str(ts_text).replace("/", "-"))
+            value = float(str(raw).replace(",", ""))
+        except ValueError:
+            continue
+        rows.append((dt, value, item))
+    rows.sort(key=lambda r: r[0])
+    return rows
+
+
+def fetch_range(source, start, end, limiter, session=None):
+    """ดึงข้อมูลช่วง [start, end] ของแหล่ง (ลองซ้ำเมื่อ network/5xx/429) คืน list จาก parse_history"""
+    template = os.getenv(SOURCES[source]["url_env"])
+    if not template:
+        raise RuntimeError(f"ไม่ได้ตั้ง {SOURCES[source]['url_env']}")
+    url = template.format(start=quote(start.strftime(TIME_FORMAT)), end=quote(end.strftime(TIME_FORMAT)))
+    session = session or get_session()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        limiter.wait()
+        try:
+            resp = session.get(url, timeout=REQUEST_TIMEOUT, headers={"Accept": "application/json"})
+        except requests.exceptions.RequestException:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(2 ** attempt)
+            continue
+        if resp.status_code == 429 or resp.status_code >= 500:
+            if attempt == MAX_ATTEMPTS:
+                resp.raise_for_status()
+            limiter.pause(float(resp.headers.get("Retry-After", 2 ** attempt)))
+            continue
+        resp.raise_for_status()
+        return parse_history(resp.json())
+    return []
+
+
+# ── รวมผล ──
+def thin(rows, resolution=RESOLUTION):
+    """เก็บแถวแรกของแต่ละช่วง resolution"""
+    kept, last_bucket = [], None
+    step = resolution.total_seconds()
+    for row in rows:
+        bucket = int(row[0].timestamp() // step) if step else row[0]
+        if bucket != last_bucket:
+            kept.append(row)
+            last_bucket = bucket
+    return kept
+
+
+def merge_rows(existing, fetched, dedup_window=DEDUP_WINDOW):
+    """
+    รวมแถวเดิม (dt, values) กับแถวที่ดึงมา (dt, values) เรียงตามเวลา
+    แถวที่ดึงมาซึ่งห่างจากแถวเดิมไม่เกิน dedup_window หรือเวลาซ้ำกันเองจะถูกตัดทิ้ง
+    คืน (แถวทั้งหมด, จำนวนแถวใหม่)
+    """
+    stamps = sorted(dt for dt, _ in existing)
+    merged = list(existing)
+    added, seen = 0, set()
+    for dt, values in fetched:
+        if dt in seen:
+            continue
+        i = bisect.bisect_left(stamps, dt)
+        near = [stamps[j] for j in (i - 1, i) if 0 <= j < len(stamps)]
+        if any(abs(dt - s) <= dedup_window for s in near):
+            continue
+        seen.add(dt)
+        merged.append((dt, values))
+        added += 1
+    merged.sort(key=lambda r: r[0])
+    return merged, added
+
+
+def apply_chunk(task, fetched):
+    """เขียนผลของงานหนึ่งลง store (เรียกจาก thread หลักเท่านั้น) คืนจำนวนแถวใหม่"""
+    source = task["source"]
+    series = SOURCES[source]["series"]
+    fmt = SOURCES[source]["format"]
+    start, end = parse_ts(task["start"]), parse_ts(task["end"])
+    rows = []
+    for dt, value, item in thin([r for r in fetched if start <= r[0] <= end]):
+        item = dict(item, _dt=dt.astimezone(TIMEZONE_THAILAND))
+        rows.append((dt.astimezone(TIMEZONE_THAILAND), fmt(value, item)))
+    if not rows:
+        return 0
+    store = get_store()
+    merged, added = merge_rows(store.range(series, start, end), rows)
+    if added:
+        # backend แบบ partition ล็อกเดือนที่ปิดแล้ว แต่ backfill ต้องเขียนย้อนหลังได้
+        with getattr(store, "writable_history", nullcontext)():
+            store.replace_range(series, start, end, merged)
+    return added
+
+
+def run(state, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    """ทำงานที่ยังไม่เสร็จใน state แบบขนาน บันทึก checkpoint หลังทุกงาน คืน (สำเร็จ, ล้มเหลว, แถวใหม่)"""
+    pending = [t for t in state["tasks"] if t["id"] not in state["done"]]
+    limiter = RateLimiter(rate)
+    ok = failed = added = 0
+    print(f"[INFO] backfill: {len(pending)} งานค้าง (เสร็จแล้ว {len(state['done'])}), "
+          f"{workers} workers, {rate:g} req/s")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+        futures = {
+            pool.submit(fetch_range, t["source"], parse_ts(t["start"]), parse_ts(t["end"]), limiter): t
+            for t in pending
+        }
+        try:
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    n = apply_chunk(task, future.result())
+                except Exception as e:
+                    failed += 1
+                    state["failed"][task["id"]] = str(e)[:200]
+                    print(f"[WARN] backfill {task['id']}: {e}")
+                else:
+                    ok += 1
+                    added += n
+                    state["done"].append(task["id"])
+                    state["failed"].pop(task["id"], None)
+                    print(f"[INFO] backfill {task['id']}: +{n} แถว")
+                save_state(state)
+        except KeyboardInterrupt:
+            print("[WARN] backfill ถูกหยุด ความคืบหน้าถูกบันทึกแล้ว รันใหม่เพื่อทำต่อ")
+            for future in futures:
+                future.cancel()
+            raise
+    return ok, failed, added
+
+
+def _parse_since(text):
+    units = {"h": 3600, "d": 86400}
+    return timedelta(seconds=float(text[:-1]) * units[text[-1]]) if text[-1] in units else timedelta(days=float(text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["plan", "run", "status"])
+    parser.add_argument("sources", nargs="*", help=f"แหล่งข้อมูล ({', '.join(SOURCES)})")
+    parser.add_argument("--since", default=DEFAULT_SINCE, help="ย้อนหลังกี่วัน เช่น 30d, 48h")
+    parser.add_argument("--max-gap", type=float, default=DEFAULT_MAX_GAP.total_seconds() / 3600,
+                        help="ช่วงที่ไม่มีข้อมูลนานเกินกี่ชั่วโมงถือว่าขาด")
+    parser.add_argument("--chunk", type=float, default=DEFAULT_CHUNK.days, help="ขนาดงานย่อย (วัน)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="request ต่อวินาที")
+    parser.add_argument("--fresh", action="store_true", help="ทิ้ง checkpoint เดิมแล้ววางแผนใหม่")
+    args = parser.parse_intermixed_args(argv)
+
+    if args.command == "status":
+        state = load_state()
+        if not state:
+            print("[INFO] ไม่มี backfill ที่ค้างอยู่")
+            return 0
+        print(f"[INFO] เริ่ม {state['created']}: เสร็จ {len(state['done'])}/{len(state['tasks'])} งาน, "
+              f"ล้มเหลว {len(state['failed'])}")
+        for task_id, error in state["failed"].items():
+            print(f"  {task_id}: {error}")
+        return 0
+
+    sources = args.sources or list(SOURCES)
+    unknown = [s for s in sources if s not in SOURCES]
+    if unknown:
+        print(f"[ERROR] ไม่รู้จักแหล่งข้อมูล: {', '.join(unknown)} (มี: {', '.join(SOURCES)})")
+        return 2
+
+    state = None if args.fresh else load_state()
+    if state and state["sources"] == sources and len(state["done"]) < len(state["tasks"]):
+        print(f"[INFO] ทำต่อจาก checkpoint {STATE_FILE}")
+    else:
+        now = datetime.now(TIMEZONE_THAILAND)
+        tasks = plan(sources, now - _parse_since(args.since), now,
+                     timedelta(hours=args.max_gap), timedelta(days=args.chunk))
+        state = {"created": now.isoformat(timespec="seconds"), "sources": sources,
+                 "tasks": tasks, "done": [], "failed": {}}
+
+    if args.command == "plan":
+        for task in state["tasks"]:
+            mark = "done" if task["id"] in state["done"] else "    "
+            print(f"  {mark} {task['source']:<10} {task['start']} → {task['end']}")
+        print(f"[INFO] {len(state['tasks'])} งาน")
+        return 0
+
+    if not state["tasks"]:
+        print("[INFO] ไม่พบช่วงที่ขาด")
+        return 0
+    save_state(state)
+    ok, failed, added = run(state, args.workers, args.rate)
+    print(f"[INFO] backfill เสร็จ {ok} งาน, ล้มเหลว {failed} งาน, เพิ่ม {added} แถว")
+    if not failed:
+        os.remove(STATE_FILE)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+benchmark ของฟังก์ชันฝั่งข้อมูล กับ log จำลองหลายขนาด (ทำงาน offline ทั้งหมด)
+
+วัดเวลา (min/median ของหลายรอบ) และ peak memory (tracemalloc, วัดแยกอีก 1 รอบ) ของ:
+  scraper.get_historical_data            (cold = รวมการสร้าง day index, warm = index พร้อมแล้ว)
+  summary_report.get_data_with_24hr_prior (baseline: idxmin บน DataFrame ทั้ง log)
+  summary_report.compute_deltas           (24h/7d/365d ของทุกแถวด้วย merge_asof)
+  summary_report.latest_with_prior        (แถวล่าสุด + แถวจริงเมื่อ 24 ชม. ก่อน ผ่าน rollup.window เมื่อ rollup พร้อมแล้ว)
+  summary_report.load_inburi              (cold = สร้าง rollup จาก log ทั้งหมด, cached = rollup พร้อมแล้ว)
+  weather_forecaster.parse_weather_data
+  inburi_bridge_alert.parse_stations      ([bs4] = tree ทั้งหน้า, [stream] = HTMLParser ที่หยุดเมื่อเจอครบ)
+  inburi_bridge_alert.get_water_data      (ผ่าน USE_LOCAL_HTML=page.html ทั้ง 2 parser)
+  scraper.extract_json_data
+  chart.render_summary                    (LTTB + figure template เดิม; เวลาและขนาด PNG ควรคงที่)
+
+และตรวจว่า rollup จาก backend csv กับ partitioned (encoding runs) ได้สถิติเท่ากันทุก bucket (exit 1 ถ้าต่าง)
+
+ผลลัพธ์เขียนเป็น JSON เพื่อเทียบระหว่าง commit ได้:
+  python benchmarks/bench_datapath.py --years 1,5,20 --output bench.json
+  python benchmarks/bench_datapath.py --years 1 --compare bench.json   # exit 1 ถ้าช้าลงเกิน --tolerance
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("STORAGE_BACKEND", "csv")
+
+import fixtures  # noqa: E402
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def measure(fn, repeats, setup=None):
+    """คืน (เวลาแต่ละรอบ, peak bytes) โดย setup() ถูกเรียกก่อนทุกรอบและไม่นับเวลา"""
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return times, peak
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def log_cases(workdir, years):
+    """กรณีที่ขึ้นกับขนาด log (สร้าง log จำลองไว้ใน workdir/<years>y ครั้งเดียว)"""
+    import pandas as pd
+    import scraper
+    import rollup
+    import summary_report
+    from dayindex import index_path
+
+    data_dir = os.path.join(workdir, f"{years}y")
+    if not os.path.exists(os.path.join(data_dir, "inburi_log.csv")):
+        print(f"[INFO] สร้าง log จำลอง {years} ปี ใน {data_dir} ...")
+        os.makedirs(data_dir, exist_ok=True)
+        fixtures.write_chaopraya_log(os.path.join(data_dir, "historical_log.csv"), years)
+        fixtures.write_inburi_log(os.path.join(data_dir, "inburi_log.csv"), years)
+    os.chdir(data_dir)
+    rows = _count_lines("historical_log.csv")
+    inburi_rows = _count_lines("inburi_log.csv")
+
+    target = datetime(2026, 8, 22, 9, 0, tzinfo=fixtures.THAI_TZ) - timedelta(days=365)
+
+    def drop_index():
+        if os.path.exists(index_path("chaopraya")):
+            os.remove(index_path("chaopraya"))
+
+    frame = pd.read_csv("inburi_log.csv",
+                        names=["ts", "water_level", "bank_level", "status", "below_bank", "time"])
+    frame["ts"] = pd.to_datetime(frame["ts"], format="ISO8601")
+
+    yield ("scraper.get_historical_data[cold]", rows,
+           lambda: scraper.get_historical_data(target), drop_index)
+    scraper.get_historical_data(target)
+    yield ("scraper.get_historical_data[warm]", rows,
+           lambda: scraper.get_historical_data(target), None)
+    yield ("summary_report.get_data_with_24hr_prior", len(frame),
+           lambda: summary_report.get_data_with_24hr_prior(frame, "ts", "water_level"), None)
+    yield ("summary_report.compute_deltas", len(frame),
+           lambda: summary_report.compute_deltas(frame, "ts", "water_level"), None)
+
+    def drop_cache():
+        shutil.rmtree(rollup.ROLLUP_DIR, ignore_errors=True)
+
+    yield ("summary_report.load_inburi[cold]", inburi_rows, summary_report.load_inburi, drop_cache)
+    summary_report.load_inburi()
+    yield ("summary_report.load_inburi[cached]", inburi_rows, summary_report.load_inburi, None)
+    yield ("summary_report.latest_with_prior", inburi_rows,
+           lambda: summary_report.latest_with_prior("inburi", ["ts", "water_level"], "water_level", {"water_level"}),
+           None)
+
+    import chart
+    png = os.path.join(data_dir, "chart.png")
+    yield ("chart.render_summary", rows,
+           lambda: chart.render_summary(png, target + timedelta(days=365)), None)
+
+
+def check_rollup(workdir, years):
+    """สร้าง rollup ของ log จำลองจาก backend csv และ partitioned (runs) แล้วเทียบทุก bucket คืนรายการที่ต่างกัน"""
+    import math
+    import rollup
+    from storage import CsvStore, PartitionedStore
+
+    os.chdir(os.path.join(workdir, f"{years}y"))
+    partitioned = PartitionedStore(root="rollup-check-data")
+    stores = {"csv": CsvStore(), "partitioned": partitioned}
+    close = lambda a, b: a == b or (a is not None and b is not None and math.isclose(a, b, rel_tol=1e-9))  # noqa: E731
+    # partitioned เก็บหน่วยแยกคอลัมน์ ข้อความอาจต่างจาก log เดิม ("1,025.00 cms" → "1025.00 cms") จึงเทียบเป็นตัวเลข
+    same_values = lambda a, b: all(rollup.to_float(x) == rollup.to_float(y) if rollup.to_float(x) is not None  # noqa: E731
+                                   else x == y for x, y in zip(a, b)) and len(a) == len(b)
+    diffs, saved = [], rollup.ROLLUP_DIR
+    try:
+        for series in rollup.ROLLUP_SERIES:
+            partitioned.partition_from_csv(series, force=True)
+            partitioned.encode_runs(series)
+            loaded = {}
+            for name, store in stores.items():
+                rollup.ROLLUP_DIR = os.path.join("rollup-check", name)
+                rollup.update(series, store, rebuild=True)
+                loaded[name] = {level: rollup.load(series, level) for level in ("hourly", "daily")}
+            for level in ("hourly", "daily"):
+                a, b = loaded["csv"][level], loaded["partitioned"][level]
+                if len(a) != len(b):
+                    diffs.append(f"{series} {level}: {len(a)} bucket (csv) != {len(b)} (partitioned)")
+                    continue
+                for x, y in zip(a, b):
+                    same = (x["start"] == y["start"] and x["count"] == y["count"]
+                            and all(abs((x[k][0] - y[k][0]).total_seconds()) < 1 and same_values(x[k][1], y[k][1])
+                                    for k in ("first", "last"))
+                            and all(close(x["columns"][c][f], y["columns"][c][f])
+                                    for c in x["columns"] for f in ("min", "max", "mean", "count", "na_pct")))
+                    if not same:
+                        diffs.append(f"{series} {level} {x['start']:%Y-%m-%d %H:00}: "
+                                     f"n {x['count']}/{y['count']} columns {x['columns']} != {y['columns']}")
+    finally:
+        rollup.ROLLUP_DIR = saved
+        shutil.rmtree("rollup-check", ignore_errors=True)
+        shutil.rmtree("rollup-check-data", ignore_errors=True)
+    return diffs
+
+
+def fixture_cases(workdir):
+    """กรณีที่ไม่ขึ้นกับขนาด log"""
+    import scraper
+    import weather_forecaster
+    import inburi_bridge_alert
+
+    data_dir = os.path.join(workdir, "fixtures")
+    os.makedirs(data_dir, exist_ok=True)
+    os.chdir(data_dir)
+    forecast = fixtures.owm_forecast()
+    page = fixtures.wl_page_html()
+    chaop = fixtures.chaopraya_page()
+
+    yield ("weather_forecaster.parse_weather_data", len(forecast["list"]),
+           lambda: weather_forecaster.parse_weather_data(forecast), None)
+    with open(os.path.join(data_dir, "page.html"), "w", encoding="utf-8") as f:
+        f.write(page)
+    inburi_bridge_alert.USE_LOCAL_HTML = True
+    inburi_bridge_alert.LOCAL_HTML = os.path.join(data_dir, "page.html")
+    for mode in ("bs4", "stream"):
+        def use(mode=mode):
+            inburi_bridge_alert.HTML_PARSER = mode
+        use()
+        yield (f"inburi_bridge_alert.parse_stations[{mode}]", len(page),
+               lambda: inburi_bridge_alert.parse_stations(page, [inburi_bridge_alert.STATION_NAME]), use)
+        yield (f"inburi_bridge_alert.parse_stations[{mode},all]", len(page),
+               lambda: inburi_bridge_alert.parse_stations(page, fixtures.STATIONS), use)
+        yield (f"inburi_bridge_alert.get_water_data[{mode}]", len(page),
+               inburi_bridge_alert.get_water_data, use)
+    yield ("scraper.extract_json_data", len(chaop),
+           lambda: scraper.extract_json_data(chaop), None)
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="water-bench-")
+    results, rollup_diffs = [], []
+
+    def record(name, years, size, fn, setup, repeats):
+        # ปิด print ของสคริปต์ระหว่างวัดเวลา
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                times, peak = measure(fn, repeats, setup)
+            finally:
+                sys.stdout = stdout
+        entry = {"name": name, "years": years, "size": size, "repeats": repeats,
+                 "min_s": min(times), "median_s": statistics.median(times), "peak_kb": peak // 1024}
+        results.append(entry)
+        print(f"{name:<48} {str(years or '-'):>4} {size:>9} "
+              f"{entry['median_s'] * 1000:10.2f} ms {entry['peak_kb']:>9} KiB")
+
+    print(f"{'function':<48} {'yrs':>4} {'size':>9} {'median':>13} {'peak':>13}")
+    for name, size, fn, setup in fixture_cases(workdir):
+        record(name, None, size, fn, setup, args.repeats)
+    for years in args.years:
+        for name, size, fn, setup in log_cases(workdir, years):
+            # log ใหญ่ลดจำนวนรอบลง เพื่อให้ทั้งชุดจบในเวลาที่รับได้
+            record(name, years, size, fn, setup, max(1, args.repeats // max(1, int(years))))
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                diffs = check_rollup(workdir, years)
+            finally:
+                sys.stdout = stdout
+        for diff in diffs[:5]:
+            print(f"[ERROR] rollup ต่างกันระหว่าง backend: {diff}")
+        print(f"[INFO] rollup csv/partitioned {years} ปี: " + (f"ต่างกัน {len(diffs)} bucket" if diffs else "ตรงกัน"))
+        rollup_diffs.extend(diffs)
+    os.chdir(REPO_ROOT)
+
+    return {
+        "meta": {"commit": _git_commit(), "python": platform.python_version(),
+                 "machine": platform.machine(), "created": datetime.now().isoformat(timespec="seconds")},
+        "results": results,
+        "rollup_mismatches": len(rollup_diffs),
+    }
+
+
+def compare(current, baseline_path, tolerance):
+    """เทียบกับผลเดิม คืน True ถ้ามีรายการที่ช้าลงเกิน tolerance"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["years"]): r for r in json.load(f)["results"]}
+    regressed = False
+    print(f"\nเทียบกับ {baseline_path} (tolerance {tolerance:.0%})")
+    for r in current["results"]:
+        base = baseline.get((r["name"], r["years"]))
+        if not base or not base["median_s"]:
+            continue
+        ratio = r["median_s"] / base["median_s"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        regressed |= bool(flag)
+        print(f"  {r['name']:<48} {str(r['years'] or '-'):>4} x{ratio:6.2f} {flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", default="1,5,20", help="ขนาด log จำลอง (ปี) คั่นด้วย ,")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workdir", help="โฟลเดอร์เก็บ log จำลอง (reuse ได้ระหว่างรอบ)")
+    parser.add_argument("--output", help="เขียนผลลัพธ์ JSON ลงไฟล์นี้")
+    parser.add_argument("--compare", help="ไฟล์ผลลัพธ์ JSON เดิมที่จะเทียบ")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    args.years = [float(y) if "." in y else int(y) for y in args.years.split(",") if y.strip()]
+
+    current = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+    if args.compare and compare(current, args.compare, args.tolerance):
+        return 1
+    if current["rollup_mismatches"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+load test ของ pipeline เต็มรอบ (collect → log → summarize → notify) กับ replay_stub แบบ offline
+
+แต่ละรอบ (cycle) ทำเหมือน collector + summary_report จริง และจับเวลาแยกตาม stage:
+  collect    collector.fetch_all()     ดึง tiwrm / thaiwater / OpenWeatherMap พร้อมกัน
+  log        collector.process_all()   ประมวลผล แจ้งเตือน (เข้า outbox) และบันทึก log
+  summarize  summary_report.load_* + build_message (+ chart.render_summary เมื่อใส่ --chart)
+  notify     summary_report.send_summary + รอ LINE flush ที่ค้างใน background
+
+สคริปต์ทั้งหมดทำงานในโฟลเดอร์ชั่วคราว (--workdir) โดยชี้ URL ทุกตัวมาที่ stub ผ่านตัวแปรแวดล้อม
+ผลลัพธ์: throughput (รอบ/วินาที) และ p50/p95/p99 ของแต่ละ stage เป็นตาราง และ JSON (--output)
+
+ใช้งาน:
+  python benchmarks/bench_pipeline.py --cycles 500
+  python benchmarks/bench_pipeline.py --cycles 200 --latency 50 --jitter 30 --error-rate 0.02 \\
+      --endpoint tiwrm=300,150,0.05 --change-every 10 --output pipeline.json
+  python benchmarks/bench_pipeline.py --target http://127.0.0.1:8097   # ใช้ replay_stub ที่รันแยกไว้
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("STORAGE_BACKEND", "csv")
+
+import fixtures      # noqa: E402
+import replay_stub   # noqa: E402
+from bench_datapath import _git_commit  # noqa: E402
+
+STAGES = ("collect", "log", "summarize", "notify")
+
+
+def percentile(values, q):
+    """percentile แบบ nearest-rank (q เป็น 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize_times(times):
+    return {"n": len(times), "mean_s": sum(times) / len(times) if times else None,
+            "p50_s": percentile(times, 50), "p95_s": percentile(times, 95),
+            "p99_s": percentile(times, 99), "max_s": max(times) if times else None}
+
+
+def setup_env(base_url, workdir, years):
+    """ชี้ทุกสคริปต์มาที่ stub และย้ายไปทำงานใน workdir (ต้องทำก่อน import สคริปต์)"""
+    os.environ.update(replay_stub.env_for(base_url))
+    os.environ.setdefault("OPENWEATHER_API_KEY", "replay")
+    os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "replay")
+    os.environ.setdefault("LINE_TARGET_ID", "Ureplay")
+    # ให้ทุกรอบดึงพยากรณ์จริงจาก stub และไม่หน่วงระหว่าง LINE request
+    os.environ.setdefault("WEATHER_CACHE_TTL", "0")
+    os.environ.setdefault("LINE_MIN_INTERVAL", "0")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if years and not os.path.exists("inburi_log.csv"):
+        print(f"[INFO] สร้าง log จำลอง {years} ปี ใน {workdir} ...")
+        fixtures.write_chaopraya_log("historical_log.csv", years)
+        fixtures.write_inburi_log("inburi_log.csv", years)
+
+
+def run(args, base_url, stats):
+    setup_env(base_url, args.workdir, args.years)
+
+    import collector
+    import summary_report
+    import line_delivery
+    import inburi_bridge_alert
+    from http_client import get_session, close_session
+
+    def fetch_page(url, timeout=15):
+        # หน้า /wl จาก stub แทน Selenium เมื่อ API ล้มเหลว (stub ส่ง HTML ที่ render แล้ว)
+        resp = get_session().get(url, timeout=timeout)
+        resp.raise_for_status()
+        return resp.text
+
+    inburi_bridge_alert.fetch_rendered_html = fetch_page
+
+    def cycle():
+        timings, failed = {}, []
+        started = time.perf_counter()
+        results = asyncio.run(collector.fetch_all())
+        timings["collect"] = time.perf_counter() - started
+        failed.extend(name for name, result in results.items() if result is None)
+        failed.extend(f"{name}(stale)" for name, result in results.items() if collector.is_stale(result))
+
+        started = time.perf_counter()
+        collector.process_all(results)
+        timings["log"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        latest_chaop, chaop_prior = summary_report.load_chaopraya()
+        latest_inb, inb_prior = summary_report.load_inburi()
+        next_evt = summary_report.load_next_weather_event()
+        chaop_trends = summary_report.load_trends('chaopraya', summary_report.CHAOP_LOG, ['ts', 'storage'], 'storage')
+        inb_trends = summary_report.load_trends('inburi', summary_report.INBURI_LOG, ['ts', 'water_level'], 'water_level')
+        text = summary_report.build_message(latest_chaop, chaop_prior, latest_inb, inb_prior, next_evt,
+                                            chaop_trends, inb_trends)
+        if args.chart:
+            import chart
+            chart.render_summary()
+        timings["summarize"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        summary_report.send_summary(text)
+        line_delivery.join_pending()
+        timings["notify"] = time.perf_counter() - started
+        return timings, failed
+
+    samples = {stage: [] for stage in STAGES + ("cycle",)}
+    fetch_failures = {}
+    with open(os.devnull, "w") as devnull:
+        # warm up (import, session, log/rollup แรก) ไม่นับ
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for _ in range(args.warmup):
+                cycle()
+            stats.clear()
+            wall = time.perf_counter()
+            for i in range(args.cycles):
+                timings, failed = cycle()
+                for stage, elapsed in timings.items():
+                    samples[stage].append(elapsed)
+                samples["cycle"].append(sum(timings.values()))
+                for name in failed:
+                    fetch_failures[name] = fetch_failures.get(name, 0) + 1
+                if args.progress and (i + 1) % args.progress == 0:
+                    print(f"[INFO] {i + 1}/{args.cycles} รอบ", file=sys.stderr)
+            wall = time.perf_counter() - wall
+        finally:
+            sys.stdout = stdout
+            close_session()
+
+    return {
+        "meta": {"commit": _git_commit(), "python": platform.python_version(),
+                 "machine": platform.machine(), "created": datetime.now().isoformat(timespec="seconds"),
+                 "cycles": args.cycles, "workdir": args.workdir, "target": base_url,
+                 "profiles": args.profiles, "change_every": args.change_every},
+        "throughput_per_s": args.cycles / wall if wall else None,
+        "wall_s": wall,
+        "stages": {stage: summarize_times(times) for stage, times in samples.items()},
+        "fetch_failures": fetch_failures,
+        "outbox_pending": len(line_delivery.load_outbox()),
+        "endpoints": {name: dict(entry) for name, entry in stats.items()},
+    }
+
+
+def report(result):
+    ms = lambda v: f"{v * 1000:10.2f}" if v is not None else f"{'-':>10}"  # noqa: E731
+    print(f"{'stage':<10} {'n':>6} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<10} {s['n']:>6} {ms(s['mean_s'])} {ms(s['p50_s'])} {ms(s['p95_s'])} "
+              f"{ms(s['p99_s'])} {ms(s['max_s'])}")
+    print(f"\nthroughput: {result['throughput_per_s']:.2f} รอบ/วินาที "
+          f"({result['meta']['cycles']} รอบใน {result['wall_s']:.2f}s)")
+    for name, entry in sorted(result["endpoints"].items()):
+        print(f"  {name:<10} {entry['requests']:>6} request  {entry['errors']:>4} error  "
+              f"{entry['not_modified']:>4} 304")
+    if result["fetch_failures"]:
+        print("  ดึงไม่สำเร็จ: " + ", ".join(f"{k}={v}" for k, v in sorted(result["fetch_failures"].items())))
+    print(f"  LINE outbox ค้าง: {result['outbox_pending']} ข้อความ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=3, help="จำนวนรอบแรกที่ไม่นับ")
+    parser.add_argument("--years", type=float, default=0, help="สร้าง log ย้อนหลังจำลองก่อนเริ่ม (ปี)")
+    parser.add_argument("--chart", action="store_true", help="รวม chart.render_summary ใน stage summarize")
+    parser.add_argument("--workdir", help="โฟลเดอร์ทำงาน (ไม่ใส่ = โฟลเดอร์ชั่วคราวใหม่)")
+    parser.add_argument("--target", help="URL ของ replay_stub ที่รันแยกไว้ (ไม่ใส่ = เริ่ม stub ใน process นี้)")
+    parser.add_argument("--progress", type=int, default=0, help="พิมพ์ความคืบหน้าทุก N รอบ (stderr)")
+    parser.add_argument("--output", help="เขียนผลลัพธ์ JSON ลงไฟล์นี้")
+    replay_stub.add_profile_args(parser)
+    args = parser.parse_args(argv)
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="water-pipeline-"))
+    args.output = os.path.abspath(args.output) if args.output else None
+    profiles = replay_stub.profiles_from_args(args)
+    args.profiles = profiles
+
+    stats, server = {}, None
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        recordings = os.path.abspath(args.recordings) if args.recordings else None
+        server, base_url = replay_stub.serve(recordings=recordings, profiles=profiles,
+                                             change_every=args.change_every, stats=stats)
+    try:
+        result = run(args, base_url, stats)
+    finally:
+        if server:
+            server.shutdown()
+    os.chdir(REPO_ROOT)
+
+    report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+ข้อมูลจำลองสำหรับ benchmark (ทำงาน offline ทั้งหมด และได้ผลเหมือนเดิมทุกครั้ง)
+
+- synthetic log หลายปี ความถี่ 10 นาที ในรูปแบบเดียวกับ historical_log.csv / inburi_log.csv
+- หน้า /wl ของ thaiwater (ตารางสถานี) สำหรับ parser ของ inburi_bridge_alert
+- JSON feed waterlevel_load ของ thaiwater (ที่หน้า /wl ใช้) สำหรับ fetch_api_data
+- หน้า chaopraya.php ที่มี var json_data สำหรับ scraper
+- ผลพยากรณ์ 5 วัน / 3 ชั่วโมง ของ OpenWeatherMap
+
+ใช้งาน:
+  python benchmarks/fixtures.py <dir> [years]   # เขียน fixture ทั้งหมดลง dir
+"""
+import os
+import sys
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+THAI_TZ = timezone(timedelta(hours=7))
+STEP = timedelta(minutes=10)
+SEED = 20250719
+
+STATUSES = ["น้ำน้อยวิกฤต", "น้ำน้อย", "น้ำปกติ", "น้ำมาก", "ล้นตลิ่ง"]
+STATIONS = [
+    "ชัยนาท", "สรรพยา", "ท่าช้าง", "อินทร์บุรี", "พรหมบุรี", "บางระจัน", "ค่ายบางระจัน",
+    "สิงห์บุรี", "ท่าวุ้ง", "อ่างทอง", "ป่าโมก", "ไชโย", "โพธิ์ทอง", "วิเศษชัยชาญ",
+]
+
+
+def _timestamps(years, end=None):
+    end = end or datetime(2026, 8, 22, 9, 0, tzinfo=THAI_TZ)
+    n = int(years * 365 * 24 * 6)
+    start = end - STEP * (n - 1)
+    for i in range(n):
+        yield start + STEP * i
+
+
+def write_chaopraya_log(path, years):
+    """historical_log.csv: ts,<storage> cms (มี , คั่นหลักพันเหมือนข้อมูลจริง)"""
+    rng = random.Random(SEED)
+    value, n = 600.0, 0
+    with open(path, "w", encoding="utf-8") as f:
+        for ts in _timestamps(years):
+            # ค่าจริงเปลี่ยนเป็นขั้นๆ ไม่บ่อย จึงจำลองแบบค้างค่าเดิมเป็นส่วนใหญ่
+            if rng.random() < 0.01:
+                value = max(50.0, value + rng.choice([-50, -25, 25, 50, 100]))
+            f.write(f"{ts.isoformat()},{value:,.2f} cms\n")
+            n += 1
+    return n
+
+
+def write_inburi_log(path, years):
+    """inburi_log.csv: มีแถว legacy 2 คอลัมน์ปนกับแถว 6 คอลัมน์ และแถว N/A"""
+    rng = random.Random(SEED + 1)
+    level, bank, n = 7.0, 15.1, 0
+    with open(path, "w", encoding="utf-8") as f:
+        for i, ts in enumerate(_timestamps(years)):
+            level = min(16.0, max(2.0, level + rng.gauss(0, 0.02)))
+            if i < 100:
+                f.write(f"{ts.isoformat()},{level:.2f}\n")
+            elif rng.random() < 0.01:
+                f.write(f"{ts.isoformat()},N/A,N/A,N/A,N/A,N/A\n")
+            else:
+                pct = (level - 2.0) / (bank - 2.0) * 100
+                status = STATUSES[min(4, int(pct // 25))]
+                f.write(f"{ts.isoformat()},{level:.2f},{bank},{status},{bank - level:.2f},{ts.strftime('%H:%M')} น.\n")
+            n += 1
+    return n
+
+
+def wl_page_html(stations=STATIONS, padding_kb=150):
+    """หน้า /wl ที่ render แล้ว: ตารางสถานี + เนื้อหาอื่นๆ ขนาดใกล้เคียงหน้าจริง"""
+    rng = random.Random(SEED + 2)
+    rows = []
+    for name in stations:
+        level = rng.uniform(3, 14)
+        bank = round(level + rng.uniform(0.5, 9), 2)
+        rows.append(
+            "<tr>"
+            f"<th scope=\"row\"><a href=\"#\">{name}</a></th>"
+            f"<td>ต.{name} อ.{name} จ.สิงห์บุรี</td>"
+            f"<td>{level:.2f}</td><td>{bank}</td><td>{rng.randint(10, 99)}%</td>"
+            f"<td><span class=\"badge\">{rng.choice(STATUSES)}</span></td>"
+            f"<td>{rng.randint(0, 1)}.{rng.randint(0, 99):02d}</td>"
+            f"<td>{rng.randint(0, 23):02d}:{rng.choice(['00', '10', '20', '30', '40', '50'])} น.</td>"
+            "</tr>"
+        )
+    filler = "".join(
+        f"<div class=\"card\"><p>ข่าวสารและประกาศ {i}</p><script>var x{i} = {i};</script></div>"
+        for i in range(padding_kb * 1024 // 80)
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>ระดับน้ำ</title></head><body>"
+        "<nav>เมนู</nav><table class=\"table\"><thead><tr><th>สถานี</th></tr></thead><tbody>"
+        + "".join(rows)
+        + "</tbody></table>"
+        + filler
+        + "</body></html>"
+    )
+
+
+def thaiwater_waterlevel(stations=STATIONS):
+    """ผลจาก api-v3 waterlevel_load: {"waterlevel_data": {"data": [...]}} ต่อสถานี"""
+    rng = random.Random(SEED + 5)
+    rows = []
+    for name in stations:
+        level = rng.uniform(3, 14)
+        rows.append({
+            "station": {"tele_station_name": {"th": name},
+                        "left_bank": round(level + rng.uniform(0.5, 9), 2),
+                        "right_bank": round(level + rng.uniform(0.5, 9), 2)},
+            "waterlevel_msl": f"{level:.2f}",
+            "waterlevel_datetime": "2026-08-22 09:00",
+            "storage_percent": round(rng.uniform(10, 99), 2),
+        })
+    return {"waterlevel_data": {"data": rows}}
+
+
+def chaopraya_page(n_stations=40):
+    """หน้า chaopraya.php ที่มี var json_data ฝังใน <script>"""
+    rng = random.Random(SEED + 3)
+    itc = {"C13": {"storage": "1,000.00", "water_level": "16.20", "date": "2025-07-19 10:00"}}
+    for i in range(n_stations):
+        itc[f"C{i + 14}"] = {"storage": f"{rng.uniform(10, 2000):,.2f}",
+                             "water_level": f"{rng.uniform(1, 20):.2f}",
+                             "date": "2025-07-19 10:00"}
+    data = [{"itc_water": itc, "chart": [[rng.random() for _ in range(24)] for _ in range(30)]}]
+    return (
+        "<html><head><script src=\"highcharts.js\"></script></head><body><div id=\"chart\"></div><script>"
+        f"var json_data = {json.dumps(data, ensure_ascii=False)};\n"
+        "var options = {chart: {renderTo: 'chart'}};\n"
+        "</script>" + "<p>footer</p>" * 2000 + "</body></html>"
+    )
+
+
+def owm_forecast(start=None):
+    """ผลจาก /data/2.5/forecast: 40 ช่วง ช่วงละ 3 ชั่วโมง"""
+    rng = random.Random(SEED + 4)
+    start = start or datetime(2026, 8, 22, 0, 0, tzinfo=timezone.utc)
+    items = []
+    for i in range(40):
+        dt = start + timedelta(hours=3 * i)
+        main = rng.choice(["Rain", "Clouds", "Clear", "Thunderstorm", "Drizzle"])
+        item = {
+            "dt": int(dt.timestamp()),
+            "dt_txt": dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp_max": round(rng.uniform(26, 38), 2)},
+            "weather": [{"main": main, "description": main.lower()}],
+            "clouds": {"all": rng.randint(0, 100)},
+        }
+        if main in ("Rain", "Thunderstorm", "Drizzle"):
+            item["rain"] = {"3h": round(rng.uniform(0.1, 12), 2)}
+        items.append(item)
+    return {"cod": "200", "cnt": len(items), "list": items,
+            "city": {"name": "Sing Buri", "coord": {"lat": 14.8966, "lon": 100.3892}}}
+
+
+def write_all(directory, years=1):
+    os.makedirs(directory, exist_ok=True)
+    write_chaopraya_log(os.path.join(directory, "historical_log.csv"), years)
+    write_inburi_log(os.path.join(directory, "inburi_log.csv"), years)
+    with open(os.path.join(directory, "page.html"), "w", encoding="utf-8") as f:
+        f.write(wl_page_html())
+    with open(os.path.join(directory, "chaopraya.html"), "w", encoding="utf-8") as f:
+        f.write(chaopraya_page())
+    with open(os.path.join(directory, "owm_forecast.json"), "w", encoding="utf-8") as f:
+        json.dump(owm_forecast(), f, ensure_ascii=False)
+    with open(os.path.join(directory, "waterlevel.json"), "w", encoding="utf-8") as f:
+        json.dump(thaiwater_waterlevel(), f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python benchmarks/fixtures.py <dir> [years]")
+        sys.exit(2)
+    write_all(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 1)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+แหล่งข้อมูลย้อนหลังจำลองสำหรับทดสอบ backfill.py แบบ offline
+
+GET /history/<source>?start=YYYY-MM-DD HH:MM&end=... ตอบ {"data": {"graph_data": [...]}}
+ทุก --step นาที ค่าเป็นฟังก์ชันของเวลา (ผลเหมือนเดิมทุกครั้ง จึงตรวจการรวมข้อมูลซ้ำได้)
+จำลองความผิดพลาดได้ด้วย --fail-rate (ตอบ 500) และ --rate-limit-every N (ตอบ 429 ทุก N request)
+
+ใช้งาน:
+  python benchmarks/history_stub.py --port 8098 &
+  BACKFILL_CHAOPRAYA_URL='http://127.0.0.1:8098/history/chaopraya?start={start}&end={end}' \\
+  BACKFILL_INBURI_URL='http://127.0.0.1:8098/history/inburi?start={start}&end={end}' \\
+      python backfill.py run --since 60d
+"""
+import sys
+import json
+import math
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def value_at(source, dt):
+    """ค่าสังเคราะห์ ณ เวลา dt (คลื่นรายวัน + รายปี)"""
+    hours = dt.timestamp() / 3600
+    daily = math.sin(hours / 24 * 2 * math.pi)
+    yearly = math.sin(hours / (24 * 365) * 2 * math.pi)
+    if source == "chaopraya":
+        return round(1000 + 600 * yearly + 50 * daily, 2)
+    return round(8.5 + 2.0 * yearly + 0.1 * daily, 2)
+
+
+def history(source, start, end, step):
+    dt = start.replace(minute=(start.minute // step) * step, second=0, microsecond=0)
+    if dt < start:
+        dt += timedelta(minutes=step)
+    items = []
+    while dt <= end:
+        item = {"datetime": dt.strftime("%Y-%m-%d %H:%M:%S"), "value": value_at(source, dt)}
+        if source == "inburi":
+            item["bank_level"] = 13.8
+        items.append(item)
+        dt += timedelta(minutes=step)
+    return items
+
+
+def make_handler(step=60, fail_rate=0.0, rate_limit_every=0, requests_log=None):
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive
+
+        def _reply(self, code, body=b"{}", headers=None):
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "history" or parts[1] not in ("chaopraya", "inburi"):
+                return self._reply(404, b'{"message":"Not found"}')
+            query = parse_qs(url.query)
+            try:
+                start = datetime.strptime(query["start"][0], TIME_FORMAT)
+                end = datetime.strptime(query["end"][0], TIME_FORMAT)
+            except (KeyError, ValueError):
+                return self._reply(400, b'{"message":"start/end required"}')
+            with lock:
+                counter["n"] += 1
+                n = counter["n"]
+            if rate_limit_every and n % rate_limit_every == 0:
+                return self._reply(429, b'{"message":"Too many requests"}', {"Retry-After": "1"})
+            if random.random() < fail_rate:
+                return self._reply(500, b'{"message":"Internal error"}')
+            if requests_log is not None:
+                requests_log.append((parts[1], start, end))
+            items = history(parts[1], start, end, step)
+            print(f"[STUB] {parts[1]} {start} → {end}: {len(items)} จุด")
+            return self._reply(200, json.dumps({"data": {"graph_data": items}}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, **kwargs):
+    """เริ่ม stub ใน background thread คืน (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(**kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--step", type=int, default=60, help="ระยะห่างระหว่างจุด (นาที)")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args(argv)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.step, args.fail_rate, args.rate_limit_every))
+    print(f"[STUB] แหล่งข้อมูลย้อนหลังจำลองที่ http://127.0.0.1:{args.port}/history/<source>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+LINE Messaging API จำลองสำหรับทดสอบ line_delivery แบบ offline
+
+รับ POST /v2/bot/message/push และ /v2/bot/message/multicast แล้วพิมพ์สิ่งที่ได้รับ
+จำลองความผิดพลาดได้ด้วย --fail-rate (ตอบ 500) และ --rate-limit-every N (ตอบ 429 ทุก N request)
+
+ใช้งาน:
+  python benchmarks/line_stub.py --port 8099 &
+  LINE_API_BASE=http://127.0.0.1:8099 LINE_CHANNEL_ACCESS_TOKEN=x LINE_TARGET_ID=U1,U2,Cgroup \\
+      python line_delivery.py flush
+"""
+import sys
+import json
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATHS = ("/v2/bot/message/push", "/v2/bot/message/multicast")
+
+
+def make_handler(fail_rate=0.0, rate_limit_every=0, received=None):
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive
+
+        def _reply(self, code, body=b"{}", headers=None):
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path not in PATHS:
+                return self._reply(404, b'{"message":"Not found"}')
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._reply(401, b'{"message":"Authentication failed"}')
+            if len(payload.get("messages", [])) > 5:
+                return self._reply(400, b'{"message":"Size must be between 1 and 5"}')
+            with lock:
+                counter["n"] += 1
+                n = counter["n"]
+            if rate_limit_every and n % rate_limit_every == 0:
+                return self._reply(429, b'{"message":"Too many requests"}', {"Retry-After": "1"})
+            if random.random() < fail_rate:
+                return self._reply(500, b'{"message":"Internal error"}')
+            if received is not None:
+                received.append((self.path, payload))
+            print(f"[STUB] {self.path} to={payload.get('to')} messages={len(payload.get('messages', []))}")
+            return self._reply(200)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, **kwargs):
+    """เริ่ม stub ใน background thread คืน (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(**kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args(argv)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.fail_rate, args.rate_limit_every))
+    print(f"[STUB] LINE API จำลองที่ http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+HTTP stand-in ของทั้ง 4 endpoint ที่ pipeline ใช้ สำหรับทดสอบแบบ offline
+
+ตอบด้วย response ที่บันทึกไว้ (โฟลเดอร์ --recordings) หรือ fixture ถ้าไม่มีไฟล์ที่บันทึกไว้:
+  GET  /tiwrm/...          chaopraya.html     (scraper, CHAOPRAYA_URL) รองรับ ETag/If-None-Match
+  GET  /thaiwater/wl       page.html          (หน้า /wl สำหรับ fallback, WL_PAGE_URL)
+  GET  /thaiwater/...      waterlevel.json    (inburi_bridge_alert, WL_API_URL)
+  GET  /owm/...            owm_forecast.json  (weather_forecaster, OPENWEATHER_URL)
+  POST /line/v2/bot/message/push|multicast    (line_delivery, LINE_API_BASE)
+
+แต่ละ endpoint ตั้ง latency / jitter (ms, สุ่มแบบ uniform ±jitter) อัตราการตอบ 503 และสัดส่วน
+request ที่ช้าผิดปกติ (SLOW_FACTOR เท่าของ latency, จำลอง tail latency) แยกกันได้
+--change-every N ทำให้ค่า C13 และระดับน้ำเปลี่ยนทุก N request เพื่อให้ pipeline ผ่าน path
+"ค่าเปลี่ยน" (parse/แจ้งเตือน) ด้วย ไม่ใช่แค่ 304/ค่าเดิม
+
+ใช้งาน:
+  python benchmarks/replay_stub.py --record recordings/      # บันทึก response จริงครั้งเดียว (ต้องต่อเน็ต)
+  python benchmarks/replay_stub.py --recordings recordings/ --latency 80 --jitter 40 \\
+      --endpoint tiwrm=400,200,0.05,0.02 --endpoint line=50,10,0.01 --port 8097 &
+  CHAOPRAYA_URL=http://127.0.0.1:8097/tiwrm/chaopraya.php \\
+  WL_API_URL=http://127.0.0.1:8097/thaiwater/waterlevel_load \\
+  WL_PAGE_URL=http://127.0.0.1:8097/thaiwater/wl \\
+  OPENWEATHER_URL=http://127.0.0.1:8097/owm/forecast OPENWEATHER_API_KEY=x \\
+  LINE_API_BASE=http://127.0.0.1:8097/line LINE_CHANNEL_ACCESS_TOKEN=x LINE_TARGET_ID=U1 \\
+      python collector.py
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+
+# endpoint -> path prefix
+ENDPOINTS = {"tiwrm": "/tiwrm/", "thaiwater": "/thaiwater/", "owm": "/owm/", "line": "/line/"}
+LINE_PATHS = ("/v2/bot/message/push", "/v2/bot/message/multicast")
+JSON_DATA_MARKER = "var json_data = "
+SLOW_FACTOR = 20
+
+# ไฟล์ที่บันทึกไว้ -> (content type, fixture ที่ใช้แทนเมื่อไม่มีไฟล์)
+RECORDINGS = {
+    "chaopraya.html":    ("text/html; charset=utf-8", fixtures.chaopraya_page),
+    "page.html":         ("text/html; charset=utf-8", fixtures.wl_page_html),
+    "waterlevel.json":   ("application/json", lambda: json.dumps(fixtures.thaiwater_waterlevel(), ensure_ascii=False)),
+    "owm_forecast.json": ("application/json", lambda: json.dumps(fixtures.owm_forecast(), ensure_ascii=False)),
+}
+
+
+def load_recordings(directory=None):
+    """{ชื่อไฟล์: (content type, bytes)} จาก directory ถ้ามี ไม่เช่นนั้นใช้ fixture"""
+    bodies = {}
+    for name, (ctype, fallback) in RECORDINGS.items():
+        path = os.path.join(directory, name) if directory else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                bodies[name] = (ctype, f.read())
+        else:
+            bodies[name] = (ctype, fallback().encode("utf-8"))
+    return bodies
+
+
+def parse_profile(spec):
+    """'latency,jitter,error_rate,slow_rate' (ms, ms, 0-1, 0-1; เว้นท้ายได้) -> dict"""
+    parts = spec.split(",")
+    values = [float(p) if p.strip() else 0.0 for p in parts] + [0.0] * (4 - len(parts))
+    return {"latency": values[0], "jitter": values[1], "error_rate": values[2], "slow_rate": values[3]}
+
+
+def _shift_chaopraya(body, step):
+    """เลื่อน storage ของ C13 ใน var json_data ไป step * 25 cms"""
+    text = body.decode("utf-8")
+    start = text.find(JSON_DATA_MARKER)
+    if start < 0:
+        return body
+    start += len(JSON_DATA_MARKER)
+    data, end = json.JSONDecoder().raw_decode(text, start)
+    c13 = data[0]["itc_water"]["C13"]
+    value = float(str(c13["storage"]).replace(",", "")) + 25 * step
+    c13["storage"] = f"{value:,.2f}"
+    return (text[:start] + json.dumps(data, ensure_ascii=False) + text[end:]).encode("utf-8")
+
+
+def _shift_waterlevel(body, step):
+    """เลื่อน waterlevel_msl ของทุกสถานีไป step * 1 ซม."""
+    payload = json.loads(body)
+    for row in payload.get("waterlevel_data", {}).get("data", []):
+        try:
+            row["waterlevel_msl"] = f"{float(row['waterlevel_msl']) + 0.01 * step:.2f}"
+        except (KeyError, TypeError, ValueError):
+            pass
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+VARIANTS = {"chaopraya.html": _shift_chaopraya, "waterlevel.json": _shift_waterlevel}
+
+
+def make_handler(recordings=None, profiles=None, change_every=0, stats=None, received=None):
+    bodies = load_recordings(recordings)
+    profiles = profiles or {}
+    stats = {} if stats is None else stats
+    counters = {name: 0 for name in ENDPOINTS}
+    variants = {}
+    lock = threading.Lock()
+
+    def _body(name, step):
+        if not step or name not in VARIANTS:
+            return bodies[name]
+        key = (name, step)
+        if key not in variants:
+            ctype, raw = bodies[name]
+            variants[key] = (ctype, VARIANTS[name](raw, step))
+        return variants[key]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive
+
+        def _reply(self, code, body=b"{}", headers=None, ctype="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            """คืน (endpoint, path ที่เหลือ, ตอบ error หรือไม่, ลำดับ request) พร้อมจำลอง latency"""
+            path = self.path.split("?", 1)[0]
+            for name, prefix in ENDPOINTS.items():
+                if path.startswith(prefix):
+                    break
+            else:
+                return None, None, False, 0
+            profile = profiles.get(name) or profiles.get("*") or {}
+            delay = profile.get("latency", 0) + random.uniform(-1, 1) * profile.get("jitter", 0)
+            if random.random() < profile.get("slow_rate", 0):
+                delay = max(delay, 1) * SLOW_FACTOR
+            if delay > 0:
+                time.sleep(delay / 1000)
+            with lock:
+                counters[name] += 1
+                n = counters[name]
+                entry = stats.setdefault(name, {"requests": 0, "errors": 0, "not_modified": 0})
+                entry["requests"] += 1
+                failed = random.random() < profile.get("error_rate", 0)
+                entry["errors"] += failed
+            return name, path[len(prefix) - 1:], failed, n
+
+        def do_GET(self):
+            name, rest, failed, n = self._route()
+            if name is None or name == "line":
+                return self._reply(404, b'{"message":"Not found"}')
+            if failed:
+                return self._reply(503, b'{"message":"Service unavailable"}')
+            if name == "tiwrm":
+                file = "chaopraya.html"
+            elif name == "thaiwater":
+                file = "page.html" if rest.rstrip("/").endswith("/wl") else "waterlevel.json"
+            else:
+                file = "owm_forecast.json"
+            ctype, body = _body(file, n // change_every if change_every else 0)
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                with lock:
+                    stats[name]["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            return self._reply(200, body, {"ETag": etag}, ctype)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            name, rest, failed, _ = self._route()
+            if name != "line" or rest not in LINE_PATHS:
+                return self._reply(404, b'{"message":"Not found"}')
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._reply(401, b'{"message":"Authentication failed"}')
+            if failed:
+                return self._reply(503, b'{"message":"Service unavailable"}')
+            if received is not None:
+                received.append((rest, payload))
+            return self._reply(200)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, **kwargs):
+    """เริ่ม stub ใน background thread คืน (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(**kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def env_for(base_url):
+    """ตัวแปรแวดล้อมที่ชี้ทุกสคริปต์มาที่ stub"""
+    return {
+        "CHAOPRAYA_URL": f"{base_url}/tiwrm/chaopraya.php",
+        "WL_API_URL": f"{base_url}/thaiwater/waterlevel_load",
+        "WL_PAGE_URL": f"{base_url}/thaiwater/wl",
+        "OPENWEATHER_URL": f"{base_url}/owm/forecast",
+        "LINE_API_BASE": f"{base_url}/line",
+    }
+
+
+def record(directory):
+    """ดึง response จริงของ tiwrm / thaiwater / OpenWeatherMap มาเก็บเป็นไฟล์ใน directory"""
+    sys.path.insert(0, REPO_ROOT)
+    import scraper
+    import inburi_bridge_alert
+    import weather_forecaster
+    from http_client import get_session
+    from storage import WEATHER_PRIMARY_LOCATION
+
+    os.makedirs(directory, exist_ok=True)
+    targets = {
+        "chaopraya.html": scraper.URL,
+        "waterlevel.json": inburi_bridge_alert.WL_API_URL,
+    }
+    if weather_forecaster.OPENWEATHER_API_KEY:
+        lat, lon, _ = weather_forecaster.load_locations()[WEATHER_PRIMARY_LOCATION]
+        targets["owm_forecast.json"] = (f"{weather_forecaster.FORECAST_URL}?lat={lat}&lon={lon}"
+                                        f"&appid={weather_forecaster.OPENWEATHER_API_KEY}&units=metric")
+    else:
+        print("[WARN] ไม่มี OPENWEATHER_API_KEY → ใช้ fixture แทนผลของ OpenWeatherMap")
+    # หน้า /wl ต้อง render ด้วย JS จึงใช้ fixture เสมอ; LINE ตอบ {} อยู่แล้วไม่ต้องบันทึก
+
+    failed = 0
+    for name, url in targets.items():
+        try:
+            resp = get_session().get(url, timeout=30)
+            resp.raise_for_status()
+        except Exception as e:
+            print(f"[ERROR] บันทึก {name} ไม่สำเร็จ: {e}")
+            failed += 1
+            continue
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(resp.content)
+        print(f"[INFO] บันทึก {name} ({len(resp.content)} bytes)")
+    return 1 if failed else 0
+
+
+def profiles_from_args(args):
+    profiles = {"*": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                      "slow_rate": args.slow_rate}}
+    for spec in args.endpoint or []:
+        name, _, values = spec.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"ไม่รู้จัก endpoint '{name}' (มี: {', '.join(ENDPOINTS)})")
+        profiles[name] = parse_profile(values)
+    return profiles
+
+
+def add_profile_args(parser):
+    parser.add_argument("--recordings", help="โฟลเดอร์ response ที่บันทึกไว้ (ไม่มี = fixture)")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency พื้นฐานของทุก endpoint (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="±jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="สัดส่วน request ที่ตอบ 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help=f"สัดส่วน request ที่ช้า {SLOW_FACTOR} เท่าของ latency")
+    parser.add_argument("--endpoint", action="append", metavar="NAME=LAT,JITTER,ERR[,SLOW]",
+                        help="ค่าเฉพาะ endpoint (tiwrm, thaiwater, owm, line) ใส่ซ้ำได้")
+    parser.add_argument("--change-every", type=int, default=0,
+                        help="เปลี่ยนค่า C13/ระดับน้ำทุก N request (0 = ค่าเดิมเสมอ)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8097)
+    parser.add_argument("--record", metavar="DIR", help="บันทึก response จริงลง DIR แล้วจบ")
+    add_profile_args(parser)
+    args = parser.parse_args(argv)
+    if args.record:
+        return record(args.record)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.recordings, profiles_from_args(args), args.change_every))
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"[STUB] replay stub ที่ {base_url}")
+    for key, value in env_for(base_url).items():
+        print(f"  {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
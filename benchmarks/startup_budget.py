@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+วัดเวลา import ของแต่ละสคริปต์ด้วย `python -X importtime` และตรวจกับงบเวลา (budget)
+
+รันแต่ละโมดูลใน interpreter ใหม่หลายรอบแล้วใช้ค่าที่น้อยที่สุด (ลด noise จาก disk cache)
+ถ้าโมดูลใดเกินงบจะ exit 1 เพื่อใช้เป็น regression check ใน CI ได้
+
+ใช้งาน (จาก root ของ repo):
+  python benchmarks/startup_budget.py
+  python benchmarks/startup_budget.py --budget-ms 80 --runs 5 --json startup.json
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# โมดูล -> งบเวลา import (ms); None = ใช้ค่า --budget-ms
+# summary_report ใช้ pandas ในทุกขั้นตอนจึงมีงบแยก
+MODULES = {
+    "scraper": None,
+    "inburi_bridge_alert": None,
+    "weather_forecaster": None,
+    "collector": None,
+    "summary_report": 1500,
+}
+DEFAULT_BUDGET_MS = 100
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module, python=sys.executable):
+    """คืน (cumulative µs ของ module, 5 อันดับ import ตรงของ module ที่ใช้เวลามากที่สุด)"""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} ล้มเหลว:\n{proc.stderr[-2000:]}")
+
+    # importtime พิมพ์ลูกก่อนแม่ ลูกตรงของ module คือบรรทัด indent 3 ที่อยู่หลังบรรทัด indent 1 ก่อนหน้า
+    total, children = None, []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        if indent == 1:
+            if name == module:
+                total = cumulative
+                break
+            children = []
+        elif indent == 3:
+            children.append((cumulative, name))
+    return total, sorted(children, reverse=True)[:5]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--json", help="เขียนผลลัพธ์เป็น JSON ลงไฟล์นี้")
+    parser.add_argument("modules", nargs="*", default=list(MODULES))
+    args = parser.parse_args(argv)
+
+    results, failed = [], False
+    for module in args.modules:
+        budget = MODULES.get(module) or args.budget_ms
+        samples = [measure(module) for _ in range(args.runs)]
+        best_us, top = min(samples, key=lambda s: s[0])
+        ms = best_us / 1000
+        ok = ms <= budget
+        failed |= not ok
+        results.append({"module": module, "import_ms": round(ms, 1), "budget_ms": budget, "ok": ok,
+                        "top_imports": [{"name": n, "ms": round(us / 1000, 1)} for us, n in top]})
+        print(f"{'OK  ' if ok else 'FAIL'} {module:<22} {ms:8.1f} ms  (budget {budget:.0f} ms)")
+        for us, name in top:
+            print(f"       {name:<30} {us / 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
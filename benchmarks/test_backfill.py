@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+ทดสอบ backfill.py แบบ offline กับ benchmarks/history_stub.py (ไม่ใช้ network ภายนอก)
+
+ครอบคลุม fetch_range, การลองซ้ำเมื่อ 5xx/network error, 429 Retry-After กับ RateLimiter,
+การทำต่อจาก checkpoint (งานที่ done แล้วไม่ถูกดึงซ้ำ) และการไม่เขียนแถวซ้ำเมื่อรันซ้ำ
+แต่ละกรณีรันใน directory ชั่วคราว (backend csv) จึงไม่แตะ log ของ repo
+
+ใช้งาน (จาก root ของ repo):
+  python benchmarks/test_backfill.py
+  python -m pytest benchmarks/test_backfill.py
+"""
+import os
+import sys
+import time
+import tempfile
+import traceback
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["STORAGE_BACKEND"] = "csv"
+
+import requests  # noqa: E402
+
+import backfill  # noqa: E402
+import history_stub  # noqa: E402
+from storage import TIMEZONE_THAILAND, get_store  # noqa: E402
+
+START = TIMEZONE_THAILAND.localize(datetime(2026, 3, 1))
+INBURI_URL = "{base}/history/inburi?start={{start}}&end={{end}}"
+
+
+class Stub:
+    """history_stub ใน background thread + ตั้ง BACKFILL_INBURI_URL ชี้มาที่ stub ระหว่าง with"""
+
+    def __init__(self, **kwargs):
+        self.requests = []
+        self.kwargs = kwargs
+
+    def __enter__(self):
+        self.server, base = history_stub.serve(requests_log=self.requests, **self.kwargs)
+        self.saved = os.environ.get("BACKFILL_INBURI_URL")
+        os.environ["BACKFILL_INBURI_URL"] = INBURI_URL.format(base=base)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.saved is None:
+            os.environ.pop("BACKFILL_INBURI_URL", None)
+        else:
+            os.environ["BACKFILL_INBURI_URL"] = self.saved
+
+
+class Workdir:
+    """chdir เข้า directory ชั่วคราวที่มี inburi_log.csv รายชั่วโมง (ขาดช่วง gap) และ checkpoint แยก"""
+
+    def __init__(self, days=6, gap=(timedelta(days=2), timedelta(days=4))):
+        self.days, self.gap = days, gap
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="backfill-test-")
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.state_file, backfill.STATE_FILE = backfill.STATE_FILE, os.path.join(self.tmp.name, "state.json")
+        rows = []
+        for hour in range(self.days * 24 + 1):
+            offset = timedelta(hours=hour)
+            if self.gap[0] < offset < self.gap[1]:
+                continue
+            dt = START + offset
+            value = history_stub.value_at("inburi", dt)
+            rows.append((dt, [value, 13.8, "N/A", round(13.8 - value, 2), dt.strftime("%H:%M น.")]))
+        get_store().append_many("inburi", rows)
+        return self
+
+    def __exit__(self, *exc):
+        backfill.STATE_FILE = self.state_file
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def plan(self):
+        return backfill.plan(["inburi"], START, START + timedelta(days=self.days),
+                             max_gap=timedelta(hours=6), chunk=timedelta(days=1))
+
+
+def _state(tasks, done=()):
+    return {"created": START.isoformat(), "sources": ["inburi"], "tasks": tasks,
+            "done": list(done), "failed": {}}
+
+
+def _query(task):
+    """ช่วงเวลาของงานตามที่ stub ได้รับใน query (เวลาไทย ละเอียดระดับนาที)"""
+    return tuple(datetime.strptime(backfill.parse_ts(task[k]).strftime(backfill.TIME_FORMAT), backfill.TIME_FORMAT)
+                 for k in ("start", "end"))
+
+
+def test_fetch_range():
+    with Stub(step=60) as stub:
+        rows = backfill.fetch_range("inburi", START, START + timedelta(hours=5), backfill.RateLimiter(0))
+    assert [dt for dt, _, _ in rows] == [START + timedelta(hours=h) for h in range(6)], rows
+    # stub ตอบเวลาไทยแบบไม่มี timezone และคำนวณค่าจากเวลานั้นตรงๆ
+    assert all(value == history_stub.value_at("inburi", dt.replace(tzinfo=None)) for dt, value, _ in rows)
+    assert rows[0][2]["bank_level"] == 13.8
+    assert len(stub.requests) == 1
+
+
+def test_retry_then_give_up():
+    # 5xx ทุกครั้ง: ลองครบ MAX_ATTEMPTS แล้วส่ง HTTPError ออกมา
+    saved, backfill.MAX_ATTEMPTS = backfill.MAX_ATTEMPTS, 2
+    try:
+        with Stub(fail_rate=1.0):
+            try:
+                backfill.fetch_range("inburi", START, START + timedelta(hours=1), backfill.RateLimiter(0))
+            except requests.exceptions.HTTPError as e:
+                assert e.response.status_code == 500
+            else:
+                raise AssertionError("fetch_range ควรส่ง HTTPError เมื่อ 5xx ครบทุกรอบ")
+        # network error (ไม่มี server ที่ port นี้แล้ว) ก็ลองซ้ำก่อนส่งต่อ
+        with Stub() as stub:
+            url = os.environ["BACKFILL_INBURI_URL"]
+        os.environ["BACKFILL_INBURI_URL"] = url
+        try:
+            backfill.fetch_range("inburi", START, START + timedelta(hours=1), backfill.RateLimiter(0))
+        except requests.exceptions.ConnectionError:
+            pass
+        else:
+            raise AssertionError("fetch_range ควรส่ง ConnectionError เมื่อเชื่อมต่อไม่ได้ครบทุกรอบ")
+        finally:
+            os.environ.pop("BACKFILL_INBURI_URL", None)
+        assert not stub.requests
+    finally:
+        backfill.MAX_ATTEMPTS = saved
+
+
+def test_rate_limit():
+    # 429 (Retry-After: 1) ทุก request ที่ 2: รอตาม Retry-After แล้วได้ข้อมูลครบ
+    with Stub(rate_limit_every=2) as stub:
+        limiter = backfill.RateLimiter(0)
+        backfill.fetch_range("inburi", START, START + timedelta(hours=1), limiter)
+        started = time.monotonic()
+        rows = backfill.fetch_range("inburi", START, START + timedelta(hours=1), limiter)
+        waited = time.monotonic() - started
+    assert len(rows) == 2 and len(stub.requests) == 2
+    assert waited >= 0.9, waited
+    # RateLimiter เว้นระยะ 1/rate วินาทีระหว่าง request
+    limiter = backfill.RateLimiter(20)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - started >= 4 / 20 - 0.01
+
+
+def test_resume_and_dedupe():
+    with Workdir() as work, Stub(step=60) as stub:
+        tasks = work.plan()
+        assert len(tasks) >= 2, tasks
+        before = len(get_store().range("inburi"))
+
+        # รอบแรกหยุดหลังทำงานแรกเสร็จ แล้วทำต่อจาก checkpoint: ดึงเฉพาะงานที่เหลือ
+        _, _, added = backfill.run(_state(tasks[:1]), workers=2, rate=0)
+        del stub.requests[:]
+        state = _state(tasks, done=[tasks[0]["id"]])
+        ok, failed, rest = backfill.run(state, workers=2, rate=0)
+        added += rest
+        assert (ok, failed) == (len(tasks) - 1, 0) and added > 0
+        requested = {(start, end) for _, start, end in stub.requests}
+        assert _query(tasks[0]) not in requested
+        assert all(_query(t) in requested for t in tasks[1:])
+        assert sorted(state["done"]) == sorted(t["id"] for t in tasks)
+        assert backfill.load_state()["done"] == state["done"]
+
+        # รันซ้ำทุกงาน: แถวที่มีอยู่แล้ว (รวมที่ backfill เพิ่ม) ไม่ถูกเขียนซ้ำ
+        rows = get_store().range("inburi")
+        assert len(rows) == before + added
+        ok, failed, again = backfill.run(_state(tasks), workers=2, rate=0)
+        assert (ok, failed, again) == (len(tasks), 0, 0)
+        stamps = [dt for dt, _ in get_store().range("inburi")]
+        assert stamps == sorted(set(stamps)) and len(stamps) == len(rows)
+        assert not work.plan()
+
+
+def main():
+    tests = [(name, fn) for name, fn in globals().items() if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            failed += 1
+            print(f"[FAIL] {name}")
+            traceback.print_exc()
+        else:
+            print(f"[ OK ] {name} ({time.perf_counter() - started:.2f}s)")
+    print(f"[INFO] ผ่าน {len(tests) - failed}/{len(tests)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+สร้างกราฟสรุป chaop_summary.png (ที่ workflow daily_summary commit ไว้)
+
+กราฟ 3 ส่วนในภาพเดียว:
+  1) ปริมาณน้ำท้ายเขื่อนเจ้าพระยา (ลบ.ม./วินาที)
+  2) ระดับน้ำสะพานอินทร์บุรี เทียบระดับตลิ่ง (ม.รทก.)
+  3) ปริมาณฝนพยากรณ์ (มม./3 ชม.) ช่วงข้างหน้า
+
+ข้อมูลย้อนหลัง CHART_DAYS วัน (ค่าเฉลี่ยรายชั่วโมงจาก rollup.py) ถูกลดจำนวนจุดด้วย LTTB
+(Largest-Triangle-Three-Buckets) ให้เหลือไม่เกิน CHART_POINTS จุดต่อเส้นก่อนวาด และ figure/axes
+ถูกสร้างครั้งเดียวต่อ process แล้วเปลี่ยนเฉพาะข้อมูลของเส้น เวลาวาดและขนาด PNG จึงคงที่ไม่ว่า log จะยาวแค่ไหน
+
+ข้อความในกราฟเป็นภาษาอังกฤษ เพราะฟอนต์เริ่มต้นของ matplotlib บน runner ไม่มีอักษรไทย
+
+ใช้งาน:
+  python chart.py [output.png]
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import rollup
+from storage import TIMEZONE_THAILAND, WEATHER_PRIMARY_LOCATION, get_store, weather_location
+
+# --- ค่าคงที่ ---
+CHART_FILE   = os.getenv("CHART_PATH", "chaop_summary.png")
+CHART_DAYS   = int(os.getenv("CHART_DAYS", "30"))
+CHART_POINTS = int(os.getenv("CHART_POINTS", "600"))     # จุดสูงสุดต่อเส้นหลัง downsample
+FIGSIZE      = (10, 8)
+DPI          = 100
+RAIN_EVENTS  = ("ฝนตก", "พายุฝนฟ้าคะนอง")
+UTC_OFFSET   = 7 * 3600     # แกนเวลาแสดงเป็นเวลาไทย
+
+_template = None
+
+
+# ── downsampling ──
+def lttb(x, y, threshold=CHART_POINTS):
+    """
+    Largest-Triangle-Three-Buckets: เลือก threshold จุดที่คงรูปร่างของเส้นไว้ (รวมยอด/ท้องกราฟ)
+    x ต้องเรียงจากน้อยไปมาก ค่า NaN ใน y จะถูกตัดออกก่อน คืน (x, y) ที่ลดจำนวนแล้ว
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    n = len(x)
+    if threshold < 3 or n <= threshold:
+        return x, y
+
+    # จุดแรกและจุดสุดท้ายคงไว้เสมอ จุดที่เหลือแบ่งเป็น threshold-2 bucket
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        # พื้นที่สามเหลี่ยม (ไม่หาร 2) ระหว่างจุดที่เลือกก่อนหน้า, จุดใน bucket และค่าเฉลี่ย bucket ถัดไป
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        picked[i + 1] = a
+    return x[picked], y[picked]
+
+
+def _to_float(text):
+    try:
+        return float(str(text).replace(",", "").replace("cms", "").strip())
+    except ValueError:
+        return np.nan
+
+
+def _to_datetime64(epoch):
+    return (np.asarray(epoch, dtype=np.float64) + UTC_OFFSET).astype("datetime64[s]")
+
+
+# ── ข้อมูล ──
+def _hourly(series, start):
+    rollup.update(series)
+    return rollup.load(series, "hourly", start)
+
+
+def _bucket_x(buckets):
+    return [b["start"].timestamp() + 1800 for b in buckets]     # กึ่งกลางชั่วโมง
+
+
+def _bucket_mean(buckets, column):
+    return [np.nan if b["columns"][column]["mean"] is None else b["columns"][column]["mean"] for b in buckets]
+
+
+def load_series(now=None, days=CHART_DAYS, points=CHART_POINTS):
+    """อ่าน log ช่วง days วันล่าสุด (และพยากรณ์ข้างหน้า) แล้ว downsample คืน dict ของ (x, y)"""
+    now = now or datetime.now(TIMEZONE_THAILAND)
+    start = now - timedelta(days=days)
+    store = get_store()
+    data = {}
+
+    # ระดับน้ำ/ปริมาณน้ำใช้ค่าเฉลี่ยรายชั่วโมงจาก rollup (อัปเดตเฉพาะแถวใหม่) แทนการอ่าน log ดิบ
+    buckets = _hourly("chaopraya", start)
+    data["storage"] = lttb(_bucket_x(buckets), _bucket_mean(buckets, "storage"), points)
+
+    buckets = _hourly("inburi", start)
+    x = _bucket_x(buckets)
+    data["level"] = lttb(x, _bucket_mean(buckets, "water_level"), points)
+    data["bank"] = lttb(x, _bucket_mean(buckets, "bank_level"), points)
+
+    # ฝนพยากรณ์มีไม่เกิน 40 ช่วง (5 วัน x 3 ชม.) ไม่ต้อง downsample
+    rain = {}
+    for dt, v in store.range("weather", now - timedelta(hours=3)):
+        if v and v[0] in RAIN_EVENTS and weather_location(v) == WEATHER_PRIMARY_LOCATION:
+            rain[dt.timestamp()] = rain.get(dt.timestamp(), 0.0) + np.nan_to_num(_to_float(v[1]))
+    data["rain"] = (np.array(sorted(rain)), np.array([rain[k] for k in sorted(rain)]))
+    return data
+
+
+# ── วาด ──
+def _get_template():
+    """สร้าง figure + axes + เส้นครั้งเดียวต่อ process แล้วใช้ซ้ำ"""
+    global _template
+    if _template is not None:
+        return _template
+
+    # ใช้ Figure โดยตรง (ไม่ผ่าน pyplot) จึงไม่ต้องเลือก backend และไม่ค้าง figure ไว้ใน pyplot
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGSIZE, dpi=DPI, layout="constrained")
+    ax_storage, ax_level, ax_rain = fig.subplots(3, 1, height_ratios=[3, 3, 2])
+    storage_line, = ax_storage.plot([], [], color="tab:blue", lw=1.2)
+    ax_storage.set_title("Chao Phraya Dam (C13) discharge")
+    ax_storage.set_ylabel("m³/s")
+
+    level_line, = ax_level.plot([], [], color="tab:cyan", lw=1.2, label="water level")
+    bank_line, = ax_level.plot([], [], color="tab:red", lw=1, ls="--", label="bank level")
+    ax_level.set_title("Inburi bridge water level")
+    ax_level.set_ylabel("m MSL")
+    ax_level.legend(loc="upper left")
+
+    ax_rain.set_title("Forecast rain")
+    ax_rain.set_ylabel("mm / 3h")
+
+    for ax in (ax_storage, ax_level, ax_rain):
+        ax.grid(True, alpha=0.3)
+        locator = mdates.AutoDateLocator(minticks=3, maxticks=10)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+    _template = {
+        "fig": fig, "ax_storage": ax_storage, "ax_level": ax_level, "ax_rain": ax_rain,
+        "storage": storage_line, "level": level_line, "bank": bank_line,
+        "rain": None, "notes": [],
+    }
+    return _template
+
+
+def _set_line(ax, line, xy):
+    x, y = xy
+    line.set_data(_to_datetime64(x), y)
+    return len(x)
+
+
+def render(data, output=CHART_FILE, now=None, days=CHART_DAYS):
+    """วาดข้อมูลจาก load_series() ลงไฟล์ PNG คืน path ของไฟล์"""
+    now = now or datetime.now(TIMEZONE_THAILAND)
+    t = _get_template()
+    for note in t["notes"]:
+        note.remove()
+    t["notes"] = []
+
+    start = _to_datetime64(now.timestamp() - days * 86400)
+    end = _to_datetime64(now.timestamp())
+    for ax, keys in ((t["ax_storage"], ("storage",)), (t["ax_level"], ("level", "bank"))):
+        count = sum(_set_line(ax, t[key], data[key]) for key in keys)
+        ax.set_xlim(start, end)
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        if not count:
+            t["notes"].append(ax.text(0.5, 0.5, "no data", transform=ax.transAxes,
+                                      ha="center", va="center", color="gray"))
+
+    ax = t["ax_rain"]
+    if t["rain"] is not None:
+        t["rain"].remove()
+    x, y = data["rain"]
+    t["rain"] = ax.bar(_to_datetime64(x), y, width=np.timedelta64(150, "m"),
+                       align="edge", color="tab:blue", alpha=0.7)
+    ax.set_xlim(end, _to_datetime64(now.timestamp() + 5 * 86400))
+    ax.set_ylim(0, max(5.0, float(y.max()) * 1.15 if len(y) else 0))
+    if not len(x):
+        t["notes"].append(ax.text(0.5, 0.5, "no rain forecast", transform=ax.transAxes,
+                                  ha="center", va="center", color="gray"))
+
+    t["fig"].suptitle(f"Water summary  {now.strftime('%Y-%m-%d %H:%M')} (UTC+7)")
+    tmp = output + ".tmp.png"
+    t["fig"].savefig(tmp, format="png")
+    os.replace(tmp, output)
+    return output
+
+
+def render_summary(output=CHART_FILE, now=None, days=CHART_DAYS):
+    """โหลดข้อมูลแล้ววาด chaop_summary.png ในรอบเดียว"""
+    now = now or datetime.now(TIMEZONE_THAILAND)
+    return render(load_series(now, days), output, now, days)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = render_summary(argv[0] if argv else CHART_FILE)
+    print(f"[INFO] บันทึกกราฟ {path} ({os.path.getsize(path) // 1024} KiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+รวมการเก็บข้อมูลทั้ง 3 แหล่งไว้ใน process เดียว
+
+ดึงหน้า Chaopraya (tiwrm), ข้อมูลสถานีอินทร์บุรี และพยากรณ์ OpenWeatherMap พร้อมกัน
+ผ่าน asyncio + HTTP session กลางตัวเดียว (http_client) จากนั้นส่งผลให้ logic เดิมของ
+แต่ละสคริปต์ประมวลผลและบันทึก log ตามลำดับ
+
+เวลาต่อรอบจึงประมาณเท่ากับแหล่งที่ช้าที่สุด แทนที่จะเป็นผลรวมของทุกแหล่ง
+สคริปต์เดี่ยว (python scraper.py ฯลฯ) ยังใช้งานได้เหมือนเดิม
+
+ใช้งาน:
+  python collector.py                 # ทุกแหล่ง
+  python collector.py chaopraya inburi
+"""
+import sys
+import time
+import asyncio
+
+import scraper
+import inburi_bridge_alert
+import weather_forecaster
+import line_delivery
+import metrics
+import upstream
+from http_client import close_session
+
+# ชื่อแหล่ง -> (ฟังก์ชันดึงข้อมูล (blocking I/O), ฟังก์ชันประมวลผล/บันทึก)
+SOURCES = {
+    "chaopraya": (scraper.fetch_chaopraya, scraper.process_result),
+    "inburi":    (inburi_bridge_alert.get_water_data, inburi_bridge_alert.process_data),
+    "weather":   (weather_forecaster.fetch_weather_forecast, weather_forecaster.process_forecast),
+}
+
+
+async def _fetch(name, fetch):
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(fetch)
+    except Exception as e:
+        print(f"[ERROR] {name}: ดึงข้อมูลไม่สำเร็จ: {e}")
+        result = None
+    elapsed = time.perf_counter() - started
+    metrics.gauge(f"{name}.fetch_wall_seconds", elapsed)
+    print(f"[DEBUG] {name}: fetch {elapsed:.2f}s")
+    return result
+
+
+async def fetch_all(names=None):
+    """
+    ดึงทุกแหล่งพร้อมกันภายใน latency budget เดียวกัน (FETCH_BUDGET_S ของ upstream.py)
+    คืน dict ชื่อ -> ผลที่ดึงได้ (None = ไม่สำเร็จ)
+    """
+    names = list(names or SOURCES)
+    upstream.start_cycle()
+    try:
+        results = await asyncio.gather(*(_fetch(n, SOURCES[n][0]) for n in names))
+    finally:
+        upstream.save_state()
+    return dict(zip(names, results))
+
+
+def is_stale(result):
+    """ผลที่เป็นค่าเดิมจาก cache ทั้งหมด (breaker ของ upstream เปิดอยู่) ไม่ใช่ข้อมูลใหม่"""
+    if not isinstance(result, dict):
+        return False
+    if "stale" in result:
+        return bool(result["stale"])
+    # weather: {location: ผลของ cell}
+    forecasts = [v for v in result.values() if isinstance(v, dict)]
+    return bool(forecasts) and all(v.get("_stale") for v in forecasts)
+
+
+def process_all(results):
+    """ประมวลผล/บันทึกผลของแต่ละแหล่ง ทีละแหล่ง เพื่อไม่ให้ log/state เขียนชนกัน"""
+    for name, result in results.items():
+        try:
+            SOURCES[name][1](result)
+        except Exception as e:
+            print(f"[ERROR] {name}: ประมวลผลไม่สำเร็จ: {e}")
+
+
+async def collect(names=None):
+    """ดึงทุกแหล่งพร้อมกัน แล้วประมวลผลผลลัพธ์ทีละแหล่ง คืน dict ชื่อ -> ผลที่ดึงได้"""
+    results = await fetch_all(names)
+    process_all(results)
+    return results
+
+
+@metrics.instrumented("collector")
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or None
+    unknown = [n for n in names or [] if n not in SOURCES]
+    if unknown:
+        print(f"[ERROR] ไม่รู้จักแหล่งข้อมูล: {', '.join(unknown)} (มี: {', '.join(SOURCES)})")
+        return 2
+
+    print("=== เริ่ม collector ===")
+    started = time.perf_counter()
+    try:
+        asyncio.run(collect(names))
+    finally:
+        line_delivery.join_pending()
+        inburi_bridge_alert.close_driver()
+        close_session()
+    print(f"=== จบ collector ({time.perf_counter() - started:.2f}s) ===")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+โหมด daemon สำหรับเครื่องที่ host เอง: เก็บข้อมูลวนไปเรื่อยๆ ใน process เดียว
+
+ต่างจากการรันผ่าน cron ทีละครั้งตรงที่ interpreter, module, HTTP session (keep-alive/TLS)
+และ Chrome (ถ้าใช้ FETCH_BACKEND=selenium) ถูกโหลดไว้ครั้งเดียวแล้วใช้ซ้ำทุกรอบ
+
+- แต่ละแหล่งมีรอบของตัวเอง (DAEMON_INTERVAL_<SOURCE> วินาที) บวก jitter ±DAEMON_JITTER
+- ดึงไม่สำเร็จจะเว้นระยะเพิ่มเป็นเท่าตัว (สูงสุด DAEMON_MAX_BACKOFF) จนกว่าจะสำเร็จอีกครั้ง
+- แหล่งที่ถึงเวลาพร้อมกันจะถูกดึงพร้อมกันผ่าน collector.collect()
+- สถานะล่าสุดเขียนลง daemon_status.json ทุกรอบ (ใช้กับ healthcheck ได้)
+- SIGTERM / Ctrl-C หยุดอย่างเรียบร้อย: รอส่ง LINE ที่ค้าง แล้วปิด browser และ session
+
+ใช้งาน:
+  python daemon.py                    # ทุกแหล่ง
+  python daemon.py chaopraya inburi   # เฉพาะบางแหล่ง
+  python daemon.py status             # แสดงสถานะ (exit 1 ถ้ามีแหล่งที่ไม่สำเร็จนานเกินไป)
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import threading
+from datetime import datetime
+
+import collector
+import inburi_bridge_alert
+import line_delivery
+import metrics
+from http_client import close_session
+from storage import TIMEZONE_THAILAND
+
+# --- ค่าคงที่ ---
+DEFAULT_INTERVALS = {"chaopraya": 300, "inburi": 300, "weather": 3 * 3600}
+INTERVALS = {
+    name: float(os.getenv(f"DAEMON_INTERVAL_{name.upper()}", default))
+    for name, default in DEFAULT_INTERVALS.items()
+}
+JITTER        = float(os.getenv("DAEMON_JITTER", "0.1"))          # สัดส่วนของ interval
+MAX_BACKOFF   = float(os.getenv("DAEMON_MAX_BACKOFF", "3600"))
+KEEP_BROWSER  = os.getenv("DAEMON_KEEP_BROWSER", "1").lower() in ("1", "true")
+STATUS_FILE   = os.getenv("DAEMON_STATUS_PATH", "daemon_status.json")
+STALE_FACTOR  = 3      # status ถือว่าไม่ปกติถ้าไม่สำเร็จเกิน 3 เท่าของ interval
+
+_stop = threading.Event()
+
+
+def _now_iso():
+    return datetime.now(TIMEZONE_THAILAND).isoformat(timespec="seconds")
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, TIMEZONE_THAILAND).isoformat(timespec="seconds") if epoch else None
+
+
+def next_delay(name, failures, rng=random):
+    """ระยะรอก่อนรอบถัดไป: interval × 2^failures (ไม่เกิน MAX_BACKOFF) ± jitter"""
+    base = INTERVALS[name]
+    if failures:
+        base = min(MAX_BACKOFF, base * 2 ** failures)
+    return max(1.0, base * (1 + rng.uniform(-JITTER, JITTER)))
+
+
+class Scheduler:
+    def __init__(self, names):
+        now = time.time()
+        self.started = now
+        self.state = {
+            name: {
+                "interval": INTERVALS[name],
+                "next_run": now,        # รอบแรกเริ่มทันที
+                "last_run": None,
+                "last_success": None,
+                "last_error": None,
+                "last_duration": None,
+                "failures": 0,
+                "runs": 0,
+            }
+            for name in names
+        }
+
+    def due(self, now):
+        return [n for n, s in self.state.items() if s["next_run"] <= now]
+
+    def wait_time(self, now):
+        return max(0.0, min(s["next_run"] for s in self.state.values()) - now)
+
+    def run_once(self, names):
+        started = time.time()
+        try:
+            results = asyncio.run(collector.collect(names))
+        except Exception as e:
+            print(f"[ERROR] daemon: รอบ {', '.join(names)} ล้มเหลว: {e}")
+            results = {name: None for name in names}
+        finished = time.time()
+
+        for name in names:
+            s = self.state[name]
+            s["runs"] += 1
+            s["last_run"] = started
+            s["last_duration"] = round(finished - started, 3)
+            if results.get(name) is None or collector.is_stale(results[name]):
+                # ค่า stale (breaker เปิด) ไม่นับเป็นความสำเร็จ health check จะได้เห็นว่าข้อมูลไม่ใหม่
+                s["failures"] += 1
+                s["last_error"] = _now_iso()
+            else:
+                s["failures"] = 0
+                s["last_success"] = finished
+            s["next_run"] = finished + next_delay(name, s["failures"])
+            outcome = "สำเร็จ" if not s["failures"] else f"ล้มเหลว (ติดกัน {s['failures']} ครั้ง)"
+            print(f"[INFO] daemon: {name} {outcome} รอบถัดไปในอีก {s['next_run'] - finished:.0f}s")
+
+        if "inburi" in names and not KEEP_BROWSER:
+            inburi_bridge_alert.close_driver()
+        if line_delivery.has_credentials() and line_delivery.load_outbox():
+            # ส่งข้อความที่ค้างจากรอบก่อน (เช่นตอน LINE ล่ม) ใน background
+            line_delivery.flush_async()
+
+    def snapshot(self):
+        return {
+            "pid": os.getpid(),
+            "started": _iso(self.started),
+            "updated": _now_iso(),
+            "sources": {
+                name: {
+                    "interval": s["interval"],
+                    "runs": s["runs"],
+                    "consecutive_failures": s["failures"],
+                    "last_run": _iso(s["last_run"]),
+                    "last_success": _iso(s["last_success"]),
+                    "last_success_epoch": s["last_success"],
+                    "last_error": s["last_error"],
+                    "last_duration": s["last_duration"],
+                    "next_run": _iso(s["next_run"]),
+                }
+                for name, s in self.state.items()
+            },
+        }
+
+    def write_status(self):
+        tmp = STATUS_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, STATUS_FILE)
+
+
+def run(names):
+    scheduler = Scheduler(names)
+    print(f"=== เริ่ม daemon (pid {os.getpid()}) แหล่ง: "
+          + ", ".join(f"{n} ทุก {INTERVALS[n]:.0f}s" for n in names) + " ===")
+    try:
+        while not _stop.is_set():
+            due = scheduler.due(time.time())
+            if due:
+                scheduler.run_once(due)
+                scheduler.write_status()
+                metrics.flush("daemon")
+            _stop.wait(scheduler.wait_time(time.time()))
+    finally:
+        line_delivery.join_pending()
+        inburi_bridge_alert.close_driver()
+        close_session()
+        print("=== จบ daemon ===")
+
+
+def show_status(now=None):
+    """พิมพ์สถานะจาก STATUS_FILE คืน exit code (0 = ปกติ, 1 = มีแหล่งที่ค้าง/ไม่มีไฟล์)"""
+    try:
+        with open(STATUS_FILE, "r", encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        print(f"[ERROR] อ่าน {STATUS_FILE} ไม่ได้ (daemon ยังไม่ได้รัน?)")
+        return 1
+    now = now or time.time()
+    healthy = True
+    print(f"pid {status['pid']} เริ่ม {status['started']} อัปเดต {status['updated']}")
+    for name, s in status["sources"].items():
+        last = s.get("last_success_epoch")
+        stale = last is None or now - last > STALE_FACTOR * s["interval"]
+        healthy &= not stale
+        print(f"  {'STALE' if stale else 'OK':<5} {name:<10} สำเร็จล่าสุด {s['last_success'] or '-'}"
+              f"  ล้มเหลวติดกัน {s['consecutive_failures']}  รอบถัดไป {s['next_run']}")
+    return 0 if healthy else 1
+
+
+def _handle_signal(signum, frame):
+    print(f"[INFO] daemon: ได้รับสัญญาณ {signum} กำลังหยุด ...")
+    _stop.set()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["status"]:
+        return show_status()
+    names = argv or list(collector.SOURCES)
+    unknown = [n for n in names if n not in collector.SOURCES]
+    if unknown:
+        print(f"[ERROR] ไม่รู้จักแหล่งข้อมูล: {', '.join(unknown)} (มี: {', '.join(collector.SOURCES)})")
+        return 2
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+    run(names)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+sidecar index รายวันสำหรับ log CSV (ใช้กับ historical_log.csv)
+
+ไฟล์ <log>.dayidx เป็น record ขนาดคงที่ 1 record ต่อ 1 วันปฏิทิน (เวลาไทย)
+ตำแหน่ง record = (วัน - วันแรก) * RECORD_SIZE จึงอ่าน/อัปเดตได้ในเวลาคงที่:
+  start, end   byte offset ของแถวแรกและหลังแถวสุดท้ายของวันนั้นใน CSV
+  count        จำนวนแถวของวันนั้น
+  last_ts      เวลาแถวล่าสุดของวัน (epoch µs) และ last_value ค่าตัวเลขของแถวนั้น
+
+การหาค่าใกล้เวลาเป้าหมาย (เช่น 1, 2, 5 ปีที่แล้ว; CsvStore.nearest) และการอ่านช่วงเวลา
+(CsvStore.range ที่ระบุทั้ง start/end) จึงอ่านเฉพาะแถวของวันที่ทับช่วง ไม่ต้องสแกนทั้งไฟล์
+ส่วนวันที่ถูกย้ายเข้าคลัง (archive.py) จะไม่มี record ใน index
+
+header เก็บขนาด CSV ที่ index ครอบคลุมแล้ว ถ้าไม่ตรงกับไฟล์จริง (เช่น CSV มาจาก git pull
+หรือถูก compact) จะ rebuild อัตโนมัติก่อนใช้งาน
+
+index ไม่ถูก commit (.gitignore) จึงคุ้มเฉพาะเครื่องที่รันต่อเนื่องด้วย backend csv (เช่น daemon.py)
+ที่ index สร้างครั้งเดียวแล้วอัปเดตทีละแถว workflow บน CI ใช้ backend partitioned
+(STORAGE_BACKEND=partitioned) ซึ่งค้นหาผ่าน manifest รายเดือนและไม่แตะ index นี้เลย
+
+ใช้งาน:
+  python dayindex.py rebuild [series ...]   # สร้าง index ใหม่จาก CSV ด้วยการอ่านรอบเดียว
+"""
+import os
+import sys
+import struct
+from datetime import datetime, timedelta
+
+from storage import SERIES, TIMEZONE_THAILAND, parse_ts
+
+# --- ค่าคงที่ ---
+MAGIC = b"DIX1"
+HEADER = struct.Struct("<4siq")         # magic, วันแรก (ordinal), ขนาด CSV ที่ index ครอบคลุมแล้ว
+RECORD = struct.Struct("<qqiqd")        # start, end, count, last_ts_us, last_value
+EMPTY = (0, 0, 0, 0, float("nan"))
+
+
+def index_path(series):
+    return SERIES[series]["file"] + ".dayidx"
+
+
+def _local_day(dt):
+    return dt.astimezone(TIMEZONE_THAILAND).date().toordinal()
+
+
+def _parse_value(text):
+    try:
+        return float(text.replace(",", "").replace("cms", "").strip())
+    except ValueError:
+        return float("nan")
+
+
+def _split(line, ncols):
+    parts = line.split(",", ncols)
+    return parts[0], parts[1:]
+
+
+class DayIndex:
+    def __init__(self, series):
+        self.series = series
+        self.path = index_path(series)
+        self.ncols = len(SERIES[series]["columns"])
+
+    # ── อ่าน/เขียน record ──
+    def _header(self, f):
+        f.seek(0)
+        magic, base, covered = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: ไม่ใช่ไฟล์ day index")
+        return base, covered
+
+    def covered(self):
+        """ขนาด CSV (bytes) ที่ index ครอบคลุม หรือ None ถ้ายังไม่มี index"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                return self._header(f)[1]
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def ensure_fresh(self):
+        """rebuild ถ้า index ไม่มีหรือไม่ตรงกับขนาด CSV ปัจจุบัน"""
+        csv_path = SERIES[self.series]["file"]
+        size = os.path.getsize(csv_path) if os.path.exists(csv_path) else 0
+        if self.covered() != size:
+            self.rebuild()
+
+    def read(self, day):
+        """คืน record ของวัน (ordinal) หรือ None ถ้าไม่มีข้อมูลวันนั้น"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            base, _ = self._header(f)
+            if day < base:
+                return None
+            f.seek(HEADER.size + (day - base) * RECORD.size)
+            raw = f.read(RECORD.size)
+        if len(raw) < RECORD.size:
+            return None
+        rec = RECORD.unpack(raw)
+        return rec if rec[2] else None
+
+    def _write(self, day, rec, covered):
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, day, 0))
+        with open(self.path, "r+b") as f:
+            base, _ = self._header(f)
+            if day < base:
+                raise ValueError("วันก่อนวันแรกของ index")
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            pos = HEADER.size + (day - base) * RECORD.size
+            if pos > size:
+                # เติม record ว่างสำหรับวันที่ไม่มีข้อมูล
+                f.write(RECORD.pack(*EMPTY) * ((pos - size) // RECORD.size))
+            f.seek(pos)
+            f.write(RECORD.pack(*rec))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, base, covered))
+
+    # ── อัปเดตแบบ incremental ──
+    def record_append(self, offset, end, dt, values):
+        """เรียกหลัง append 1 แถวที่ byte offset..end ของ CSV"""
+        if self.covered() != offset:
+            # มีแถวที่ index ยังไม่รู้จัก → อ่านใหม่ทั้งไฟล์ครั้งเดียว (รวมแถวนี้ด้วย)
+            self.rebuild()
+            return
+        day = _local_day(dt)
+        try:
+            rec = self.read(day)
+            value = _parse_value(values[0]) if values else float("nan")
+            if rec is None:
+                rec = (offset, end, 1, 0, value)
+            else:
+                rec = (rec[0], end, rec[2] + 1, 0, value)
+            self._write(day, (rec[0], rec[1], rec[2], int(dt.timestamp() * 1_000_000), rec[4]), end)
+        except (OSError, ValueError, struct.error) as e:
+            # index เสีย/ย้อนวัน → สร้างใหม่ทั้งไฟล์ ข้อมูลจริงอยู่ใน CSV อยู่แล้ว
+            print(f"[WARN] อัปเดต {self.path} ไม่สำเร็จ ({e}) → rebuild")
+            self.rebuild()
+
+    def rebuild(self):
+        """สร้าง index ใหม่จาก CSV ด้วยการอ่านไฟล์รอบเดียว คืนจำนวนวันที่มีข้อมูล"""
+        csv_path = SERIES[self.series]["file"]
+        tmp = self.path + ".tmp"
+        days = {}
+        offset = 0
+        if os.path.exists(csv_path):
+            with open(csv_path, "rb") as f:
+                for raw in f:
+                    end = offset + len(raw)
+                    try:
+                        ts_text, values = _split(raw.decode("utf-8").rstrip("\n"), self.ncols)
+                        dt = parse_ts(ts_text)
+                    except (ValueError, UnicodeDecodeError):
+                        offset = end
+                        continue
+                    day = _local_day(dt)
+                    value = _parse_value(values[0]) if values else float("nan")
+                    prev = days.get(day)
+                    start = prev[0] if prev else offset
+                    count = prev[2] + 1 if prev else 1
+                    days[day] = (start, end, count, int(dt.timestamp() * 1_000_000), value)
+                    offset = end
+
+        base = min(days) if days else _local_day(datetime.now(TIMEZONE_THAILAND))
+        last = max(days) if days else base - 1
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, base, offset))
+            for day in range(base, last + 1):
+                f.write(RECORD.pack(*days.get(day, EMPTY)))
+        os.replace(tmp, self.path)
+        return len(days)
+
+    # ── ค้นหา ──
+    def rows(self, start, end):
+        """แถว (datetime, [ค่า]) ในช่วง [start, end] เรียงตามเวลา โดยอ่านเฉพาะวันที่ทับช่วงนั้นจาก CSV"""
+        self.ensure_fresh()
+        spans = [rec for rec in (self.read(d) for d in range(_local_day(start), _local_day(end) + 1)) if rec]
+        found = []
+        if not spans:
+            return found
+        csv_path = SERIES[self.series]["file"]
+        with open(csv_path, "rb") as f:
+            for begin, stop, *_ in spans:
+                f.seek(begin)
+                for raw in f.read(stop - begin).splitlines():
+                    try:
+                        ts_text, values = _split(raw.decode("utf-8"), self.ncols)
+                        dt = parse_ts(ts_text)
+                    except (ValueError, UnicodeDecodeError):
+                        continue
+                    if start <= dt <= end:
+                        found.append((dt, values))
+        return found
+
+    def nearest(self, target, tolerance=timedelta(hours=12)):
+        """
+        หาแถวใน CSV ที่ใกล้ target ที่สุดภายใน tolerance โดยอ่านเฉพาะวันที่เกี่ยวข้อง
+        คืน (datetime, [ค่า]) หรือ None
+        """
+        best, best_diff = None, timedelta.max
+        for dt, values in self.rows(target - tolerance, target + tolerance):
+            diff = abs(target - dt)
+            if diff < best_diff:
+                best_diff, best = diff, (dt, values)
+        return best
+
+
+def years_ago(dt, years):
+    """วันเวลาเดียวกันเมื่อ N ปีที่แล้ว (29 ก.พ. → 28 ก.พ.)"""
+    try:
+        return dt.replace(year=dt.year - years)
+    except ValueError:
+        return dt.replace(year=dt.year - years, day=28)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "rebuild":
+        print("usage: python dayindex.py rebuild [series ...]")
+        return 2
+    for series in argv[1:] or [s for s, cfg in SERIES.items() if cfg.get("day_index")]:
+        n = DayIndex(series).rebuild()
+        print(f"[INFO] สร้าง {index_path(series)} เรียบร้อย ({n} วัน)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
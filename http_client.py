@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+HTTP session กลางที่ใช้ร่วมกันทุก collector
+
+ใช้ requests.Session ตัวเดียวต่อ process เพื่อให้ connection (TCP/TLS) ถูก reuse
+ทั้งเมื่อรันสคริปต์เดี่ยว และเมื่อรันหลายแหล่งพร้อมกันจาก collector.py
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+POOL_SIZE = 10
+
+_session = None
+
+
+def get_session() -> requests.Session:
+    """คืน Session ที่มี connection pool (สร้างครั้งเดียวต่อ process)"""
+    global _session
+    if _session is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        s.headers["User-Agent"] = DEFAULT_USER_AGENT
+        _session = s
+    return _session
+
+
+def close_session():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
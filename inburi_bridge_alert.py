@@ -1,30 +1,48 @@
 #!/usr/bin/env python3
 import os
 import json
+import math
+import atexit
 import requests
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
-import pandas as pd
+
+import line_delivery
+import metrics
+import upstream
+from rise_detector import RiseDetector, format_event
+from storage import get_store
 
 # -------- CONFIGURATION --------
 DATA_FILE         = "inburi_bridge_data.json"
 DEFAULT_THRESHOLD = 0.1   # เมตร (10 ซม.)
 INBURI_LOG_FILE   = "inburi_log.csv"
+ALERT_LOG_FILE    = "inburi_alerts.jsonl"
+WARMUP_HOURS      = 48      # ไม่มี state ของ detector: ป้อนค่าย้อนหลังจาก log ช่วงนี้ก่อน
 
 # ENV FLAGS
 DRY_RUN        = os.getenv("DRY_RUN", "").lower() in ("1", "true")
+# การแจ้งเตือนปกติส่งจาก daily summary; เปิดตัวนี้เพื่อส่งเหตุการณ์น้ำขึ้นผ่าน LINE ทันที
+RISE_ALERT_LINE = os.getenv("RISE_ALERT_LINE", "").lower() in ("1", "true")
 USE_LOCAL_HTML = os.getenv("USE_LOCAL_HTML", "").lower() in ("1", "true")
 LOCAL_HTML     = os.getenv("LOCAL_HTML_PATH", "page.html")
+# api      = อ่าน JSON feed ที่หน้า /wl ใช้โดยตรง (เร็ว ไม่ต้องเปิด Chrome) แล้ว fallback เป็น Selenium
+# selenium = เปิด headless Chrome เสมอ (driver ถูก reuse ภายใน process เดียวกัน)
+FETCH_BACKEND  = os.getenv("FETCH_BACKEND", "api").lower()
+# stream = HTMLParser ที่อ่านเฉพาะตารางสถานีแล้วหยุดทันทีเมื่อเจอสถานีที่ต้องการครบ
+# bs4    = สร้าง BeautifulSoup tree ทั้งหน้า (แบบเดิม)
+HTML_PARSER    = os.getenv("HTML_PARSER", "stream").lower()
+
+SELENIUM_MIN_BUDGET = 5   # วินาที: budget ที่เหลือน้อยกว่านี้ไม่คุ้มเปิด/รอ Chrome
+
+STATION_NAME = "อินทร์บุรี"
+WL_PAGE_URL  = os.getenv("WL_PAGE_URL", "https://singburi.thaiwater.net/wl")
+WL_API_URL   = os.getenv(
+    "WL_API_URL",
+    "https://api-v3.thaiwater.net/api/v1/thaiwater30/public/waterlevel_load",
+)
 
 # Read threshold from env (meters)
 _raw = os.getenv("NOTIFICATION_THRESHOLD_M", "")
@@ -67,76 +85,361 @@ def send_line_message(msg: str):
     #     print(f"[ERROR] ส่ง LINE ล้มเหลว: {resp.status_code} {resp.text}")
 
 
-def fetch_rendered_html(url: str, timeout: int = 15) -> str:
-    """โหลดหน้าเว็บด้วย Selenium หรือจากไฟล์ mock"""
-    if USE_LOCAL_HTML:
-        print(f"[INFO] USE_LOCAL_HTML=TRUE, อ่านจากไฟล์ '{LOCAL_HTML}'")
-        with open(LOCAL_HTML, "r", encoding="utf-8") as f:
-            return f.read()
+# ชื่อ field สถานการณ์ที่ feed อาจส่งมาเป็นข้อความ (badge บนหน้าเว็บคำนวณฝั่ง browser ไม่ได้อยู่ใน feed)
+SITUATION_KEYS = ("situation", "situation_text", "waterlevel_situation")
+
+
+def _situation(row):
+    """ข้อความสถานการณ์จาก feed ถ้ามี ไม่เช่นนั้น 'N/A' (ไม่เดาจาก storage_percent)"""
+    for key in SITUATION_KEYS:
+        value = row.get(key)
+        if isinstance(value, dict):
+            value = value.get("th")
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return "N/A"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_api_data(station_name: str = STATION_NAME, timeout: int = 10):
+    """อ่านข้อมูลสถานีจาก JSON feed ของ thaiwater โดยตรง (ไม่ต้อง render JS)"""
+    try:
+        with metrics.stage("inburi.api_fetch"):
+            resp = upstream.get("thaiwater", WL_API_URL, timeout=timeout,
+                                headers={"Referer": WL_PAGE_URL, "Accept": "application/json"})
+            resp.raise_for_status()
+            payload = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"[WARN] ดึง water level API ไม่สำเร็จ: {e}")
+        return None
+
+    rows = payload.get("waterlevel_data", {}).get("data", []) if isinstance(payload, dict) else []
+    for row in rows:
+        station = row.get("station") or {}
+        name = (station.get("tele_station_name") or {}).get("th", "")
+        if station_name not in name:
+            continue
+
+        water_level = _to_float(row.get("waterlevel_msl"))
+        # ตลิ่งของสถานีมีสองฝั่ง ใช้ฝั่งที่ต่ำกว่าเพราะน้ำล้นฝั่งนั้นก่อน (below_bank จึงเป็นระยะที่เหลือน้อยที่สุด)
+        banks = [b for b in (_to_float(station.get("left_bank")), _to_float(station.get("right_bank")))
+                 if b is not None]
+        bank_level = min(banks) if banks else None
+        below_bank = None
+        if water_level is not None and bank_level is not None:
+            below_bank = round(bank_level - water_level, 2)
+
+        report_time_str = ""
+        dt_text = row.get("waterlevel_datetime") or ""
+        if len(dt_text) >= 16:
+            report_time_str = f"{dt_text[11:16]} น."
+
+        print(f"[DEBUG] API water={water_level}, bank={bank_level}, below={below_bank}, time={report_time_str}")
+        return {
+            "station_name": station_name,
+            "water_level":  water_level,
+            "bank_level":   bank_level,
+            "status":       _situation(row),
+            "below_bank":   below_bank,
+            "time":         report_time_str,
+        }
+    print(f"[WARN] ไม่พบสถานี {station_name} ใน water level API")
+    return None
+
+
+_driver = None
+
+
+def _get_driver():
+    """สร้าง headless Chrome ครั้งเดียวต่อ process แล้ว reuse ในรอบถัดไป"""
+    global _driver
+    if _driver is not None:
+        return _driver
+
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
 
     opts = Options()
     opts.add_argument("--headless")
     opts.add_argument("--no-sandbox")
     opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.page_load_strategy = "eager"
 
-    driver = webdriver.Chrome(
+    _driver = webdriver.Chrome(
         service=Service(ChromeDriverManager().install()),
         options=opts
     )
-    driver.get(url)
+    atexit.register(close_driver)
+    return _driver
+
+
+def close_driver():
+    global _driver
+    if _driver is not None:
+        try:
+            _driver.quit()
+        except Exception:
+            pass
+        _driver = None
+
+
+def fetch_rendered_html(url: str, timeout: int = 15) -> str:
+    """โหลดหน้าเว็บด้วย Selenium หรือจากไฟล์ mock"""
+    if USE_LOCAL_HTML:
+        print(f"[INFO] USE_LOCAL_HTML=TRUE, อ่านจากไฟล์ '{LOCAL_HTML}'")
+        with open(LOCAL_HTML, "r", encoding="utf-8") as f:
+            return f.read()
+
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # ไม่รอเกิน latency budget ที่เหลือของรอบนี้
+    timeout = max(1, min(timeout, upstream.remaining()))
+    driver = _get_driver()
+    driver.set_page_load_timeout(timeout)
     try:
+        driver.get(url)
         WebDriverWait(driver, timeout).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, "th[scope='row']"))
         )
     except Exception:
+        # หน้าโหลดไม่ครบภายในเวลา: ใช้เท่าที่ได้ (parser จะคืน N/A ถ้าไม่มีตาราง)
         print("[WARN] Selenium timeout รอ table JS โหลด")
-    html = driver.page_source
-    driver.quit()
-    return html
+    return driver.page_source
 
 
-def get_water_data():
-    """Parse ข้อมูลสถานี 'อินทร์บุรี' จาก HTML"""
-    print("[DEBUG] ดึง HTML จากเว็บ...")
-    html = fetch_rendered_html("https://singburi.thaiwater.net/wl")
-    print(f"[DEBUG] HTML length = {len(html)} chars")
+def _to_level(text):
+    return float(text) if text and text.replace('.', '', 1).isdigit() else None
+
+
+def _station_record(station_name, water_level_str, bank_level_str, status_str, report_time_str):
+    """แปลงข้อความจากแถวของตารางสถานีเป็น dict ผลลัพธ์ (ใช้ร่วมกันทั้ง 2 parser)"""
+    water_level = _to_level(water_level_str)
+    bank_level  = _to_level(bank_level_str)
+
+    below_bank = None
+    if water_level is not None and bank_level is not None:
+        below_bank = round(bank_level - water_level, 2)
 
+    print(f"[DEBUG] Parsed {station_name}: water={water_level}, bank={bank_level}, status={status_str}, below={below_bank}, time={report_time_str}")
+    return {
+        "station_name": station_name,
+        "water_level":   water_level,
+        "bank_level":    bank_level,
+        "status":        status_str,
+        "below_bank":    below_bank,
+        "time":          report_time_str,
+    }
+
+
+def parse_stations_bs4(html: str, station_names):
+    """Parse ด้วย BeautifulSoup (สร้าง tree ทั้งหน้า) คืน {ชื่อสถานี: dict} เฉพาะสถานีที่พบ"""
+    from bs4 import BeautifulSoup
+
+    found = {}
     soup = BeautifulSoup(html, "html.parser")
     for th in soup.select("th[scope='row']"):
-        if "อินทร์บุรี" in th.get_text(strip=True):
+        text = th.get_text(strip=True)
+        for name in station_names:
+            if name in found or name not in text:
+                continue
             tr   = th.find_parent("tr")
             cols = tr.find_all("td")
-
-            # ดึงข้อมูลและแปลงเป็น float/string
-            water_level_str = cols[1].get_text(strip=True)
-            bank_level_str  = cols[2].get_text(strip=True)
             status_span = tr.select_one("span.badge")
-            status_str = status_span.get_text(strip=True) if status_span else 'N/A' # แก้ไขตรงนี้
-            report_time_str = cols[6].get_text(strip=True)
-
-            # พยายามแปลงเป็น float หากมีค่า
-            water_level = float(water_level_str) if water_level_str and water_level_str.replace('.', '', 1).isdigit() else None
-            bank_level  = float(bank_level_str) if bank_level_str and bank_level_str.replace('.', '', 1).isdigit() else None
-
-            below_bank = None
-            if water_level is not None and bank_level is not None:
-                below_bank = round(bank_level - water_level, 2)
-
-            print(f"[DEBUG] Parsed water={water_level}, bank={bank_level}, status={status_str}, below={below_bank}, time={report_time_str}")
-            return {
-                "station_name": "อินทร์บุรี",
-                "water_level":   water_level,
-                "bank_level":    bank_level,
-                "status":        status_str,
-                "below_bank":    below_bank,
-                "time":          report_time_str,
-            }
-    print("[ERROR] ไม่พบข้อมูลสถานี อินทร์บุรี ใน HTML")
-    return None
+            found[name] = _station_record(
+                name,
+                cols[1].get_text(strip=True),
+                cols[2].get_text(strip=True),
+                status_span.get_text(strip=True) if status_span else 'N/A',
+                cols[6].get_text(strip=True),
+            )
+    return found
 
 
-def main():
-    print("=== เริ่ม inburi_bridge_alert ===")
+class _Done(Exception):
+    pass
+
+
+class StationTableParser(HTMLParser):
+    """
+    อ่าน HTML แบบ streaming เก็บเฉพาะข้อความของ <th scope="row">, <td> และ <span class="badge">
+    ในแถว <tr> แล้วหยุด (raise _Done) ทันทีที่ได้สถานีครบ หรือเมื่อตารางที่มีแถวสถานีปิดลง
+    จึงไม่ต้องอ่าน/สร้าง tree ของเนื้อหาส่วนที่เหลือของหน้า
+    """
+
+    def __init__(self, station_names):
+        super().__init__(convert_charrefs=True)
+        self.pending = list(station_names)
+        self.found = {}
+        self.row = None          # {"th": [...], "cells": [[...], ...], "badge": [...]}
+        self.cell = None
+        self.badge = None
+        self.seen_rows = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._finish_row()
+            self.row = {"th": None, "cells": [], "badge": None}
+        elif self.row is None:
+            return
+        elif tag == "th" and ("scope", "row") in attrs:
+            self.cell = self.row["th"] = []
+            self.seen_rows = True
+        elif tag == "td":
+            self.cell = []
+            self.row["cells"].append(self.cell)
+        elif tag == "span" and self.row["badge"] is None and "badge" in (dict(attrs).get("class") or "").split():
+            self.badge = self.row["badge"] = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th"):
+            self.cell = None
+        elif tag == "span":
+            self.badge = None
+        elif tag == "tr":
+            self._finish_row()
+        elif tag == "table" and self.seen_rows:
+            self._finish_row()
+            raise _Done
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data.strip())
+        if self.badge is not None:
+            self.badge.append(data.strip())
+
+    def _finish_row(self):
+        row, self.row, self.cell, self.badge = self.row, None, None, None
+        if not row or row["th"] is None:
+            return
+        text = "".join(row["th"])
+        cols = ["".join(cell) for cell in row["cells"]]
+        for name in [n for n in self.pending if n in text]:
+            self.pending.remove(name)
+            if len(cols) < 7:
+                continue
+            status = "".join(row["badge"]) if row["badge"] is not None else 'N/A'
+            self.found[name] = _station_record(name, cols[1], cols[2], status, cols[6])
+        if not self.pending:
+            raise _Done
+
+
+def parse_stations(html: str, station_names):
+    """อ่านหลายสถานีจากหน้า /wl ในรอบเดียว คืน {ชื่อสถานี: dict} เฉพาะสถานีที่พบ"""
+    if HTML_PARSER == "bs4":
+        return parse_stations_bs4(html, station_names)
+    parser = StationTableParser(station_names)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    return parser.found
+
+
+def parse_station_html(html: str, station_name: str = STATION_NAME):
+    """Parse ข้อมูลสถานีจาก HTML ของหน้า /wl"""
+    data = parse_stations(html, [station_name]).get(station_name)
+    if data is None:
+        print(f"[ERROR] ไม่พบข้อมูลสถานี {station_name} ใน HTML")
+    return data
+
+
+def load_last_good():
+    """ค่าล่าสุดที่ดึงได้จาก DATA_FILE ในรูปแบบเดียวกับ get_water_data พร้อม "stale": True (หรือ None)"""
+    try:
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            last = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if last.get("water_level") is None:
+        return None
+    last.pop("detector", None)
+    return dict(last, stale=True)
+
+
+def get_water_data():
+    """
+    ดึงข้อมูลสถานี 'อินทร์บุรี' (API ก่อน แล้ว fallback เป็น HTML ที่ render ด้วย Selenium)
+    ถ้า circuit breaker ของ API เปิดอยู่ จะคืนค่าล่าสุดที่ดึงได้ (stale) แทนการเปิด Selenium
+    """
+    if not USE_LOCAL_HTML and FETCH_BACKEND == "api":
+        print("[DEBUG] ดึงข้อมูลจาก water level API...")
+        data = fetch_api_data(STATION_NAME)
+        if data:
+            return data
+        stale = load_last_good() if upstream.is_open("thaiwater") else None
+        if stale:
+            print("[WARN] circuit breaker ของ thaiwater เปิดอยู่ → ใช้ค่าล่าสุดที่ดึงได้ (stale)")
+            metrics.count("inburi.stale")
+            return stale
+        print("[WARN] API ใช้ไม่ได้ → fallback เป็น Selenium")
+
+    if not USE_LOCAL_HTML and upstream.remaining() < SELENIUM_MIN_BUDGET:
+        print(f"[WARN] latency budget เหลือ {upstream.remaining():.1f}s ไม่พอสำหรับ Selenium → ข้าม")
+        metrics.count("inburi.selenium_skipped")
+        return None
+
+    print("[DEBUG] ดึง HTML จากเว็บ...")
+    with metrics.stage("inburi.selenium_render"):
+        html = fetch_rendered_html(WL_PAGE_URL)
+    print(f"[DEBUG] HTML length = {len(html)} chars")
+    with metrics.stage("inburi.parse"):
+        return parse_station_html(html, STATION_NAME)
+
+
+def append_to_inburi_log(now, values):
+    """บันทึก 1 แถวลง inburi log ผ่าน storage backend"""
+    with metrics.stage("inburi.csv_write"):
+        get_store().append("inburi", now, values)
+
+
+def load_detector(last_data, now):
+    """
+    คืน RiseDetector จาก state ของรอบก่อนใน DATA_FILE
+    ถ้าไม่มี (รันครั้งแรก / runner ใหม่) จะป้อนค่าจาก log ย้อนหลัง WARMUP_HOURS ชม. แทน
+    """
+    detector = RiseDetector(last_data.get("detector"), jump_threshold=NOTIFICATION_THRESHOLD)
+    if detector.state["ts"] is None:
+        # เหตุการณ์จากการ warm up เป็นของเก่า ไม่แจ้งซ้ำ
+        for ts, values in get_store().range("inburi", now - timedelta(hours=WARMUP_HOURS), now):
+            detector.update(ts, values[0], values[3] if len(values) > 3 else None)
+        print(f"[DEBUG] warm up detector จาก log {detector.state['count']} ค่า")
+    return detector
+
+
+def handle_events(events):
+    """บันทึกเหตุการณ์จาก detector ลง ALERT_LOG_FILE (1 บรรทัด JSON ต่อเหตุการณ์) และส่ง LINE ถ้าเปิดไว้"""
+    if not events:
+        print("[INFO] ไม่มีการแจ้งเตือนในรอบนี้")
+        return
+    for event in events:
+        print(f"[ALERT] {json.dumps(event, ensure_ascii=False)}")
+        metrics.count(f"inburi.alert.{event['type']}")
+    with open(ALERT_LOG_FILE, "a", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    texts = [format_event(event) for event in events]
+    if DRY_RUN:
+        print("[DRY‑RUN] would send:\n" + "\n\n".join(texts))
+    elif RISE_ALERT_LINE and line_delivery.has_credentials():
+        line_delivery.enqueue(texts)
+        line_delivery.flush()
+
+
+def process_data(data):
+    """บันทึกผลที่ดึงได้ลง inburi log และ state (รวมกรณีดึงไม่สำเร็จ)"""
     print(f"[INFO] Using NOTIFICATION_THRESHOLD = {NOTIFICATION_THRESHOLD:.2f} m")
 
     # โหลดข้อมูลเก่า (state)
@@ -146,19 +449,17 @@ def main():
             last_data = json.load(f)
         print(f"[DEBUG] last_data = {last_data}")
 
-    data = get_water_data()
-    if not data:
-        # หากดึงข้อมูลไม่ได้ ก็ยังคงบันทึกข้อผิดพลาดใน log
+    if not data or data.get("stale"):
+        # หากดึงข้อมูลไม่ได้ (หรือได้แค่ค่าเดิมที่ stale) ก็ยังคงบันทึกข้อผิดพลาดใน log
         TZ_TH = pytz.timezone('Asia/Bangkok')
         now_th = datetime.now(TZ_TH)
-        with open(INBURI_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{now_th.isoformat()},N/A,N/A,N/A,N/A,N/A\n")
+        append_to_inburi_log(now_th, ["N/A"] * 5)
         print(f"[INFO] อัปเดต {INBURI_LOG_FILE} เรียบร้อย (มีข้อผิดพลาดในการดึงข้อมูล)")
         return
 
     # ตรวจสอบว่ามีค่า water_level ที่ถูกต้องหรือไม่
     current_water_level = data.get("water_level")
-    if current_water_level is None or pd.isna(current_water_level):
+    if current_water_level is None or math.isnan(current_water_level):
         print("WARN: ไม่สามารถดึงค่า water_level ที่ถูกต้องได้จากหน้าเว็บ")
         TZ_TH = pytz.timezone('Asia/Bangkok')
         now_th = datetime.now(TZ_TH)
@@ -167,43 +468,10 @@ def main():
         status_val = data.get('status', 'N/A')
         below_bank_val = data.get('below_bank', 'N/A')
         time_val = data.get('time', 'N/A')
-        with open(INBURI_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{now_th.isoformat()},{water_level_val},{bank_level_val},{status_val},{below_bank_val},{time_val}\n")
+        append_to_inburi_log(now_th, [water_level_val, bank_level_val, status_val, below_bank_val, time_val])
         print(f"[INFO] อัปเดต {INBURI_LOG_FILE} เรียบร้อย (water_level ไม่ถูกต้อง)")
         return
 
-    # ส่วนนี้เป็น logic การแจ้งเตือนที่ถูกปิดการใช้งานแล้ว
-    # prev = last_data.get("water_level")
-    # if prev is None:
-    #     print("[INFO] ไม่มีข้อมูลเก่า, บันทึกแต่ไม่แจ้งครั้งแรก")
-    #     need_alert = False
-    #     diff       = 0.0
-    #     direction  = ""
-    # else:
-    #     diff = current_water_level - prev
-    #     print(f"[DEBUG] prev={prev:.2f}, new={current_water_level:.2f}, diff={diff:.2f}")
-    #     if abs(diff) >= NOTIFICATION_THRESHOLD:
-    #         direction = "⬆️" if diff > 0 else "⬇️"
-    #         need_alert = True
-    #     else:
-    #         print("[INFO] diff น้อยกว่า threshold, ไม่แจ้ง")
-    #         need_alert = False
-
-    # if need_alert:
-    #     msg = (
-    #         f"📢 แจ้งระดับน้ำ {direction}{abs(diff):.2f} ม. (อินทร์บุรี)\n"
-    #         "══════════════════\n"
-    #         f"🌊 ระดับน้ำ     : {data['water_level']} ม.\n"
-    #         f"🏞️ ระดับตลิ่ง    : {data['bank_level']} ม.\n"
-    #         f"🚦 สถานะ       : {data['status']}\n"
-    #         f"📐 ห่างจากตลิ่ง : {data['below_bank']} ม.\n"
-    #         "───────────────\n"
-    #         f"🕒 เวลา        : {data['time']}"
-    #     )
-    #     send_line_message(msg)
-    # else:
-    #     print("[INFO] ไม่มีการแจ้งเตือนในรอบนี้")
-
     # บันทึกค่าระดับน้ำปัจจุบันลง inburi_log.csv เสมอ
     TZ_TH = pytz.timezone('Asia/Bangkok')
     now_th = datetime.now(TZ_TH)
@@ -214,14 +482,25 @@ def main():
     below_bank_val = data.get('below_bank', 'N/A')
     time_val = data.get('time', 'N/A')
 
-    with open(INBURI_LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{now_th.isoformat()},{water_level_val},{bank_level_val},{status_val},{below_bank_val},{time_val}\n")
+    detector = load_detector(last_data, now_th)
+    with metrics.stage("inburi.detect"):
+        events = detector.update(now_th, current_water_level, data.get('below_bank'))
+    handle_events(events)
+
+    append_to_inburi_log(now_th, [water_level_val, bank_level_val, status_val, below_bank_val, time_val])
     print(f"[INFO] อัปเดต {INBURI_LOG_FILE} เรียบร้อย")
 
-    # บันทึก state เสมอ
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # บันทึก state เสมอ (รวม state ของ detector สำหรับรอบถัดไป)
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(data, detector=detector.state), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, DATA_FILE)
+
 
+@metrics.instrumented("inburi_bridge_alert")
+def main():
+    print("=== เริ่ม inburi_bridge_alert ===")
+    process_data(get_water_data())
     print("=== จบ inburi_bridge_alert ===")
 
 
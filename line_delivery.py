@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+ระบบส่งข้อความ LINE ที่ใช้ร่วมกันระหว่าง scraper และ summary_report
+
+- ข้อความถูกเขียนลง outbox บนดิสก์ก่อนเสมอ (enqueue) แล้วจึงส่ง (flush)
+  ถ้าส่งไม่สำเร็จจะค้างอยู่ใน outbox และถูกส่งซ้ำในรอบถัดไป
+- ใช้ HTTP session กลาง (keep-alive) และรวมข้อความที่มีผู้รับชุดเดียวกันได้สูงสุด 5 ข้อความต่อ request
+- ผู้รับหลายคน (LINE_TARGET_ID คั่นด้วย ,) ที่เป็น user ID จะส่งด้วย multicast ครั้งเดียว
+  ส่วน group/room ID ส่งด้วย push ทีละปลายทาง
+- เคารพ 429 / Retry-After และเว้นระยะขั้นต่ำระหว่าง request
+- 4xx อื่น (เช่น token หมดอายุ 401/403) ไม่ทิ้งข้อความ: แจ้ง [ERROR] แล้วค้างไว้ส่งซ้ำจนกว่าจะเกิน
+  MAX_ATTEMPTS / MAX_AGE เพื่อให้แก้ secret แล้วข้อความที่ค้างยังส่งออกได้
+  ถ้าชุดถูกปฏิเสธด้วย 4xx ที่ไม่ใช่ token จะส่งทีละข้อความ เพื่อไม่ให้ข้อความที่ผิดข้อความเดียวค้างทั้งชุด
+- flush_async() ส่งใน thread แยก เพื่อไม่ให้การเก็บข้อมูลต้องรอ network ของ LINE
+
+ใช้งาน:
+  python line_delivery.py flush     # ส่งข้อความที่ค้างใน outbox
+  python line_delivery.py status    # ดูจำนวนข้อความที่ค้าง
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import metrics
+from http_client import get_session
+
+# --- ค่าคงที่ ---
+LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')
+LINE_TARGET_IDS = [t.strip() for t in os.environ.get('LINE_TARGET_ID', '').split(',') if t.strip()]
+LINE_API_BASE = os.getenv('LINE_API_BASE', 'https://api.line.me')
+OUTBOX_FILE = os.getenv('LINE_OUTBOX_PATH', 'line_outbox.json')
+
+MAX_MESSAGES_PER_REQUEST = 5      # ข้อจำกัดของ LINE Messaging API
+MAX_MULTICAST_TARGETS = 500
+MIN_INTERVAL = float(os.getenv('LINE_MIN_INTERVAL', '0.1'))   # วินาทีขั้นต่ำระหว่าง request
+MAX_ATTEMPTS = 20
+MAX_AGE = 2 * 24 * 3600           # ทิ้งข้อความที่ค้างนานเกิน 2 วัน
+DEFAULT_RETRY_AFTER = 60          # วินาที เมื่อ 429 ไม่มี Retry-After หรืออ่านค่าไม่ได้
+AUTH_STATUS = (401, 403)          # token ใช้ไม่ได้: ทุกข้อความจะล้มเหลวเหมือนกัน จึงหยุดทั้งรอบ
+REQUEST_TIMEOUT = 10
+
+_lock = threading.Lock()         # ป้องกันการอ่าน/เขียน outbox ชนกัน
+_flush_lock = threading.Lock()   # ให้ flush ทำงานทีละรอบ จะได้ไม่ส่งข้อความเดียวกันซ้ำ
+_last_request = 0.0
+_threads = []
+
+
+def has_credentials():
+    return bool(LINE_CHANNEL_ACCESS_TOKEN and LINE_TARGET_IDS)
+
+
+# ── outbox ──
+def load_outbox():
+    if not os.path.exists(OUTBOX_FILE):
+        return []
+    try:
+        with open(OUTBOX_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"[WARN] อ่าน {OUTBOX_FILE} ไม่ได้ เริ่ม outbox ใหม่")
+        return []
+
+
+def save_outbox(entries):
+    if os.path.dirname(OUTBOX_FILE):
+        os.makedirs(os.path.dirname(OUTBOX_FILE), exist_ok=True)
+    tmp = OUTBOX_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, OUTBOX_FILE)
+
+
+def enqueue(texts, targets=None):
+    """เพิ่มข้อความ (str หรือ list ของ str) ลง outbox คืนจำนวนข้อความที่เพิ่ม"""
+    if isinstance(texts, str):
+        texts = [texts]
+    targets = list(targets or LINE_TARGET_IDS)
+    if not targets:
+        print("[WARN] ไม่มี LINE_TARGET_ID ข้ามการเพิ่มข้อความ")
+        return 0
+    now = time.time()
+    with _lock:
+        entries = load_outbox()
+        for text in texts:
+            entries.append({
+                'id': uuid.uuid4().hex,
+                'to': targets,
+                'message': {'type': 'text', 'text': text},
+                'created': now,
+                'attempts': 0,
+                'next_attempt': 0,
+            })
+        save_outbox(entries)
+    return len(texts)
+
+
+# ── การส่ง ──
+def _throttle():
+    global _last_request
+    wait = _last_request + MIN_INTERVAL - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+    _last_request = time.monotonic()
+
+
+def _requests_for(targets, messages):
+    """แปลงผู้รับ 1 ชุดเป็นรายการ (endpoint, payload)"""
+    users = [t for t in targets if t.startswith('U')]
+    others = [t for t in targets if not t.startswith('U')]
+    calls = []
+    if len(users) == 1:
+        others = users + others
+    elif users:
+        for i in range(0, len(users), MAX_MULTICAST_TARGETS):
+            calls.append(('/v2/bot/message/multicast', {'to': users[i:i + MAX_MULTICAST_TARGETS], 'messages': messages}))
+    for target in others:
+        calls.append(('/v2/bot/message/push', {'to': target, 'messages': messages}))
+    return calls
+
+
+def _post(path, payload, session):
+    _throttle()
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {LINE_CHANNEL_ACCESS_TOKEN}',
+    }
+    with metrics.stage('line.push'):
+        return session.post(LINE_API_BASE + path, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+
+
+def _retry_after(value, now):
+    """วินาทีที่ต้องรอตาม header Retry-After (จำนวนวินาทีหรือ HTTP-date)"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def _batches(entries):
+    """รวมข้อความที่อยู่ติดกันและมีผู้รับชุดเดียวกันเป็นชุดละไม่เกิน 5 ข้อความ"""
+    batch = []
+    for entry in entries:
+        if batch and (entry['to'] != batch[0]['to'] or len(batch) >= MAX_MESSAGES_PER_REQUEST):
+            yield batch
+            batch = []
+        batch.append(entry)
+    if batch:
+        yield batch
+
+
+def _deliver(batch, session, now):
+    """
+    ส่งข้อความชุดหนึ่งให้ผู้รับทุกปลายทาง คืน (สำเร็จ, retry_after, status ของ 4xx ที่ไม่ใช่ token)
+    retry_after ไม่เป็น None เมื่อต้องหยุดทั้งรอบ (429 หรือ token ใช้ไม่ได้)
+    """
+    messages = [e['message'] for e in batch]
+    for path, payload in _requests_for(batch[0]['to'], messages):
+        try:
+            resp = _post(path, payload, session)
+        except requests.exceptions.RequestException as e:
+            print(f"ส่งข้อความ LINE ไม่สำเร็จ: {e}")
+            return False, None, None
+        if resp.status_code == 429:
+            return False, _retry_after(resp.headers.get('Retry-After'), now), None
+        if 400 <= resp.status_code < 500:
+            # token/payload/ผู้รับไม่ถูกต้อง: ต้องมีคนแก้ ค้างข้อความไว้ (ไม่ทิ้ง) แล้วแจ้งเตือน
+            print(f"[ERROR] ส่งข้อความ LINE ไม่สำเร็จ: {resp.status_code} {resp.text[:200]} "
+                  f"(ค้าง {len(batch)} ข้อความไว้ใน {OUTBOX_FILE})")
+            metrics.count(f'line.http_{resp.status_code}')
+            if resp.status_code in AUTH_STATUS:
+                return False, DEFAULT_RETRY_AFTER, None
+            return False, None, resp.status_code
+        if resp.status_code >= 500:
+            print(f"ส่งข้อความ LINE ไม่สำเร็จ: {resp.status_code}")
+            return False, None, None
+    return True, None, None
+
+
+def flush(session=None):
+    """ส่งข้อความที่ถึงเวลาใน outbox คืน (ส่งสำเร็จ, ยังค้าง)"""
+    with _flush_lock:
+        return _flush(session)
+
+
+def _flush(session):
+    if not LINE_CHANNEL_ACCESS_TOKEN:
+        print("Missing LINE credentials.")
+        return 0, len(load_outbox())
+    session = session or get_session()
+    now = time.time()
+
+    with _lock:
+        due = [e for e in load_outbox() if e['next_attempt'] <= now]
+
+    # ส่งนอก lock เพื่อให้ enqueue จาก thread อื่นไม่ต้องรอ network
+    done_ids, retry, blocked_until = set(), {}, None
+    for batch in _batches(due):
+        if blocked_until is not None:
+            break
+        ok, retry_after, rejected = _deliver(batch, session, now)
+        if rejected and len(batch) > 1:
+            # 4xx ที่ไม่ใช่ token: อาจเป็นข้อความเดียวในชุดที่ผิด ส่งทีละข้อความให้ที่เหลือออกไปได้
+            print(f"[INFO] ส่งทีละข้อความ {len(batch)} ข้อความ หลังชุดถูกปฏิเสธ ({rejected})")
+            parts = [[e] for e in batch]
+        else:
+            parts = [batch]
+        for part in parts:
+            if part is not batch:
+                if blocked_until is not None:
+                    break
+                ok, retry_after, _ = _deliver(part, session, now)
+            if ok:
+                done_ids.update(e['id'] for e in part)
+                print(f"ส่งข้อความ LINE สำเร็จ: {len(part)} ข้อความ")
+                metrics.count('line.sent', len(part))
+                continue
+            metrics.count('line.retry', len(part))
+            if retry_after is not None:
+                # โดน rate limit หรือ token ใช้ไม่ได้: หยุดรอบนี้แล้วลองใหม่หลัง Retry-After
+                blocked_until = now + retry_after
+            for e in part:
+                attempts = e['attempts'] + 1
+                retry[e['id']] = (attempts, blocked_until or now + min(3600, 30 * 2 ** attempts))
+
+    with _lock:
+        # อ่าน outbox ใหม่ เพื่อรวมข้อความที่ถูก enqueue ระหว่างส่ง
+        remaining = []
+        for e in load_outbox():
+            if e['id'] in done_ids:
+                continue
+            if e['id'] in retry:
+                e['attempts'], e['next_attempt'] = retry[e['id']]
+            if blocked_until is not None:
+                e['next_attempt'] = max(e['next_attempt'], blocked_until)
+            if e['attempts'] >= MAX_ATTEMPTS or now - e['created'] > MAX_AGE:
+                print(f"[WARN] ทิ้งข้อความ LINE {e['id']} หลังลอง {e['attempts']} ครั้ง")
+                metrics.count('line.dropped')
+                continue
+            remaining.append(e)
+        save_outbox(remaining)
+    return len(done_ids), len(remaining)
+
+
+def flush_async(session=None):
+    """เริ่ม flush ใน thread แยก (non-daemon: interpreter จะรอให้ส่งเสร็จก่อนจบ)"""
+    thread = threading.Thread(target=flush, kwargs={'session': session}, name='line-flush')
+    thread.start()
+    # daemon.py เรียกทุกรอบโดยไม่ join: ตัด thread ที่จบแล้วออก ไม่ให้ list โตไม่สิ้นสุด
+    _threads[:] = [t for t in _threads if t.is_alive()]
+    _threads.append(thread)
+    return thread
+
+
+def join_pending(timeout=None):
+    """รอ flush ที่ยังทำงานอยู่ใน background ให้เสร็จ (เช่น ก่อนปิด HTTP session)"""
+    while _threads:
+        _threads.pop().join(timeout)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['flush']:
+        sent, pending = flush()
+        print(f"[INFO] ส่งแล้ว {sent} ข้อความ, ค้าง {pending} ข้อความ")
+        return 0
+    if argv[:1] == ['status']:
+        entries = load_outbox()
+        print(f"[INFO] ค้างใน outbox {len(entries)} ข้อความ")
+        for e in entries:
+            print(f"  {e['id'][:8]} to={','.join(e['to'])} attempts={e['attempts']} "
+                  f"text={e['message']['text'][:40]!r}")
+        return 0
+    print("usage: python line_delivery.py flush | status")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+จับเวลาแต่ละขั้นตอน (HTTP fetch, Selenium render, parse, เขียน CSV, ส่ง LINE ...) และตัวนับ
+ที่ใช้ร่วมกันทุกสคริปต์ แล้วส่งออกเมื่อจบรอบ
+
+  with metrics.stage("chaopraya.http_fetch"):
+      ...
+  metrics.count("weather.cache_hit")
+
+  @metrics.instrumented("scraper")      # ครอบ main(): จับเวลารวม + ส่งออก + profile
+  def main(): ...
+
+รูปแบบการส่งออกเลือกด้วย METRICS_FORMAT:
+  jsonl (ค่าเริ่มต้น) ต่อท้าย metrics.jsonl 1 บรรทัดต่อ 1 ค่า (ใช้หา p50/p95 ย้อนหลังได้)
+  prom               เขียน metrics-<job>.prom แบบ Prometheus text format (สำหรับ node_exporter textfile)
+  off                ไม่บันทึก
+METRICS_PATH กำหนด path ของไฟล์ได้ (workflow ใช้ metrics/<workflow>.jsonl แล้ว commit ไว้ดูย้อนหลัง)
+ไฟล์ jsonl ที่ใหญ่เกิน METRICS_MAX_BYTES จะถูกตัดแถวเก่าทิ้งให้เหลือราวครึ่งหนึ่ง
+
+PROFILE=1 จะเปิด cProfile + tracemalloc สำหรับรอบนั้น แล้วเขียน profile/<job>-<เวลา>.pstats
+และพิมพ์ตำแหน่งที่จอง memory มากที่สุด
+
+ใช้งาน:
+  python metrics.py report [--since 7d]   # p50/p95/max ของแต่ละ stage จาก metrics.jsonl
+"""
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- ค่าคงที่ ---
+METRICS_FORMAT = os.getenv("METRICS_FORMAT", "jsonl").lower()
+# prom: 1 ไฟล์ต่อ job ({job} ถูกแทนด้วยชื่อ job) เพราะ textfile collector อ่านทั้งไฟล์
+METRICS_PATH   = os.getenv("METRICS_PATH") or ("metrics-{job}.prom" if METRICS_FORMAT == "prom" else "metrics.jsonl")
+METRICS_MAX_BYTES = int(os.getenv("METRICS_MAX_BYTES", str(1024 * 1024)))   # 0 = ไม่จำกัด
+PROFILE        = os.getenv("PROFILE", "").lower() in ("1", "true")
+PROFILE_DIR    = os.getenv("PROFILE_DIR", "profile")
+PROM_PREFIX    = "water_monitor"
+
+_lock = threading.Lock()
+_samples = []        # (ชนิด, ชื่อ, ค่า, epoch) ยังไม่ได้ส่งออก
+
+
+def _record(kind, name, value):
+    with _lock:
+        _samples.append((kind, name, value, time.time()))
+
+
+@contextmanager
+def stage(name):
+    """จับเวลาของบล็อก บันทึกเป็น <name> (วินาที) และนับ <name>.error ถ้ามี exception"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        _record("counter", f"{name}.error", 1)
+        raise
+    finally:
+        _record("timer", name, time.perf_counter() - started)
+
+
+def count(name, value=1):
+    _record("counter", name, value)
+
+
+def gauge(name, value):
+    _record("gauge", name, value)
+
+
+def take():
+    """คืนค่าที่บันทึกไว้ทั้งหมดและล้าง buffer"""
+    with _lock:
+        samples = list(_samples)
+        _samples.clear()
+    return samples
+
+
+# ── ส่งออก ──
+def _prom_name(name, kind):
+    base = f"{PROM_PREFIX}_" + "".join(c if c.isalnum() else "_" for c in name)
+    return base + ("_seconds" if kind == "timer" else "_total" if kind == "counter" else "")
+
+
+def to_prometheus(samples, job):
+    """รวมค่าของรอบนี้เป็น Prometheus text format (timer = ผลรวมวินาที + จำนวนครั้ง)"""
+    agg = {}
+    for kind, name, value, _ in samples:
+        key = (kind, name)
+        total, n = agg.get(key, (0.0, 0))
+        agg[key] = (value if kind == "gauge" else total + value, n + 1)
+    lines = []
+    for (kind, name), (total, n) in sorted(agg.items(), key=lambda item: item[0][1]):
+        metric = _prom_name(name, kind)
+        if kind == "timer":
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f'{metric}_sum{{job="{job}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{job="{job}"}} {n}')
+        else:
+            lines.append(f"# TYPE {metric} {'counter' if kind == 'counter' else 'gauge'}")
+            lines.append(f'{metric}{{job="{job}"}} {total:g}')
+    lines.append(f"# TYPE {PROM_PREFIX}_last_run_timestamp_seconds gauge")
+    lines.append(f'{PROM_PREFIX}_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}')
+    return "\n".join(lines) + "\n"
+
+
+def flush(job):
+    """ส่งออกค่าที่สะสมไว้ตาม METRICS_FORMAT คืนจำนวนค่าที่ส่งออก"""
+    samples = take()
+    if not samples or METRICS_FORMAT == "off":
+        return 0
+    try:
+        if METRICS_FORMAT == "prom":
+            path = METRICS_PATH.format(job=job)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(to_prometheus(samples, job))
+            os.replace(tmp, path)
+        else:
+            if os.path.dirname(METRICS_PATH):
+                os.makedirs(os.path.dirname(METRICS_PATH), exist_ok=True)
+            with open(METRICS_PATH, "a", encoding="utf-8") as f:
+                for kind, name, value, ts in samples:
+                    f.write(json.dumps({"ts": round(ts, 3), "job": job, "kind": kind,
+                                        "name": name, "value": round(value, 6)}) + "\n")
+            _trim(METRICS_PATH, METRICS_MAX_BYTES)
+    except OSError as e:
+        print(f"[WARN] บันทึก metrics ไม่สำเร็จ: {e}")
+        return 0
+    return len(samples)
+
+
+def _trim(path, limit):
+    """ไฟล์ใหญ่เกิน limit: เก็บเฉพาะบรรทัดล่าสุดราว limit/2 bytes (ไม่ต้องตัดทุกรอบ)"""
+    if not limit or os.path.getsize(path) <= limit:
+        return
+    with open(path, "rb") as f:
+        f.seek(-(limit // 2), os.SEEK_END)
+        data = f.read()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data[data.find(b"\n") + 1:])
+    os.replace(tmp, path)
+
+
+# ── profile ──
+@contextmanager
+def profiled(job):
+    """เปิด cProfile + tracemalloc ระหว่างบล็อก (เฉพาะเมื่อ PROFILE=1)"""
+    if not PROFILE:
+        yield
+        return
+    import cProfile
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{job}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.pstats")
+        profiler.dump_stats(path)
+        gauge(f"{job}.peak_memory_bytes", peak)
+        print(f"[PROFILE] บันทึก {path} (ดูด้วย python -m pstats {path}) peak memory {peak / 1024:.0f} KiB")
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"[PROFILE]   {stat.size / 1024:8.1f} KiB  {stat.traceback}")
+
+
+def instrumented(job):
+    """decorator สำหรับ main(): จับเวลารวม (<job>.total), profile ถ้าเปิด และส่งออกเมื่อจบ"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with profiled(job), stage(f"{job}.total"):
+                    return fn(*args, **kwargs)
+            finally:
+                flush(job)
+        return wrapper
+    return decorate
+
+
+# ── รายงาน ──
+def _parse_since(text):
+    units = {"m": 60, "h": 3600, "d": 86400}
+    return float(text[:-1]) * units[text[-1]] if text and text[-1] in units else float(text)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    pos = (len(values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def report(path=METRICS_PATH, since=None):
+    """สรุป p50/p95/max ของแต่ละ timer จากไฟล์ jsonl"""
+    cutoff = time.time() - since if since else 0
+    timers, counters = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec["ts"] < cutoff:
+                continue
+            if rec["kind"] == "timer":
+                timers.setdefault(rec["name"], []).append(rec["value"])
+            elif rec["kind"] == "counter":
+                counters[rec["name"]] = counters.get(rec["name"], 0) + rec["value"]
+
+    print(f"{'stage':<36} {'n':>6} {'p50':>10} {'p95':>10} {'max':>10}")
+    for name, values in sorted(timers.items()):
+        print(f"{name:<36} {len(values):>6} {percentile(values, 0.5) * 1000:8.1f}ms "
+              f"{percentile(values, 0.95) * 1000:8.1f}ms {max(values) * 1000:8.1f}ms")
+    if counters:
+        print()
+        for name, total in sorted(counters.items()):
+            print(f"{name:<36} {total:>6g}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "report":
+        print("usage: python metrics.py report [--since 7d] [path]")
+        return 2
+    since, path = None, METRICS_PATH
+    rest = argv[1:]
+    while rest:
+        arg = rest.pop(0)
+        if arg == "--since" and rest:
+            since = _parse_since(rest.pop(0))
+        else:
+            path = arg
+    if not os.path.exists(path):
+        print(f"[ERROR] ไม่พบ {path}")
+        return 1
+    report(path, since)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
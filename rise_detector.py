@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+ตัวตรวจจับน้ำขึ้นแบบ streaming สำหรับสถานีอินทร์บุรี
+
+เก็บ state ขนาดคงที่ (ไม่ขึ้นกับจำนวนค่าที่เคยเห็น) และอัปเดต O(1) ต่อค่าใหม่ 1 ค่า:
+  level        EWMA ของระดับน้ำ (ม.รทก.)
+  rate         EWMA ของอัตราน้ำขึ้น (ม./ชม.) คำนวณจากค่าที่ผ่าน EWMA แล้ว จึงไม่ไวต่อค่ากระโดดครั้งเดียว
+  below_bank   ระยะห่างจากตลิ่งล่าสุด ใช้ประมาณเวลาที่น้ำจะถึงตลิ่ง (eta) = below_bank / rate
+
+EWMA ถ่วงน้ำหนักตามเวลา (alpha = 1 - exp(-dt / tau)) จึงใช้ได้ทั้งรันวันละครั้งและ poll ถี่ๆ
+ใน daemon โดยไม่ต้องปรับค่า
+
+เหตุการณ์ (dict ที่มี "type") ถูกสร้างเฉพาะตอนสถานะเปลี่ยน ไม่ใช่ทุกค่า:
+  jump        ระดับน้ำเปลี่ยนจากค่าก่อนหน้าเกิน jump_threshold (แบบ threshold เดิม)
+  rising      อัตราน้ำขึ้นเฉลี่ยเกิน RISE_ALERT_RATE ต่อเนื่อง (เลิกเตือนเมื่อต่ำกว่าครึ่งหนึ่ง)
+  overflow    คาดว่าน้ำจะถึงตลิ่งภายใน OVERFLOW_ALERT_HOURS ชม.
+  recovered   อัตรากลับสู่ปกติหลัง rising/overflow
+"""
+import os
+import math
+from datetime import datetime
+
+# --- ค่าคงที่ ---
+TAU_HOURS            = float(os.getenv("RISE_TAU_HOURS", "3"))              # ช่วงเวลาเฉลี่ยของ EWMA
+RISE_ALERT_RATE      = float(os.getenv("RISE_ALERT_RATE_M_PER_H", "0.02"))  # 2 ซม./ชม. ≈ 48 ซม./วัน
+OVERFLOW_ALERT_HOURS = float(os.getenv("OVERFLOW_ALERT_HOURS", "24"))
+MIN_RATE             = 1e-4      # ต่ำกว่านี้ถือว่าน้ำไม่ขึ้น (ไม่คำนวณ eta)
+STATE_VERSION        = 1
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class RiseDetector:
+    def __init__(self, state=None, jump_threshold=0.1):
+        self.jump_threshold = jump_threshold
+        self.state = state if state and state.get("version") == STATE_VERSION else self.empty_state()
+
+    @staticmethod
+    def empty_state():
+        return {"version": STATE_VERSION, "ts": None, "raw": None, "level": None, "rate": 0.0,
+                "below_bank": None, "rising": False, "overflow": False, "count": 0}
+
+    def eta_hours(self):
+        """ชั่วโมงที่คาดว่าน้ำจะถึงตลิ่งที่อัตราปัจจุบัน (None ถ้าน้ำไม่ขึ้นหรือไม่รู้ระยะตลิ่ง)"""
+        s = self.state
+        if s["below_bank"] is None or s["rate"] < MIN_RATE:
+            return None
+        return max(0.0, s["below_bank"]) / s["rate"]
+
+    def update(self, ts, level, below_bank=None):
+        """
+        ป้อนค่าใหม่ 1 ค่า (ts = datetime มี timezone, level ม.รทก.) คืน list ของเหตุการณ์
+        ค่าที่ไม่ใช่ตัวเลขหรือเวลาไม่ใหม่กว่าค่าล่าสุดจะถูกข้าม
+        """
+        level = _to_float(level)
+        if level is None:
+            return []
+        s = self.state
+        epoch = ts.timestamp()
+        if s["ts"] is not None and epoch <= s["ts"]:
+            return []
+
+        events = []
+        below_bank = _to_float(below_bank)
+        if below_bank is not None:
+            s["below_bank"] = below_bank
+        elif s["below_bank"] is not None and s["raw"] is not None:
+            # ไม่มีค่าใหม่: ระดับตลิ่งคงที่ ระยะห่างจึงลดลงเท่ากับที่น้ำขึ้น
+            s["below_bank"] -= level - s["raw"]
+
+        if s["ts"] is None:
+            s.update(ts=epoch, raw=level, level=level, rate=0.0, count=1)
+            return events
+
+        dt_hours = (epoch - s["ts"]) / 3600
+        alpha = 1 - math.exp(-dt_hours / TAU_HOURS)
+        if abs(level - s["raw"]) >= self.jump_threshold:
+            events.append(self._event("jump", ts, level, diff=round(level - s["raw"], 3)))
+
+        prev_level = s["level"]
+        s["level"] = prev_level + alpha * (level - prev_level)
+        s["rate"] += alpha * ((s["level"] - prev_level) / dt_hours - s["rate"])
+        s["ts"], s["raw"] = epoch, level
+        s["count"] += 1
+
+        if not s["rising"] and s["rate"] >= RISE_ALERT_RATE:
+            s["rising"] = True
+            events.append(self._event("rising", ts, level))
+        eta = self.eta_hours()
+        if not s["overflow"] and eta is not None and eta <= OVERFLOW_ALERT_HOURS:
+            s["overflow"] = True
+            events.append(self._event("overflow", ts, level))
+        if (s["rising"] or s["overflow"]) and s["rate"] < RISE_ALERT_RATE / 2 and (eta is None or eta > 2 * OVERFLOW_ALERT_HOURS):
+            s["rising"] = s["overflow"] = False
+            events.append(self._event("recovered", ts, level))
+        return events
+
+    def _event(self, kind, ts, level, **extra):
+        eta = self.eta_hours()
+        event = {
+            "type": kind,
+            "ts": ts.isoformat(timespec="seconds"),
+            "level": level,
+            "level_ewma": round(self.state["level"], 3),
+            "rate_m_per_h": round(self.state["rate"], 4),
+            "below_bank": None if self.state["below_bank"] is None else round(self.state["below_bank"], 3),
+            "eta_hours": None if eta is None else round(eta, 1),
+        }
+        event.update(extra)
+        return event
+
+
+def format_event(event, station="อินทร์บุรี"):
+    """ข้อความแจ้งเตือนของเหตุการณ์ (ภาษาไทย)"""
+    eta = f"{event['eta_hours']:.0f} ชม." if event["eta_hours"] is not None else "-"
+    heads = {
+        "jump": f"📢 ระดับน้ำเปลี่ยน {event.get('diff', 0):+.2f} ม.",
+        "rising": "⬆️ น้ำขึ้นต่อเนื่อง",
+        "overflow": "🚨 คาดว่าน้ำจะถึงตลิ่ง",
+        "recovered": "✅ ระดับน้ำกลับสู่ปกติ",
+    }
+    return (
+        f"{heads[event['type']]} ({station})\n"
+        f"🌊 ระดับน้ำ     : {event['level']:.2f} ม.\n"
+        f"📈 อัตราขึ้น     : {event['rate_m_per_h'] * 100:+.1f} ซม./ชม.\n"
+        f"📐 ห่างจากตลิ่ง : {event['below_bank'] if event['below_bank'] is not None else 'N/A'} ม.\n"
+        f"⏳ ถึงตลิ่งใน    : {eta}\n"
+        f"🕒 เวลา        : {datetime.fromisoformat(event['ts']).strftime('%d/%m %H:%M')}"
+    )
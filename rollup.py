@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+สถิติรายชั่วโมง/รายวันที่อัปเดตแบบ incremental จาก log ของ storage
+
+แต่ละรอบอ่านเฉพาะแถวใหม่ต่อจาก byte offset ที่บันทึกไว้ในแต่ละไฟล์ (checkpoint) แล้วรวมเข้ากับ
+สถิติเดิมของ bucket นั้น ต้นทุนต่อรอบจึงขึ้นกับจำนวนแถวใหม่ ไม่ใช่ความยาวของประวัติ
+
+  rollups/<series>/<YYYY-MM>.json    {"hourly": {bucket: agg}, "daily": {bucket: agg}} ของเดือนนั้น
+  rollups/<series>/checkpoint.json   offset / บรรทัดต้นไฟล์ / บรรทัดสุดท้ายที่อ่านแล้ว ของแต่ละไฟล์
+
+agg ของแต่ละ bucket: จำนวนแถว, แถวแรก/แถวสุดท้าย (epoch, values) และต่อคอลัมน์ตัวเลข
+[min, max, sum, จำนวนค่าที่ใช้ได้, จำนวน N/A] (แถวรูปแบบเก่าที่มีคอลัมน์ไม่ครบนับคอลัมน์ที่ขาดเป็น N/A)
+
+storage ส่งข้อมูลเป็น run (first_seen, last_seen, polls, values) แถวเดี่ยวคือ run ยาว 1
+run ที่ยาวหลายชั่วโมง (encoding runs) ถือว่า poll ห่างเท่าๆ กันจาก first_seen ถึง last_seen แล้วกระจาย
+จำนวน poll ลงแต่ละชั่วโมงที่ run ครอบ ผลจึงเท่ากับการอ่านแถวเดิมทีละแถวเมื่อ poll สม่ำเสมอ
+
+ถ้าไฟล์ถูกเขียนใหม่ทั้งไฟล์ (replace_range, backfill, archive compact, encode) บรรทัดต้นไฟล์หรือบรรทัด
+ก่อน offset จะไม่ตรงกับที่บันทึกไว้ จึงสร้างสถิติใหม่ทั้ง series หนึ่งครั้ง บรรทัดสุดท้ายของ run ในเดือน
+ปัจจุบัน (backend partitioned) ถูกแก้ในที่เดิมได้ จึงไม่นับเข้า checkpoint แต่เก็บไว้เป็น "open"
+แล้วรวมตอนอ่าน backend ที่ไม่ได้เก็บเป็นไฟล์ (sqlite) สร้างใหม่ทุกรอบ
+
+ใช้งาน:
+  python rollup.py [series ...]           # อัปเดต (ค่าเริ่มต้น: ทุก series ใน ROLLUP_SERIES)
+  python rollup.py rebuild [series ...]   # สร้างใหม่ทั้งหมด
+"""
+import os
+import sys
+import json
+import math
+import shutil
+from datetime import datetime, timedelta
+
+from storage import SERIES, TIMEZONE_THAILAND, get_store
+
+# --- ค่าคงที่ ---
+ROLLUP_DIR = os.getenv("ROLLUP_DIR", "rollups")
+# series -> คอลัมน์ตัวเลขที่เก็บสถิติ
+ROLLUP_SERIES = {
+    "chaopraya": ["storage"],
+    "inburi":    ["water_level", "bank_level", "below_bank"],
+}
+NA_STRINGS    = ("", "N/A", "None", "nan")
+STATE_VERSION = 2
+
+
+def to_float(text):
+    """ค่าตัวเลขจากข้อความใน log ("1,234.50 cms" → 1234.5) หรือ None ถ้าเป็น N/A"""
+    text = (text or "").replace(",", "").replace("cms", "").strip()
+    if text in NA_STRINGS:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _dir(series):
+    return os.path.join(ROLLUP_DIR, series)
+
+
+def _month_path(series, month):
+    return os.path.join(_dir(series), f"{month}.json")
+
+
+def _checkpoint_path(series):
+    return os.path.join(_dir(series), "checkpoint.json")
+
+
+def _read_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _empty_state(backend):
+    return {"version": STATE_VERSION, "backend": backend, "gen": 0, "segments": {}, "open": {}}
+
+
+# ── aggregate ──
+def _keys(dt):
+    local = dt.astimezone(TIMEZONE_THAILAND)
+    return local.strftime("%Y-%m"), local.strftime("%Y-%m-%dT%H"), local.strftime("%Y-%m-%d")
+
+
+def _fold(agg, first, last, polls, values, indexes):
+    """รวม poll ค่าเดียวกัน polls ครั้ง (ครั้งแรก/สุดท้ายที่ epoch first/last) เข้า agg (None = bucket ใหม่) คืน agg"""
+    if agg is None:
+        agg = {"n": 0, "first": [first, values], "last": [last, values],
+               "cols": [[None, None, 0.0, 0, 0] for _ in indexes]}
+    agg["n"] += polls
+    if first < agg["first"][0]:
+        agg["first"] = [first, values]
+    if last >= agg["last"][0]:
+        agg["last"] = [last, values]
+    for stat, i in zip(agg["cols"], indexes):
+        value = to_float(values[i]) if i < len(values) else None
+        if value is None:
+            stat[4] += polls
+            continue
+        stat[0] = value if stat[0] is None else min(stat[0], value)
+        stat[1] = value if stat[1] is None else max(stat[1], value)
+        stat[2] += value * polls
+        stat[3] += polls
+    return agg
+
+
+def _spread(first, last, polls):
+    """
+    กระจาย poll ของ run ลงแต่ละชั่วโมง โดยถือว่า poll ห่างเท่าๆ กันจาก first ถึง last
+    คืน [(epoch ของ poll แรกในชั่วโมง, epoch ของ poll สุดท้าย, จำนวน poll)] เฉพาะชั่วโมงที่มี poll
+    """
+    a, b = first.timestamp(), last.timestamp()
+    if b <= a:
+        return [(a, a, max(polls, 1))]
+    polls = max(polls, 2)
+    step = (b - a) / (polls - 1)
+    at = lambda k: b if k == polls - 1 else a + k * step  # noqa: E731
+    pieces = []
+    hour = first.astimezone(TIMEZONE_THAILAND).replace(minute=0, second=0, microsecond=0)
+    while hour.timestamp() <= b:
+        following = hour + timedelta(hours=1)
+        lo = max(0, math.ceil((hour.timestamp() - a) / step - 1e-9))
+        hi = min(polls - 1, math.ceil((following.timestamp() - a) / step - 1e-9) - 1)
+        if hi >= lo:
+            pieces.append((at(lo), at(hi), hi - lo + 1))
+        hour = following
+    return pieces
+
+
+def _merge(a, b):
+    """รวม agg สองชุด (ไม่แก้ตัวแปรเดิม)"""
+    if a is None or b is None:
+        return a or b
+    cols = []
+    for x, y in zip(a["cols"], b["cols"]):
+        lo = [v for v in (x[0], y[0]) if v is not None]
+        hi = [v for v in (x[1], y[1]) if v is not None]
+        cols.append([min(lo) if lo else None, max(hi) if hi else None, x[2] + y[2], x[3] + y[3], x[4] + y[4]])
+    return {"n": a["n"] + b["n"],
+            "first": a["first"] if a["first"][0] <= b["first"][0] else b["first"],
+            "last": b["last"] if b["last"][0] >= a["last"][0] else a["last"],
+            "cols": cols}
+
+
+def _summary(series, bucket, agg):
+    """agg → dict ที่ผู้ใช้อ่าน (mean และ % N/A ต่อคอลัมน์)"""
+    columns = {}
+    for name, (lo, hi, total, valid, na) in zip(ROLLUP_SERIES[series], agg["cols"]):
+        columns[name] = {"min": lo, "max": hi, "mean": total / valid if valid else None,
+                         "count": valid, "na_pct": 100.0 * na / agg["n"] if agg["n"] else 0.0}
+    start = TIMEZONE_THAILAND.localize(datetime.strptime(bucket, "%Y-%m-%dT%H" if "T" in bucket else "%Y-%m-%d"))
+    return {"start": start, "count": agg["n"],
+            "first": (_from_epoch(agg["first"][0]), agg["first"][1]),
+            "last": (_from_epoch(agg["last"][0]), agg["last"][1]),
+            "columns": columns}
+
+
+def _from_epoch(epoch):
+    return datetime.fromtimestamp(epoch, TIMEZONE_THAILAND)
+
+
+# ── อัปเดต ──
+def _read_line_at(f, end, length):
+    f.seek(max(0, end - length))
+    return f.read(min(end, length))
+
+
+def _changed(path, seg):
+    """ไฟล์ถูกเขียนใหม่ (ไม่ใช่แค่ต่อท้าย) ตั้งแต่อ่านครั้งก่อนหรือไม่"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return True
+    if size < seg["offset"]:
+        return True
+    head, anchor = seg["head"].encode("utf-8"), seg["anchor"].encode("utf-8")
+    with open(path, "rb") as f:
+        if f.read(len(head)) != head:
+            return True
+        return _read_line_at(f, seg["offset"], len(anchor)) != anchor
+
+
+def _consume(path, seg, parse, mutable):
+    """
+    อ่านบรรทัดใหม่ของไฟล์ต่อจาก seg["offset"] คืน (run ที่อ่านแล้ว, run ของบรรทัดที่ยังเปิดอยู่)
+    และเลื่อน offset/anchor ใน seg บรรทัดสุดท้ายที่ยังไม่มี "\\n" (กำลังเขียน) จะอ่านรอบหน้า
+    """
+    with open(path, "rb") as f:
+        f.seek(seg["offset"])
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].split(b"\n")[:-1]
+    held = lines.pop() if mutable and lines else None
+    if not seg["head"] and lines:
+        # บรรทัดที่ยังเปิดอยู่เปลี่ยนได้ จึงใช้เป็น head ไม่ได้ (ไม่เช่นนั้นทุกรอบจะถือว่าไฟล์ถูกเขียนใหม่)
+        seg["head"] = lines[0].decode("utf-8")
+
+    runs, consumed = [], 0
+    for line in lines:
+        consumed += len(line) + 1
+        try:
+            runs.extend(parse(line.decode("utf-8")))
+        except (ValueError, UnicodeDecodeError):
+            continue     # บรรทัดเสีย: ข้ามแบบเดียวกับ storage
+    if lines:
+        seg["anchor"] = lines[-1].decode("utf-8", "replace") + "\n"
+    seg["offset"] += consumed
+    opened = []
+    if held is not None:
+        try:
+            opened = parse(held.decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            pass
+    return runs, opened
+
+
+def _indexes(series):
+    columns = SERIES[series]["columns"]
+    return [columns.index(name) for name in ROLLUP_SERIES[series]]
+
+
+def _fold_runs(series, runs, gen):
+    """รวม run ใหม่เข้าไฟล์รายเดือนที่เกี่ยวข้อง คืนจำนวนเดือนที่เขียน"""
+    indexes = _indexes(series)
+    months = {}
+    for first, last, polls, values in runs:
+        for lo, hi, count in _spread(first, last, polls):
+            month, hour, day = _keys(_from_epoch(lo))
+            data = months.get(month)
+            if data is None:
+                data = months[month] = _read_json(_month_path(series, month), {"hourly": {}, "daily": {}})
+                if data.get("gen", 0) > gen:
+                    # รอบก่อนเขียนเดือนนี้แล้วแต่ยังไม่ได้บันทึก checkpoint: แถวชุดนี้ถูกนับไปแล้ว
+                    raise _Stale(month)
+            data["hourly"][hour] = _fold(data["hourly"].get(hour), lo, hi, count, values, indexes)
+            data["daily"][day] = _fold(data["daily"].get(day), lo, hi, count, values, indexes)
+    for month, data in months.items():
+        data["gen"] = gen + 1
+        _write_json(_month_path(series, month), data)
+    return len(months)
+
+
+class _Stale(Exception):
+    pass
+
+
+def _open_runs(runs):
+    return [[first.timestamp(), last.timestamp(), polls, values] for first, last, polls, values in runs]
+
+
+def update(series, store=None, rebuild=False):
+    """อ่านแถวใหม่ของ series แล้วรวมเข้า rollup คืนจำนวน run ที่รวมเพิ่ม"""
+    store = store or get_store()
+    segments = getattr(store, "segments", None)
+    segments = segments(series) if segments is not None else None
+    state = _read_json(_checkpoint_path(series), None)
+    if (rebuild or segments is None or not state or state.get("version") != STATE_VERSION
+            or state.get("backend") != store.name):
+        return _rebuild(series, store, segments)
+
+    keys = {key for key, *_ in segments}
+    if any(key not in keys for key in state["segments"]):
+        return _rebuild(series, store, segments)
+    pending = []
+    for key, path, parse, mutable in segments:
+        seg = state["segments"].get(key)
+        if seg is None:
+            seg = state["segments"][key] = {"offset": 0, "head": "", "anchor": "", "size": -1, "mtime_ns": -1}
+        elif not os.path.exists(path) or _changed(path, seg):
+            print(f"[INFO] rollup {series}: {path} ถูกเขียนใหม่ สร้างสถิติใหม่ทั้งหมด")
+            return _rebuild(series, store, segments)
+        pending.append((key, path, parse, mutable, seg))
+
+    folded, dirty = [], False
+    for key, path, parse, mutable, seg in pending:
+        st = os.stat(path)
+        if st.st_size == seg["size"] and st.st_mtime_ns == seg["mtime_ns"] and (mutable or key not in state["open"]):
+            continue
+        dirty = True
+        runs, opened = _consume(path, seg, parse, mutable)
+        seg["size"], seg["mtime_ns"] = st.st_size, st.st_mtime_ns
+        folded.extend(runs)
+        if opened:
+            state["open"][key] = _open_runs(opened)
+        else:
+            state["open"].pop(key, None)
+    if not dirty:
+        return 0
+    try:
+        _fold_runs(series, folded, state["gen"])
+    except _Stale as e:
+        print(f"[WARN] rollup {series}: เดือน {e} ไม่ตรงกับ checkpoint สร้างสถิติใหม่ทั้งหมด")
+        return _rebuild(series, store, segments)
+    state["gen"] += 1
+    _write_json(_checkpoint_path(series), state)
+    return len(folded)
+
+
+def _rebuild(series, store, segments):
+    shutil.rmtree(_dir(series), ignore_errors=True)
+    os.makedirs(_dir(series), exist_ok=True)
+    state = _empty_state(store.name)
+    if segments is None:
+        runs = list(store.iter_runs(series))
+    else:
+        runs = [(dt, dt, 1, values) for dt, values in store.iter_archived_rows(series)]
+        for key, path, parse, mutable in segments:
+            seg = state["segments"][key] = {"offset": 0, "head": "", "anchor": "", "size": -1, "mtime_ns": -1}
+            if not os.path.exists(path):
+                continue
+            st = os.stat(path)
+            got, opened = _consume(path, seg, parse, mutable)
+            seg["size"], seg["mtime_ns"] = st.st_size, st.st_mtime_ns
+            runs.extend(got)
+            if opened:
+                state["open"][key] = _open_runs(opened)
+    _fold_runs(series, runs, 0)
+    state["gen"] = 1
+    _write_json(_checkpoint_path(series), state)
+    return len(runs)
+
+
+# ── อ่าน ──
+def _months(series):
+    try:
+        return sorted(name[:-5] for name in os.listdir(_dir(series))
+                      if name.endswith(".json") and name != "checkpoint.json")
+    except OSError:
+        return []
+
+
+def load(series, level="hourly", start=None, end=None):
+    """
+    [สถิติของ bucket] เรียงตามเวลา ของ bucket ที่ทับช่วง [start, end] (level = "hourly" | "daily")
+    แต่ละตัวเป็น dict: start, count, first/last = (datetime, values),
+    columns = {คอลัมน์: {min, max, mean, count, na_pct}}
+    """
+    lo = _keys(start)[0] if start is not None else None
+    hi = _keys(end)[0] if end is not None else None
+    buckets = {}
+    for month in _months(series):
+        if (lo is None or month >= lo) and (hi is None or month <= hi):
+            buckets.update(_read_json(_month_path(series, month), {}).get(level, {}))
+
+    state = _read_json(_checkpoint_path(series), None) or {"open": {}}
+    indexes = _indexes(series)
+    for runs in state["open"].values():
+        for first, last, polls, values in runs:
+            for lo, hi, count in _spread(_from_epoch(first), _from_epoch(last), polls):
+                _, hour, day = _keys(_from_epoch(lo))
+                bucket = hour if level == "hourly" else day
+                buckets[bucket] = _merge(buckets.get(bucket), _fold(None, lo, hi, count, values, indexes))
+
+    # key ของ bucket ("YYYY-MM-DDTHH" / "YYYY-MM-DD") เรียงตามเวลาแบบข้อความได้
+    pick = 1 if level == "hourly" else 2
+    first = _keys(start)[pick] if start is not None else None
+    last = _keys(end)[pick] if end is not None else None
+    return [_summary(series, bucket, buckets[bucket]) for bucket in sorted(buckets)
+            if (first is None or bucket >= first) and (last is None or bucket <= last)]
+
+
+def latest(series):
+    """แถวล่าสุด (datetime, values) ตาม rollup หรือ None"""
+    months = _months(series)
+    state = _read_json(_checkpoint_path(series), None) or {"open": {}}
+    candidates = [(last, values) for runs in state["open"].values() for _, last, _, values in runs]
+    if months:
+        hourly = _read_json(_month_path(series, months[-1]), {}).get("hourly", {})
+        candidates.extend(agg["last"] for agg in hourly.values())
+    if not candidates:
+        return None
+    epoch, values = max(candidates, key=lambda c: c[0])
+    return _from_epoch(epoch), values
+
+
+def window(series, target, tolerance, column):
+    """
+    ช่วง (start, end) รอบ target ที่แคบที่สุดซึ่งยังครอบแถวที่ column มีค่าใกล้ target ที่สุด
+    ภายใน tolerance หรือ None ถ้าไม่มีชั่วโมงไหนในช่วงนั้นมีค่า ใช้ bucket รายชั่วโมงบอกแค่ว่าชั่วโมงไหนมีค่า
+    เวลาจริงของแถวต้องอ่านจาก store ในช่วงที่ได้ (แถวใน bucket ห่าง target ไม่เกินระยะถึงขอบ bucket + 1 ชม.)
+    """
+    hour = timedelta(hours=1)
+    best = None
+    for item in load(series, "hourly", target - tolerance, target + tolerance):
+        if not item["columns"][column]["count"]:
+            continue
+        start = item["start"]
+        diff = timedelta(0) if start <= target < start + hour else min(abs(target - start), abs(target - start - hour))
+        if best is None or diff < best:
+            best = diff
+    if best is None or best > tolerance:
+        return None
+    radius = min(tolerance, best + hour)
+    return target - radius, target + radius
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rebuild = argv[:1] == ["rebuild"]
+    names = (argv[1:] if rebuild else argv) or list(ROLLUP_SERIES)
+    unknown = [n for n in names if n not in ROLLUP_SERIES]
+    if unknown:
+        print(f"[ERROR] ไม่มี rollup ของ: {', '.join(unknown)} (มี: {', '.join(ROLLUP_SERIES)})")
+        return 2
+    for series in names:
+        n = update(series, rebuild=rebuild)
+        print(f"[INFO] rollup {series}: รวมเพิ่ม {n} แถว")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,52 +1,160 @@
 import os
-import re
 import requests
 import json
+import hashlib
 from datetime import datetime, timedelta
 import pytz
 
+import line_delivery
+import metrics
+import upstream
+from dayindex import years_ago
+from storage import get_store
+
 # --- ค่าคงที่ ---
-URL = 'https://tiwrm.hii.or.th/DATA/REPORT/php/chart/chaopraya/small/chaopraya.php'
+URL = os.getenv('CHAOPRAYA_URL', 'https://tiwrm.hii.or.th/DATA/REPORT/php/chart/chaopraya/small/chaopraya.php')
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_TARGET_ID = os.environ.get('LINE_TARGET_ID')
 TIMEZONE_THAILAND = pytz.timezone('Asia/Bangkok')
-HISTORICAL_LOG_FILE = 'historical_log.csv'
 LAST_DATA_FILE = 'last_data.txt'
+FETCH_CACHE_FILE = 'chaopraya_fetch_cache.json'  # ETag/Last-Modified/hash ของรอบก่อน
+MAIN_STATION = 'C13'
+# เทียบกับค่าเมื่อ N ปีที่แล้วในข้อความแจ้งเตือน เช่น "1,2,5"
+COMPARE_YEARS = [int(y) for y in os.getenv("COMPARE_YEARS", "1").split(",") if y.strip().isdigit()]
 
+# โหมดหลายสถานี: บันทึกทุกสถานีใน itc_water ลง stations log ในการเขียนครั้งเดียว
+MULTI_STATION = os.getenv("MULTI_STATION", "").lower() in ("1", "true")
+# จำกัดเฉพาะบางสถานี เช่น "C13,C2,C7A" (ว่าง = ทุกสถานี)
+STATION_IDS = [s.strip() for s in os.getenv("CHAOP_STATIONS", "").split(",") if s.strip()]
 
-def get_water_data(timeout=30):
+# คอลัมน์ใน record batch -> key ที่เป็นไปได้ในแต่ละสถานีของ itc_water (ใช้ key แรกที่พบ)
+STATION_FIELDS = {
+    'storage':  ('storage',),
+    'level':    ('water_level', 'wl', 'level'),
+    'obs_time': ('datetime', 'date', 'time'),
+}
+
+
+JSON_DATA_MARKER = 'var json_data = '
+
+
+def extract_json_data(text):
+    """
+    ถอด literal ของ json_data ออกจากหน้าเว็บ
+    raw_decode จะหยุดทันทีที่ literal ปิด ไม่ต้องสแกนส่วนที่เหลือของหน้า
+    """
+    start = text.find(JSON_DATA_MARKER)
+    if start < 0:
+        return None
+    data, _ = json.JSONDecoder().raw_decode(text, start + len(JSON_DATA_MARKER))
+    return data
+
+
+def extract_station_batch(data, station_ids=None):
+    """
+    แปลง itc_water ทั้งหมดเป็น record batch แบบ columnar ในรอบเดียว
+    คืน dict ของ list เท่ากันทุกคอลัมน์: station, storage, level, obs_time
+    """
+    stations = data[0]['itc_water']
+    wanted = set(station_ids) if station_ids else None
+    batch = {'station': []}
+    batch.update({col: [] for col in STATION_FIELDS})
+    for station_id, record in stations.items():
+        if wanted is not None and station_id not in wanted:
+            continue
+        if not isinstance(record, dict):
+            continue
+        batch['station'].append(station_id)
+        for col, keys in STATION_FIELDS.items():
+            batch[col].append(next((record[k] for k in keys if record.get(k) not in (None, '')), None))
+    return batch
+
+
+def _load_fetch_cache():
+    if not os.path.exists(FETCH_CACHE_FILE):
+        return {}
+    try:
+        with open(FETCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_fetch_cache(cache):
+    with open(FETCH_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+
+def fetch_chaopraya(timeout=30):
     """
     ดึงข้อมูลจาก JSON ที่ฝังอยู่ใน JavaScript ของหน้าเว็บ
     ซึ่งเป็นวิธีที่เสถียรและแม่นยำที่สุด
+
+    คืน {'value': "<C13 storage> cms", 'stations': record batch ของทุกสถานี} หรือ None
+
+    ใช้ ETag/Last-Modified และ hash ของเนื้อหาจากรอบก่อน (FETCH_CACHE_FILE)
+    ถ้าได้ 304 หรือเนื้อหาเหมือนเดิม จะคืนค่าเดิมโดยไม่ต้อง parse ใหม่
+    ถ้า circuit breaker ของ tiwrm เปิดอยู่ จะคืนค่าเดิมจาก cache พร้อม 'stale': True
     """
+    cache = _load_fetch_cache()
     try:
         headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Cache-Control': 'no-cache',
     'Pragma': 'no-cache'
 }
-        response = requests.get(URL, headers=headers, timeout=timeout)
+        if cache.get('value'):
+            if cache.get('etag'):
+                headers['If-None-Match'] = cache['etag']
+            if cache.get('last_modified'):
+                headers['If-Modified-Since'] = cache['last_modified']
+
+        with metrics.stage('chaopraya.http_fetch'):
+            response = upstream.get('tiwrm', URL, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cache.get('value'):
+            print("[DEBUG] 304 Not Modified → ใช้ค่าเดิม")
+            metrics.count('chaopraya.not_modified')
+            return {'value': cache['value'], 'stations': cache.get('stations')}
         response.raise_for_status()
+
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': hashlib.sha256(response.content).hexdigest(),
+        }
+        if validators['sha256'] == cache.get('sha256') and cache.get('value'):
+            print("[DEBUG] เนื้อหาเหมือนรอบก่อน → ข้ามการ parse")
+            metrics.count('chaopraya.unchanged')
+            _save_fetch_cache({**cache, **validators})
+            return {'value': cache['value'], 'stations': cache.get('stations')}
+
         response.encoding = 'utf-8' # ระบุ encoding เป็น utf-8
-        
-        # 1. ค้นหาข้อมูล JSON ที่อยู่ในตัวแปรชื่อ "json_data" จากเนื้อหาของหน้าเว็บ
-        match = re.search(r'var json_data = (\[.*\]);', response.text)
-        
-        if not match:
+
+        # 1. ค้นหาและแปลงข้อมูล JSON ที่อยู่ในตัวแปรชื่อ "json_data" จากเนื้อหาของหน้าเว็บ
+        with metrics.stage('chaopraya.parse'):
+            data = extract_json_data(response.text)
+
+        if data is None:
             print("Error: ไม่พบข้อมูล JSON (ตัวแปร json_data) ในหน้าเว็บ")
             return None
-            
-        # 2. แปลงข้อความ JSON ที่หาเจอให้กลายเป็น Dictionary ของ Python
-        json_string = match.group(1)
-        data = json.loads(json_string)
-        
-        # 3. ดึงค่าที่ต้องการจากโครงสร้าง JSON โดยตรง
+
+        # 2. ดึงค่าที่ต้องการจากโครงสร้าง JSON โดยตรง
         # data[0] -> itc_water -> C13 -> storage
-        water_storage = data[0]['itc_water']['C13']['storage']
-        
+        water_storage = data[0]['itc_water'][MAIN_STATION]['storage']
+
         if water_storage:
-            return f"{water_storage} cms"
+            value = f"{water_storage} cms"
+            stations = extract_station_batch(data, STATION_IDS)
+            _save_fetch_cache({**validators, 'value': value, 'stations': stations})
+            return {'value': value, 'stations': stations}
 
+    except upstream.CircuitOpen as e:
+        if not cache.get('value'):
+            print(f"[WARN] {e} และยังไม่มีค่าเดิมใน cache")
+            return None
+        print(f"[WARN] {e} → ใช้ค่าล่าสุดที่ดึงได้ (stale)")
+        metrics.count('chaopraya.stale')
+        return {'value': cache['value'], 'stations': cache.get('stations'), 'stale': True}
     except requests.exceptions.RequestException as e:
         print(f"เกิดข้อผิดพลาดในการดึง URL: {e}")
         return None
@@ -64,61 +172,56 @@ def get_water_data(timeout=30):
     return None
 
 
+def get_water_data(timeout=30):
+    """คืนปริมาณน้ำท้ายเขื่อน (C13) เป็นข้อความ เช่น "600.00 cms" หรือ None"""
+    result = fetch_chaopraya(timeout)
+    return result['value'] if result else None
+
+
 def get_historical_data(target_date):
-    if not os.path.exists(HISTORICAL_LOG_FILE):
+    """หาค่าที่ใกล้ target_date ที่สุดภายใน ±12 ชม. ผ่าน storage backend"""
+    row = get_store().nearest('chaopraya', target_date, tolerance=timedelta(hours=12))
+    if row is None:
         return None
-    start = target_date - timedelta(hours=12)
-    end = target_date + timedelta(hours=12)
-    best, best_diff = None, timedelta.max
-    with open(HISTORICAL_LOG_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            try:
-                ts, val = line.strip().split(",", 1)
-                dt = datetime.fromisoformat(ts)
-                if dt.tzinfo is None:
-                    dt = TIMEZONE_THAILAND.localize(dt)
-                diff = abs(target_date - dt)
-                if start <= dt <= end and diff < best_diff:
-                    best_diff, best = diff, val
-            except ValueError:
-                continue
-    return best
+    _, values = row
+    return values[0]
+
+
+def get_years_ago_data(now, years):
+    """ค่าใกล้วันเวลาเดียวกันเมื่อ N ปีที่แล้ว คืน (วันที่เป้าหมาย, ค่า)"""
+    target = years_ago(now, years)
+    return target, get_historical_data(target)
 
 
 def append_to_historical_log(now, data):
-    with open(HISTORICAL_LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{now.isoformat()},{data}\n")
+    get_store().append('chaopraya', now, [data])
+
+
+def append_station_batch(now, batch):
+    """เขียนทุกสถานีใน record batch ลง stations log ในครั้งเดียว"""
+    columns = [batch['station']] + [batch[col] for col in STATION_FIELDS]
+    rows = [(now, ['' if v is None else str(v).replace(',', '') for v in values])
+            for values in zip(*columns)]
+    get_store().append_many('stations', rows)
+    return len(rows)
 
 
 def send_line_message(message):
+    """เพิ่มข้อความลง outbox แล้วส่งใน background (ส่งไม่สำเร็จจะถูกส่งซ้ำรอบถัดไป)"""
     if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_TARGET_ID:
         print("Missing LINE credentials.")
-        return
-    url = 'https://api.line.me/v2/bot/message/push'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {LINE_CHANNEL_ACCESS_TOKEN}'
-    }
-    payload = {
-        'to': LINE_TARGET_ID,
-        'messages': [{'type': 'text', 'text': message}]
-    }
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=10)
-        resp.raise_for_status()
-        print("ส่งข้อความ LINE สำเร็จ:", resp.status_code)
-    except Exception as e:
-        print("ส่งข้อความ LINE ไม่สำเร็จ:", e)
+        return None
+    line_delivery.enqueue(message)
+    return line_delivery.flush_async()
 
 
-# วางโค้ดนี้ทับฟังก์ชัน main() เดิมในไฟล์ scraper.py
-def main():
-    # อ่านค่าปัจจุบันและค่าเก่า
+def process_reading(current):
+    """เปรียบเทียบค่าที่ดึงได้กับค่าเดิม แจ้งเตือนถ้าเปลี่ยน และบันทึก log"""
+    # อ่านค่าเก่า
     last = ''
     if os.path.exists(LAST_DATA_FILE):
         last = open(LAST_DATA_FILE, 'r', encoding='utf-8').read().strip()
 
-    current = get_water_data()
     if not current:
         print("ไม่สามารถดึงค่าปัจจุบันได้ จึงไม่มีการแจ้งเตือน")
         return
@@ -131,11 +234,13 @@ def main():
         now_th = datetime.now(TIMEZONE_THAILAND)
 
         # เตรียมข้อความสำหรับข้อมูลย้อนหลัง (ถ้ามี)
-        hist = get_historical_data(now_th - timedelta(days=365))
         hist_str = ""
-        if hist:
-            hist_date_str = (now_th - timedelta(days=365)).strftime('%d/%m/%Y')
-            hist_str = f"\n\n📈 เทียบปีที่แล้ว ({hist_date_str}): {hist}"
+        with metrics.stage('chaopraya.history_lookup'):
+            for years in COMPARE_YEARS:
+                hist_date, hist = get_years_ago_data(now_th, years)
+                if hist:
+                    label = "ปีที่แล้ว" if years == 1 else f"{years} ปีก่อน"
+                    hist_str += f"\n\n📈 เทียบ{label} ({hist_date.strftime('%d/%m/%Y')}): {hist}"
 
         # จัดรูปแบบข้อความใหม่ให้อ่านง่าย
         msg = (
@@ -161,8 +266,28 @@ def main():
 
     # ส่วนนี้จะทำงานทุกครั้งเพื่อเก็บ log ไม่ว่าจะแจ้งเตือนหรือไม่
     now_th = datetime.now(TIMEZONE_THAILAND)
-    append_to_historical_log(now_th, current)
+    with metrics.stage('chaopraya.csv_write'):
+        append_to_historical_log(now_th, current)
     print("อัปเดต historical log เรียบร้อย")
 
+
+def process_result(result):
+    """ประมวลผลผลลัพธ์จาก fetch_chaopraya: C13 ตามเดิม และทุกสถานีเมื่อเปิด MULTI_STATION"""
+    if result and result.get('stale'):
+        # ค่าเดิมจาก cache ไม่ใช่การวัดใหม่ จึงไม่แจ้งเตือนและไม่บันทึกลง log
+        print(f"ค่าปัจจุบัน (stale): {result['value']} → ข้ามการบันทึก")
+        return
+    process_reading(result['value'] if result else None)
+    if MULTI_STATION and result and result.get('stations'):
+        with metrics.stage('chaopraya.stations_write'):
+            n = append_station_batch(datetime.now(TIMEZONE_THAILAND), result['stations'])
+        print(f"อัปเดต stations log เรียบร้อย ({n} สถานี)")
+
+
+@metrics.instrumented('scraper')
+def main():
+    process_result(fetch_chaopraya())
+
+
 if __name__ == "__main__":
     main()
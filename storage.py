@@ -0,0 +1,873 @@
+#!/usr/bin/env python3
+"""
+ชั้นจัดเก็บข้อมูล time-series ที่ใช้ร่วมกันระหว่าง scraper, inburi_bridge_alert,
+weather_forecaster และ summary_report
+
+เลือก backend ด้วย env STORAGE_BACKEND:
+  - csv    (ค่าเริ่มต้น) เขียน/อ่านไฟล์ CSV เดิมตามที่ workflow commit อยู่
+  - sqlite เก็บใน SQLite (WAL mode) ที่มี index ตาม (series, ts)
+           ทำให้การหาค่าใกล้เวลาที่สุดเป็นการ probe index แทนการ parse ทั้งไฟล์
+  - partitioned  CSV แยกไฟล์รายเดือน data/<series>/<YYYY-MM>.csv + manifest.json
+           เขียนเฉพาะไฟล์เดือนปัจจุบัน (เดือนก่อนหน้าไม่ถูกแก้อีก) git จึง diff/push แค่ไฟล์เล็กๆ
+           และผู้อ่านเปิดเฉพาะเดือนที่ query ต้องใช้ตาม manifest
+           workflow ใช้ backend นี้: หลัง partition แล้วจะลบ CSV เดิมที่ root ออกจาก repo
+           (ข้อมูลทั้งหมดอยู่ใน data/<series>/) เครื่องที่ checkout repo จึงควรใช้ backend นี้ด้วย
+
+ใช้งานแบบ CLI:
+  python storage.py import               # นำเข้า CSV เดิมทั้งหมดเข้า SQLite (ครั้งเดียว)
+  python storage.py partition [series]   # แยก CSV เดิมเป็นไฟล์รายเดือน (ข้าม series ที่แยกแล้ว)
+  python storage.py encode [series]      # แปลง partition แบบแถวเดิมของ series ที่ใช้ run เป็น run record
+"""
+import os
+import sys
+import json
+import sqlite3
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, timedelta
+
+import pytz
+
+# --- ค่าคงที่ ---
+TIMEZONE_THAILAND = pytz.timezone('Asia/Bangkok')
+STORAGE_BACKEND   = os.getenv("STORAGE_BACKEND", "csv").lower()
+SQLITE_DB_FILE    = os.getenv("SQLITE_DB_PATH", "water_monitor.db")
+ARCHIVE_DIR       = os.getenv("ARCHIVE_DIR", "archive")   # คลัง columnar รายเดือน (archive.py)
+PARTITION_DIR     = os.getenv("PARTITION_DIR", "data")    # backend partitioned
+SEAL_GRACE        = timedelta(days=1)   # เดือนก่อนหน้ายังแก้ได้อีก 1 วันหลังขึ้นเดือนใหม่
+RUN_MAX_GAP       = timedelta(hours=26) # ค่าเดิมที่หายไปนานกว่านี้เริ่ม run ใหม่ (ไม่ซ่อนช่วงที่ขาด)
+TAIL_BLOCK        = 64 * 1024           # ขนาด block ที่ tail() อ่านย้อนจากท้ายไฟล์
+WEATHER_PRIMARY_LOCATION = os.getenv("WEATHER_PRIMARY_LOCATION", "inburi")  # จุดที่รายงาน/กราฟใช้
+
+# series -> ไฟล์ CSV และชื่อคอลัมน์ (ไม่รวมคอลัมน์ timestamp)
+SERIES = {
+    # day_index: ดูแล sidecar <file>.dayidx (dayindex.py) ให้ค้นหาตามวันได้ในเวลาคงที่ (เฉพาะ backend csv)
+    # runs: backend partitioned เก็บค่าที่ซ้ำติดกันเป็น run record เดียว (first_seen, last_seen, polls)
+    # unit: เก็บหน่วยแยกคอลัมน์ (เช่น "600.00 cms" → 600.00,cms) แล้วประกอบกลับตอนอ่าน
+    "chaopraya": {"file": "historical_log.csv", "columns": ["storage"], "day_index": True,
+                  "runs": True, "unit": "cms"},
+    "inburi":    {"file": "inburi_log.csv",
+                  "columns": ["water_level", "bank_level", "status", "below_bank", "time"],
+                  "runs": True},
+    # issued = เวลาที่ออกพยากรณ์ (ts คือเวลาที่พยากรณ์ถึง) ใช้เป็น key ร่วมใน replace_range
+    # location = key ใน registry ของ weather_forecaster (แถวเก่าที่ไม่มีถือเป็น WEATHER_PRIMARY_LOCATION)
+    "weather":   {"file": "weather_log.csv", "columns": ["event", "value", "issued", "location"]},
+    # ทุกสถานีจากหน้า Chaopraya (scraper MULTI_STATION)
+    "stations":  {"file": "stations_log.csv", "columns": ["station", "storage", "level", "obs_time"]},
+}
+
+
+def parse_ts(ts_text):
+    """แปลง ISO timestamp เป็น datetime แบบมี timezone (ไม่มี tz ถือเป็นเวลาไทย)"""
+    dt = datetime.fromisoformat(ts_text)
+    if dt.tzinfo is None:
+        dt = TIMEZONE_THAILAND.localize(dt)
+    return dt
+
+
+def weather_location(values):
+    """location ของแถว weather (แถวก่อนมีคอลัมน์นี้เป็นพยากรณ์ของจุดหลัก)"""
+    if len(values) > 3 and values[3] not in ("", "N/A"):
+        return values[3]
+    return WEATHER_PRIMARY_LOCATION
+
+
+def _split_line(line, ncols):
+    # คอลัมน์สุดท้ายอาจมี "," ปนอยู่ (เช่น "1,000.00 cms") จึง split ไม่เกินจำนวนคอลัมน์
+    parts = line.rstrip("\n").split(",", ncols)
+    if len(parts) < 2:
+        raise ValueError(f"แถวไม่ครบ: {line!r}")
+    return parts[0], parts[1:]
+
+
+def _lines_backward(path, block=TAIL_BLOCK):
+    """บรรทัดของไฟล์จากท้ายไปต้น อ่านย้อนทีละ block (ผู้เรียกหยุดอ่านเมื่อไรก็ได้)"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b""
+        while pos > 0:
+            size = min(block, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + rest).split(b"\n")
+            rest = lines.pop(0)   # บรรทัดแรกของ block อาจยังไม่ครบ ต่อกับ block ก่อนหน้า
+            for line in reversed(lines):
+                if line:
+                    yield line.decode('utf-8')
+        if rest:
+            yield rest.decode('utf-8')
+
+
+class CsvStore:
+    """
+    backend เดิม: append ต่อท้ายไฟล์ และสแกนไฟล์เมื่อค้นหา
+    ถ้ามีคลังรายเดือน (archive.py) จะอ่านรวมคลัง + live tail ให้อัตโนมัติ
+    """
+
+    name = "csv"
+
+    def path(self, series):
+        return SERIES[series]["file"]
+
+    @staticmethod
+    def _archive(series):
+        # import numpy เฉพาะเมื่อ series นี้มีคลังจริง เพื่อไม่ให้เพิ่มเวลา startup
+        if not os.path.isdir(os.path.join(ARCHIVE_DIR, series)):
+            return None
+        import archive
+        return archive
+
+    @staticmethod
+    def _day_index(series):
+        if not SERIES[series].get("day_index"):
+            return None
+        from dayindex import DayIndex
+        return DayIndex(series)
+
+    def append(self, series, ts, values):
+        self.append_many(series, [(ts, values)])
+
+    def append_many(self, series, rows):
+        index = self._day_index(series)
+        spans = []
+        with open(self.path(series), 'ab') as f:
+            for ts, values in rows:
+                line = ",".join([ts.isoformat()] + [str(v) for v in values]) + "\n"
+                offset = f.tell()
+                f.write(line.encode('utf-8'))
+                spans.append((offset, f.tell(), ts, [str(v) for v in values]))
+        if index is not None:
+            for offset, end, ts, values in spans:
+                index.record_append(offset, end, ts, values)
+
+    def replace_range(self, series, start, end, rows):
+        """
+        แทนที่ทุกแถวที่ ts อยู่ในช่วง [start, end] ด้วย rows แบบ atomic
+        (เขียนไฟล์ชั่วคราวแล้ว os.replace ผู้อ่านจึงเห็นไฟล์เดิมหรือไฟล์ใหม่ที่ครบเสมอ)
+        แทนที่เฉพาะแถวใน CSV: แถวในคลังรายเดือนคงเดิม และแถวใน rows ที่อยู่ในคลังแล้ว
+        (เช่นผู้เรียกรวมผลของ range() แล้วเขียนกลับ) จะไม่ถูกเขียนซ้ำลง CSV
+        """
+        archive = self._archive(series)
+        if archive is not None:
+            archived = {(ts, tuple(values)) for ts, values in archive.iter_rows(series, start, end)}
+            rows = [(ts, values) for ts, values in rows if (ts, tuple(str(v) for v in values)) not in archived]
+        path = self.path(series)
+        broken, merged = [], []
+        if os.path.exists(path):
+            ncols = len(SERIES[series]["columns"])
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        dt = parse_ts(_split_line(line, ncols)[0])
+                    except ValueError:
+                        broken.append(line)   # แถวที่อ่านไม่ได้เก็บไว้ตามเดิม ไม่ทิ้งข้อมูล
+                        continue
+                    if not start <= dt <= end:
+                        merged.append((dt, line if line.endswith("\n") else line + "\n"))
+        merged.extend(
+            (ts, ",".join([ts.isoformat()] + [str(v) for v in values]) + "\n") for ts, values in rows
+        )
+        merged.sort(key=lambda item: item[0])   # stable: แถวเวลาเดียวกันคงลำดับเดิม
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.writelines(broken)
+            f.writelines(line for _, line in merged)
+        os.replace(tmp, path)
+        index = self._day_index(series)
+        if index is not None:
+            index.rebuild()
+
+    def iter_live_rows(self, series):
+        """แถวจากไฟล์ CSV เท่านั้น (ไม่รวมคลัง)"""
+        path = self.path(series)
+        if not os.path.exists(path):
+            return
+        ncols = len(SERIES[series]["columns"])
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    ts_text, values = _split_line(line, ncols)
+                    yield parse_ts(ts_text), values
+                except ValueError:
+                    continue
+
+    def iter_rows(self, series):
+        archive = self._archive(series)
+        if archive is not None:
+            yield from archive.iter_rows(series)
+        yield from self.iter_live_rows(series)
+
+    def nearest(self, series, target, tolerance=timedelta(hours=12)):
+        best, best_diff = None, timedelta.max
+        archive = self._archive(series)
+        if archive is not None:
+            best = archive.nearest(series, target, tolerance)
+            if best is not None:
+                best_diff = abs(target - best[0])
+        index = self._day_index(series)
+        if index is not None:
+            live = index.nearest(target, tolerance)
+            if live is not None and abs(target - live[0]) < best_diff:
+                best = live
+            return best
+        for dt, values in self.iter_live_rows(series):
+            diff = abs(target - dt)
+            if diff <= tolerance and diff < best_diff:
+                best_diff, best = diff, (dt, values)
+        return best
+
+    def range(self, series, start=None, end=None):
+        archive = self._archive(series)
+        rows = list(archive.iter_rows(series, start, end)) if archive is not None else []
+        index = self._day_index(series)
+        if index is not None and start is not None and end is not None:
+            # ช่วงปิด: อ่านเฉพาะวันที่ทับช่วงผ่าน day index แทนการสแกนทั้งไฟล์
+            rows.extend(index.rows(start, end))
+            return rows
+        rows.extend(
+            (dt, values) for dt, values in self.iter_live_rows(series)
+            if (start is None or dt >= start) and (end is None or dt <= end)
+        )
+        return rows
+
+    def tail(self, series, span):
+        """
+        แถวในช่วง span สุดท้าย (นับย้อนจากแถวล่าสุด) เรียงตามเวลา
+        อ่าน CSV ย้อนจากท้ายไฟล์ทีละ block แล้วหยุดเมื่อเลยช่วง (ไฟล์เรียงตามเวลาเสมอ
+        เพราะ append ตามเวลาและ replace_range เรียงใหม่) เวลาและหน่วยความจำจึงขึ้นกับขนาดช่วง
+        ไม่ใช่ความยาวของ log ทั้งหมด ถ้าช่วงเลยต้นไฟล์จะอ่านต่อจากคลังรายเดือน
+        """
+        ncols = len(SERIES[series]["columns"])
+        rows, since, done = [], None, False
+        if os.path.exists(self.path(series)):
+            for line in _lines_backward(self.path(series)):
+                try:
+                    ts_text, values = _split_line(line, ncols)
+                    dt = parse_ts(ts_text)
+                except ValueError:
+                    continue
+                if since is None:
+                    since = dt - span
+                elif dt < since:
+                    done = True
+                    break
+                rows.append((dt, values))
+        rows.reverse()
+        archive = self._archive(series)
+        if not done and archive is not None:
+            if since is None:
+                last = archive.last_ts(series)
+                since = last - span if last is not None else None
+            if since is not None:
+                rows[:0] = archive.iter_rows(series, since)
+        return rows
+
+    def segments(self, series):
+        """
+        ไฟล์ข้อความที่เก็บแถวของ series เรียงตามเวลา สำหรับผู้อ่านแบบ incremental (rollup.py):
+        [(key, path, parse, mutable_tail)] parse(line) คืน list ของ run (first_seen, last_seen, polls, values)
+        ของบรรทัดนั้น (แถวเดี่ยวเป็น run ยาว 1) mutable_tail = บรรทัดสุดท้ายอาจถูกแก้ในที่เดิม ผู้อ่านต้องอ่านซ้ำทุกครั้ง
+        แถวในคลังรายเดือนไม่อยู่ในไฟล์เหล่านี้ (ดู iter_archived_rows)
+        """
+        ncols = len(SERIES[series]["columns"])
+
+        def parse(line):
+            ts_text, values = _split_line(line, ncols)
+            dt = parse_ts(ts_text)
+            return [(dt, dt, 1, values)]
+        return [("live", self.path(series), parse, False)]
+
+    def iter_archived_rows(self, series):
+        archive = self._archive(series)
+        return archive.iter_rows(series) if archive is not None else iter(())
+
+    def iter_runs(self, series, start=None, end=None):
+        """(first_seen, last_seen, polls, values) ที่ทับช่วง backend นี้เก็บทีละแถว แต่ละแถวจึงเป็น run ยาว 1"""
+        for dt, values in self.range(series, start, end):
+            yield dt, dt, 1, values
+
+    def signature(self, series):
+        """ค่าที่เปลี่ยนทุกครั้งที่ข้อมูลของ series เปลี่ยน (ใช้เป็น key ของ cache)"""
+        sig = []
+        path = self.path(series)
+        if os.path.exists(path):
+            st = os.stat(path)
+            sig.append([path, st.st_size, st.st_mtime_ns])
+        archive_dir = os.path.join(ARCHIVE_DIR, series)
+        if os.path.isdir(archive_dir):
+            for month in sorted(os.listdir(archive_dir)):
+                meta = os.path.join(archive_dir, month, "meta.json")
+                if os.path.exists(meta):
+                    sig.append([month, os.stat(meta).st_mtime_ns])
+        return sig
+
+    def latest(self, series):
+        last = None
+        for row in self.iter_live_rows(series):
+            last = row
+        if last is None and self._archive(series) is not None:
+            for row in self.iter_rows(series):
+                last = row
+        return last
+
+
+class SQLiteStore:
+    """backend SQLite (WAL) ที่มี index (series, ts) สำหรับ nearest/range แบบ O(log n)"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path=SQLITE_DB_FILE):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " series TEXT NOT NULL,"
+            " ts REAL NOT NULL,"          # epoch seconds (UTC) ใช้สำหรับ index
+            " ts_text TEXT NOT NULL,"     # ISO เดิม เก็บไว้เพื่อคืนค่าให้ตรงกับ CSV
+            " fields TEXT NOT NULL"       # JSON list ของคอลัมน์ที่เหลือ
+            ")"
+        )
+        # weather มีหลายเหตุการณ์ที่เวลาเดียวกันได้ จึงให้ unique ที่ (series, ts, fields)
+        # และใช้ prefix (series, ts) ของ index นี้สำหรับ nearest/range
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_series_ts"
+            " ON readings (series, ts, fields)"
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def append(self, series, ts, values):
+        self.append_many(series, [(ts, values)])
+
+    def append_many(self, series, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO readings (series, ts, ts_text, fields) VALUES (?, ?, ?, ?)",
+                [(series, ts.timestamp(), ts.isoformat(),
+                  json.dumps([str(v) for v in values], ensure_ascii=False))
+                 for ts, values in rows],
+            )
+
+    def replace_range(self, series, start, end, rows):
+        with self.conn:
+            self.conn.execute("DELETE FROM readings WHERE series = ? AND ts >= ? AND ts <= ?",
+                              (series, start.timestamp(), end.timestamp()))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO readings (series, ts, ts_text, fields) VALUES (?, ?, ?, ?)",
+                [(series, ts.timestamp(), ts.isoformat(),
+                  json.dumps([str(v) for v in values], ensure_ascii=False))
+                 for ts, values in rows],
+            )
+
+    @staticmethod
+    def _row(r):
+        return parse_ts(r[0]), json.loads(r[1])
+
+    def nearest(self, series, target, tolerance=timedelta(hours=12)):
+        t = target.timestamp()
+        tol = tolerance.total_seconds()
+        before = self.conn.execute(
+            "SELECT ts, ts_text, fields FROM readings WHERE series = ? AND ts <= ? AND ts >= ?"
+            " ORDER BY ts DESC LIMIT 1", (series, t, t - tol)).fetchone()
+        after = self.conn.execute(
+            "SELECT ts, ts_text, fields FROM readings WHERE series = ? AND ts > ? AND ts <= ?"
+            " ORDER BY ts ASC LIMIT 1", (series, t, t + tol)).fetchone()
+        candidates = [r for r in (before, after) if r is not None]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda r: abs(r[0] - t))
+        return self._row(best[1:])
+
+    def range(self, series, start=None, end=None):
+        lo = start.timestamp() if start is not None else float("-inf")
+        hi = end.timestamp() if end is not None else float("inf")
+        cur = self.conn.execute(
+            "SELECT ts_text, fields FROM readings WHERE series = ? AND ts >= ? AND ts <= ?"
+            " ORDER BY ts", (series, lo, hi))
+        return [self._row(r) for r in cur]
+
+    def tail(self, series, span):
+        last = self.conn.execute("SELECT MAX(ts) FROM readings WHERE series = ?", (series,)).fetchone()[0]
+        if last is None:
+            return []
+        return self.range(series, datetime.fromtimestamp(last, TIMEZONE_THAILAND) - span)
+
+    def iter_runs(self, series, start=None, end=None):
+        for dt, values in self.range(series, start, end):
+            yield dt, dt, 1, values
+
+    def signature(self, series):
+        r = self.conn.execute(
+            "SELECT COUNT(*), MAX(ts) FROM readings WHERE series = ?", (series,)).fetchone()
+        return [self.db_path, r[0], r[1]]
+
+    def latest(self, series):
+        r = self.conn.execute(
+            "SELECT ts_text, fields FROM readings WHERE series = ? ORDER BY ts DESC LIMIT 1",
+            (series,)).fetchone()
+        return self._row(r) if r else None
+
+    def import_csv(self, series):
+        """นำเข้าไฟล์ CSV เดิมของ series นี้ทั้งหมด คืนจำนวนแถวที่นำเข้า"""
+        rows = list(CsvStore().iter_rows(series))
+        self.append_many(series, rows)
+        return len(rows)
+
+
+class PartitionedStore(CsvStore):
+    """
+    CSV แยกไฟล์ต่อเดือน: data/<series>/<YYYY-MM>.csv
+    data/<series>/manifest.json เก็บจำนวนแถว ช่วงเวลา ขนาด และ encoding ของแต่ละเดือน
+    เดือนที่ปิดแล้ว (เก่ากว่าเดือนปัจจุบันเกิน SEAL_GRACE) เป็น immutable: เขียนทับ/ต่อท้ายไม่ได้
+
+    encoding ของแต่ละ partition:
+      rows  1 แถวต่อ 1 poll รูปแบบเดียวกับ CSV เดิม (ts,values...)
+      runs  (series ที่ตั้ง runs) poll ที่ค่าเหมือนกันติดกันรวมเป็น 1 แถว first_seen,last_seen,polls,values...
+            ต่อท้ายด้วยการแก้แถวสุดท้าย (ไม่ต้องเขียนทั้งไฟล์) ผู้อ่านได้แถวที่ first_seen และ last_seen
+            ของแต่ละ run (ค่าเวลาจริงทั้งคู่) ส่วน poll ระหว่างกลางเหลือเป็นจำนวน polls
+    """
+
+    name = "partitioned"
+
+    def __init__(self, root=PARTITION_DIR):
+        self.root = root
+        self.allow_sealed = False
+
+    @contextmanager
+    def writable_history(self):
+        """อนุญาตให้เขียนเดือนที่ปิดแล้วชั่วคราว (ใช้เฉพาะงานเติมข้อมูลย้อนหลัง เช่น backfill.py)"""
+        self.allow_sealed = True
+        try:
+            yield self
+        finally:
+            self.allow_sealed = False
+
+    def _dir(self, series):
+        return os.path.join(self.root, series)
+
+    def _manifest_path(self, series):
+        return os.path.join(self._dir(series), "manifest.json")
+
+    def path(self, series, month=None):
+        month = month or _month_key(datetime.now(TIMEZONE_THAILAND))
+        return os.path.join(self._dir(series), f"{month}.csv")
+
+    @staticmethod
+    def _archive(series):
+        return None      # แต่ละเดือนเล็กพออยู่แล้ว ไม่ใช้ archive.py
+
+    @staticmethod
+    def _day_index(series):
+        return None      # nearest เปิดเฉพาะเดือนที่เกี่ยวข้อง ไม่ต้องใช้ day index
+
+    # ── manifest ──
+    def load_manifest(self, series):
+        try:
+            with open(self._manifest_path(series), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"series": series, "columns": SERIES[series]["columns"], "partitions": []}
+
+    def _save_manifest(self, series, manifest):
+        manifest["partitions"].sort(key=lambda p: p["month"])
+        path = self._manifest_path(series)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        os.replace(tmp, path)
+
+    @staticmethod
+    def is_sealed(month, now=None):
+        now = now or datetime.now(TIMEZONE_THAILAND)
+        return month < _month_key(now - SEAL_GRACE)
+
+    def _check_writable(self, series, months):
+        if self.allow_sealed:
+            return
+        sealed = sorted(m for m in months if self.is_sealed(m))
+        if sealed:
+            raise ValueError(f"{series}: partition {', '.join(sealed)} ปิดแล้ว (immutable) แก้ไขไม่ได้")
+
+    @staticmethod
+    def _update_entry(manifest, month, count, min_ts, max_ts, size, encoding="rows"):
+        for part in manifest["partitions"]:
+            if part["month"] == month:
+                part["rows"] = count
+                part["min_ts"] = min_ts
+                part["max_ts"] = max_ts
+                part["bytes"] = size
+                part["encoding"] = encoding
+                return
+        manifest["partitions"].append({"month": month, "file": f"{month}.csv", "rows": count,
+                                       "min_ts": min_ts, "max_ts": max_ts, "bytes": size,
+                                       "encoding": encoding})
+
+    # ── run encoding ──
+    @staticmethod
+    def _encoding(series, part=None):
+        if part is not None:
+            return part.get("encoding", "rows")
+        return "runs" if SERIES[series].get("runs") else "rows"
+
+    @staticmethod
+    def _physical(series, values):
+        """ค่าตามคอลัมน์ของ series → คอลัมน์ที่เขียนลงไฟล์ runs (แยกหน่วยออก)"""
+        values = [str(v) for v in values]
+        unit = SERIES[series].get("unit")
+        if unit:
+            head = values[0] if values else ""
+            if head.endswith(" " + unit):
+                return [head[:-len(unit) - 1].replace(",", ""), unit] + values[1:]
+            return [head, ""] + values[1:]
+        return values
+
+    @staticmethod
+    def _logical(series, physical):
+        if SERIES[series].get("unit"):
+            value, unit = physical[0], physical[1]
+            return [f"{value} {unit}" if unit else value] + physical[2:]
+        return physical
+
+    def _run_line(self, series, first, last, polls, values):
+        return ",".join([first.isoformat(), last.isoformat(), str(polls)]
+                        + self._physical(series, values)) + "\n"
+
+    def _parse_run(self, series, line):
+        ncols = len(SERIES[series]["columns"]) + (1 if SERIES[series].get("unit") else 0)
+        parts = line.rstrip("\n").split(",", 2 + ncols)
+        if len(parts) < 4:
+            raise ValueError(f"run ไม่ครบ: {line!r}")
+        return parse_ts(parts[0]), parse_ts(parts[1]), int(parts[2]), self._logical(series, parts[3:])
+
+    def _collapse(self, series, runs):
+        """รวม run ที่เรียงตามเวลาแล้วซึ่งค่าเหมือนกันและห่างกันไม่เกิน RUN_MAX_GAP"""
+        merged, last_key = [], None
+        for first, last, polls, values in runs:
+            key = self._physical(series, values)
+            if merged and key == last_key and timedelta(0) <= first - merged[-1][1] <= RUN_MAX_GAP:
+                prev = merged[-1]
+                merged[-1] = (prev[0], max(prev[1], last), prev[2] + polls, prev[3])
+            else:
+                merged.append((first, last, polls, values))
+                last_key = key
+        return merged
+
+    def _partitions(self, series, start=None, end=None):
+        """รายการ partition (เรียงตามเดือน) ที่ช่วงเวลาทับกับ [start, end]"""
+        for part in self.load_manifest(series)["partitions"]:
+            if start is not None and parse_ts(part["max_ts"]) < start:
+                continue
+            if end is not None and parse_ts(part["min_ts"]) > end:
+                continue
+            yield part
+
+    def _iter_runs(self, series, part):
+        """(first_seen, last_seen, polls, values) ของ partition (แถวของ encoding rows เป็น run ยาว 1)"""
+        path = os.path.join(self._dir(series), part["file"])
+        if not os.path.exists(path):
+            return
+        runs = self._encoding(series, part) == "runs"
+        ncols = len(SERIES[series]["columns"])
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    if runs:
+                        yield self._parse_run(series, line)
+                    else:
+                        ts_text, values = _split_line(line, ncols)
+                        dt = parse_ts(ts_text)
+                        yield dt, dt, 1, values
+                except ValueError:
+                    continue
+
+    def _iter_partition(self, series, part):
+        for first, last, polls, values in self._iter_runs(series, part):
+            yield first, values
+            if last != first:
+                yield last, values
+
+    # ── เขียน ──
+    def append_many(self, series, rows):
+        by_month = {}
+        for ts, values in rows:
+            by_month.setdefault(_month_key(ts), []).append((ts, values))
+        self._check_writable(series, by_month)
+        os.makedirs(self._dir(series), exist_ok=True)
+        manifest = self.load_manifest(series)
+        entries = {p["month"]: p for p in manifest["partitions"]}
+        for month, month_rows in sorted(by_month.items()):
+            path = self.path(series, month)
+            prev = entries.get(month)
+            encoding = self._encoding(series, prev)
+            if encoding == "runs":
+                self._append_runs(series, path, month_rows)
+            else:
+                with open(path, 'a', encoding='utf-8') as f:
+                    for ts, values in month_rows:
+                        f.write(",".join([ts.isoformat()] + [str(v) for v in values]) + "\n")
+            stamps = [ts for ts, _ in month_rows]
+            if prev:
+                stamps += [parse_ts(prev["min_ts"]), parse_ts(prev["max_ts"])]
+            self._update_entry(manifest, month, (prev["rows"] if prev else 0) + len(month_rows),
+                               min(stamps).isoformat(), max(stamps).isoformat(), os.path.getsize(path),
+                               encoding)
+        self._save_manifest(series, manifest)
+
+    def _append_runs(self, series, path, rows):
+        """ต่อ poll ใหม่เข้ากับ run สุดท้ายของไฟล์ถ้าค่าเหมือนเดิม (แก้เฉพาะแถวสุดท้าย) ไม่เช่นนั้นเพิ่ม run ใหม่"""
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+            offset, runs = size, []
+            if tail.endswith(b"\n"):
+                start = tail.rfind(b"\n", 0, len(tail) - 1) + 1
+                try:
+                    runs.append(self._parse_run(series, tail[start:].decode('utf-8')))
+                    offset = size - len(tail) + start
+                except (ValueError, UnicodeDecodeError):
+                    pass
+            elif tail:
+                f.write(b"\n")      # แถวสุดท้ายไม่สมบูรณ์: ขึ้นบรรทัดใหม่ก่อนเขียน
+                offset = size + 1
+            runs = self._collapse(series, runs + [(ts, ts, 1, values) for ts, values in rows])
+            data = "".join(self._run_line(series, *run) for run in runs).encode('utf-8')
+            f.seek(offset)
+            f.write(data)
+            if offset + len(data) < size:   # เขียนทับแถวเดิมได้เกือบทุกครั้ง truncate เฉพาะเมื่อสั้นลง
+                f.truncate()
+
+    def _write_partition(self, series, month, runs, manifest, encoding):
+        """
+        เขียน partition ใหม่ทั้งไฟล์แบบ atomic จาก run (first, last, polls, values) ที่เรียงตามเวลาแล้ว
+        และอัปเดต manifest (encoding rows เขียนแต่ละ run เป็นแถวของจุดปลาย)
+        """
+        path = self.path(series, month)
+        if encoding == "runs":
+            runs = self._collapse(series, runs)
+        if not runs:
+            if os.path.exists(path):
+                os.remove(path)
+            manifest["partitions"] = [p for p in manifest["partitions"] if p["month"] != month]
+            return
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for first, last, polls, values in runs:
+                if encoding == "runs":
+                    f.write(self._run_line(series, first, last, polls, values))
+                    continue
+                for ts in (first, last) if last != first else (first,):
+                    f.write(",".join([ts.isoformat()] + [str(v) for v in values]) + "\n")
+        os.replace(tmp, path)
+        self._update_entry(manifest, month, sum(run[2] for run in runs), runs[0][0].isoformat(),
+                           max(run[1] for run in runs).isoformat(), os.path.getsize(path), encoding)
+
+    def replace_range(self, series, start, end, rows):
+        new_by_month = {}
+        for ts, values in rows:
+            new_by_month.setdefault(_month_key(ts), []).append((ts, values))
+        manifest = self.load_manifest(series)
+        touched = {p["month"]: p for p in self._partitions(series, start, end)}
+        months = set(touched) | set(new_by_month)
+        self._check_writable(series, months)
+        os.makedirs(self._dir(series), exist_ok=True)
+        # partition ที่ได้แถวใหม่อาจมีแถวเดิมนอก [start, end] ทั้งหมด (ไม่อยู่ใน touched) ต้องเก็บไว้ด้วย
+        existing = {p["month"]: p for p in manifest["partitions"] if p["month"] in months}
+        for month in sorted(months):
+            part = existing.get(month)
+            new = [(ts, ts, 1, values) for ts, values in new_by_month.get(month, [])]
+            kept = []
+            for first, last, polls, values in (self._iter_runs(series, part) if part else ()):
+                if last < start or first > end:
+                    kept.append((first, last, polls, values))
+                    continue
+                # run ที่ทับช่วง: เหลือจุดปลายที่อยู่นอกช่วง บวกแถวใหม่ที่ค่าเดิมภายในช่วงของ run
+                # (เช่นผู้เรียกเขียนแถวจาก range() กลับมา) แล้วประกอบเป็น run เดิมอีกครั้ง
+                key = self._physical(series, values)
+                inside = [r for r in new if first <= r[0] <= last and self._physical(series, r[3]) == key]
+                stamps = [ts for ts in {first, last} if not start <= ts <= end] + [r[0] for r in inside]
+                if not stamps:
+                    continue
+                new = [r for r in new if r not in inside]
+                lo, hi = min(stamps), max(stamps)
+                kept.append((lo, hi, polls if (lo, hi) == (first, last) else len(set(stamps)), values))
+            kept.extend(new)
+            kept.sort(key=lambda r: r[0])   # stable: แถวเวลาเดียวกันคงลำดับเดิม
+            self._write_partition(series, month, kept, manifest, self._encoding(series, part))
+        self._save_manifest(series, manifest)
+
+    # ── อ่าน ──
+    def iter_live_rows(self, series):
+        for part in self._partitions(series):
+            yield from self._iter_partition(series, part)
+
+    def iter_rows(self, series):
+        return self.iter_live_rows(series)
+
+    def nearest(self, series, target, tolerance=timedelta(hours=12)):
+        best, best_diff = None, timedelta.max
+        for part in self._partitions(series, target - tolerance, target + tolerance):
+            for first, last, polls, values in self._iter_runs(series, part):
+                # เป้าหมายอยู่ภายใน run: ค่าเดียวกันตลอดช่วง ถือว่าห่าง 0
+                dt = first if abs(target - first) <= abs(target - last) else last
+                diff = timedelta(0) if first <= target <= last else abs(target - dt)
+                if diff <= tolerance and diff < best_diff:
+                    best_diff, best = diff, (dt, values)
+        return best
+
+    def iter_runs(self, series, start=None, end=None):
+        for part in self._partitions(series, start, end):
+            for run in self._iter_runs(series, part):
+                if (start is None or run[1] >= start) and (end is None or run[0] <= end):
+                    yield run
+
+    def range(self, series, start=None, end=None):
+        return [
+            (dt, values)
+            for part in self._partitions(series, start, end)
+            for dt, values in self._iter_partition(series, part)
+            if (start is None or dt >= start) and (end is None or dt <= end)
+        ]
+
+    def segments(self, series):
+        """ไฟล์รายเดือนตาม manifest (ดู CsvStore.segments) แถวสุดท้ายของ run ในเดือนที่ยังไม่ปิดแก้ในที่เดิมได้"""
+        result = []
+        for part in self.load_manifest(series)["partitions"]:
+            runs = self._encoding(series, part) == "runs"
+            result.append((part["month"], os.path.join(self._dir(series), part["file"]),
+                           partial(self._line_runs, series, runs), runs and not self.is_sealed(part["month"])))
+        return result
+
+    def _line_runs(self, series, runs, line):
+        if runs:
+            return [self._parse_run(series, line)]
+        ts_text, values = _split_line(line, len(SERIES[series]["columns"]))
+        dt = parse_ts(ts_text)
+        return [(dt, dt, 1, values)]
+
+    def tail(self, series, span):
+        """แถวในช่วง span สุดท้าย เปิดเฉพาะไฟล์เดือนท้ายๆ ที่ manifest บอกว่าทับช่วงนั้น"""
+        rows, since = [], None
+        for part in reversed(self.load_manifest(series)["partitions"]):
+            if since is not None and parse_ts(part["max_ts"]) < since:
+                break
+            chunk = list(self._iter_partition(series, part))
+            if not chunk:
+                continue
+            if since is None:
+                since = chunk[-1][0] - span
+            rows[:0] = [row for row in chunk if row[0] >= since]
+        return rows
+
+    def signature(self, series):
+        return [[p["month"], p["rows"], p["bytes"]] for p in self.load_manifest(series)["partitions"]]
+
+    def latest(self, series):
+        parts = self.load_manifest(series)["partitions"]
+        last = None
+        for part in reversed(parts):
+            for row in self._iter_partition(series, part):
+                last = row
+            if last is not None:
+                break
+        return last
+
+    def partition_from_csv(self, series, force=False):
+        """แยกข้อมูลของ series จาก CSV เดิม (รวมคลัง archive) เป็นไฟล์รายเดือน คืนจำนวนแถว"""
+        if os.path.exists(self._manifest_path(series)) and not force:
+            return 0
+        by_month = {}
+        for dt, values in CsvStore().iter_rows(series):
+            by_month.setdefault(_month_key(dt), []).append((dt, values))
+        if not by_month:
+            return 0
+        os.makedirs(self._dir(series), exist_ok=True)
+        manifest = {"series": series, "columns": SERIES[series]["columns"], "partitions": []}
+        for month, rows in sorted(by_month.items()):
+            rows.sort(key=lambda r: r[0])
+            self._write_partition(series, month, [(dt, dt, 1, v) for dt, v in rows], manifest,
+                                  self._encoding(series))
+        self._save_manifest(series, manifest)
+        return sum(len(rows) for rows in by_month.values())
+
+    def encode_runs(self, series):
+        """แปลง partition encoding rows ของ series ที่ตั้ง runs เป็น run record คืน (ไฟล์, bytes ก่อน, หลัง)"""
+        if not SERIES[series].get("runs"):
+            return 0, 0, 0
+        manifest = self.load_manifest(series)
+        files = before = after = 0
+        for part in list(manifest["partitions"]):
+            if self._encoding(series, part) == "runs":
+                continue
+            before += part["bytes"]
+            runs = sorted(self._iter_runs(series, part), key=lambda r: r[0])
+            self._write_partition(series, part["month"], runs, manifest, "runs")
+            after += next((p["bytes"] for p in manifest["partitions"] if p["month"] == part["month"]), 0)
+            files += 1
+        if files:
+            self._save_manifest(series, manifest)
+        return files, before, after
+
+
+def _month_key(dt):
+    return dt.astimezone(TIMEZONE_THAILAND).strftime("%Y-%m")
+
+
+_store = None
+
+
+def get_store():
+    """คืน store ตาม STORAGE_BACKEND (สร้างครั้งเดียวต่อ process)"""
+    global _store
+    if _store is None:
+        if STORAGE_BACKEND == "sqlite":
+            _store = SQLiteStore()
+        elif STORAGE_BACKEND == "partitioned":
+            _store = PartitionedStore()
+        else:
+            _store = CsvStore()
+    return _store
+
+
+def import_all():
+    store = SQLiteStore()
+    for series in SERIES:
+        n = store.import_csv(series)
+        print(f"[INFO] นำเข้า {SERIES[series]['file']} → {store.db_path} ({series}) {n} แถว")
+    store.close()
+
+
+def encode_all(names=None):
+    store = PartitionedStore()
+    for series in names or [s for s in SERIES if SERIES[s].get("runs")]:
+        files, before, after = store.encode_runs(series)
+        if files:
+            print(f"[INFO] {series}: แปลง {files} partition เป็น run record ({before:,} → {after:,} bytes)")
+        else:
+            print(f"[INFO] {series}: ไม่มี partition ที่ต้องแปลง ข้าม")
+
+
+def partition_all(names=None):
+    store = PartitionedStore()
+    for series in names or SERIES:
+        n = store.partition_from_csv(series)
+        if n:
+            print(f"[INFO] แยก {SERIES[series]['file']} → {store._dir(series)}/ ({n} แถว)")
+        else:
+            print(f"[INFO] {series}: แยกไว้แล้วหรือไม่มีข้อมูล ข้าม")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "import":
+        import_all()
+    elif len(sys.argv) > 1 and sys.argv[1] == "partition":
+        partition_all(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "encode":
+        encode_all(sys.argv[2:])
+    else:
+        print("usage: python storage.py import | partition [series ...] | encode [series ...]")
@@ -4,7 +4,11 @@ import json
 from datetime import datetime, timedelta
 import pytz
 import pandas as pd
-import requests
+
+import line_delivery
+import metrics
+import rollup
+from storage import SERIES, WEATHER_PRIMARY_LOCATION, get_store
 
 # ── CONFIG ──
 TZ = pytz.timezone('Asia/Bangkok')
@@ -16,6 +20,40 @@ CHAOP_LOG    = 'historical_log.csv'
 INBURI_LOG   = 'inburi_log.csv'
 WEATHER_LOG  = 'weather_log.csv'
 
+# ช่วงเวลาที่ใช้คำนวณการเปลี่ยนแปลงของทุกแถว และระยะห่างสูงสุดจากเวลาเป้าหมาย
+DELTA_HORIZONS  = {'24h': timedelta(hours=24), '7d': timedelta(days=7), '365d': timedelta(days=365)}
+DELTA_TOLERANCE = timedelta(hours=2)
+# ข้อความรายวันใช้ค่าล่าสุดเทียบ 24 ชม. ก่อน (อ่านจาก rollup.py)
+REPORT_HORIZON  = DELTA_HORIZONS['24h']
+# แนวโน้ม 7 วัน/1 ปีคำนวณด้วย get_deltas จากท้าย log ช่วง horizon ยาวสุด + tolerance
+TREND_HORIZONS  = {k: v for k, v in DELTA_HORIZONS.items() if k != '24h'}
+TREND_SPAN      = max(TREND_HORIZONS.values()) + DELTA_TOLERANCE
+TREND_LABELS    = {'7d': '7 วัน', '365d': '1 ปี'}
+FORECAST_SPAN   = timedelta(days=6)      # พยากรณ์ 5 วันข้างหน้า + เผื่อ (อ่านเฉพาะท้าย weather log)
+CACHE_DIR       = os.getenv('SUMMARY_CACHE_DIR', '.cache')
+
+# ── Helper: โหลด log เป็น DataFrame จาก backend ที่เลือก ──
+def load_log(series, path, names, span=None):
+    """
+    DataFrame ของ log (span = อ่านเฉพาะช่วงท้ายนับจากแถวล่าสุดผ่าน store.tail
+    ซึ่งไม่ต้องอ่านประวัติทั้งหมด; None = ทั้ง log)
+    """
+    store = get_store()
+    found = store.tail(series, span) if span is not None else store.range(series)
+    rows = [[dt.isoformat()] + values for dt, values in found]
+    if not rows:
+        raise FileNotFoundError(path)
+    width = len(names)
+    df = pd.DataFrame([(r + [None] * width)[:width] for r in rows], columns=names)
+    df[names[0]] = pd.to_datetime(df[names[0]], format='ISO8601')
+    for col in names[1:]:
+        df[col] = df[col].replace({'N/A': None, 'None': None, '': None})
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+    return df
+
 # ── Helper function to get data and 24-hour prior data ──
 def get_data_with_24hr_prior(df, ts_col, value_col):
     if df.empty:
@@ -38,124 +76,275 @@ def get_data_with_24hr_prior(df, ts_col, value_col):
 
     return latest_data, data_24hr_ago, df
 
+# ── Vectorized: การเปลี่ยนแปลงเทียบ 24 ชม./7 วัน/365 วันก่อน ของทุกแถวในรอบเดียว ──
+def compute_deltas(df, ts_col, value_col, horizons=DELTA_HORIZONS, tolerance=DELTA_TOLERANCE):
+    """
+    เพิ่มคอลัมน์ <ts_col>_<h>_ago, <value_col>_<h>_ago และ delta_<h> ให้ทุกแถว
+    ใช้ merge_asof หาแถวที่ใกล้ (ts - h) ที่สุดภายใน tolerance (ไม่พบ = NaN)
+    """
+    df = df.sort_values(by=ts_col).drop_duplicates(subset=[ts_col], keep='last').reset_index(drop=True)
+    base = df[[ts_col, value_col]].dropna(subset=[value_col])
+    for label, horizon in horizons.items():
+        prior = base.rename(columns={ts_col: f'{ts_col}_{label}_ago', value_col: f'{value_col}_{label}_ago'})
+        target = pd.DataFrame({'_target': df[ts_col] - horizon})
+        merged = pd.merge_asof(
+            target, prior, left_on='_target', right_on=f'{ts_col}_{label}_ago',
+            direction='nearest', tolerance=tolerance,
+        )
+        df[f'{ts_col}_{label}_ago'] = merged[f'{ts_col}_{label}_ago']
+        df[f'{value_col}_{label}_ago'] = merged[f'{value_col}_{label}_ago']
+        df[f'delta_{label}'] = df[value_col] - df[f'{value_col}_{label}_ago']
+    return df
+
+
+def get_deltas(series, loader, ts_col, value_col, horizons=DELTA_HORIZONS):
+    """
+    compute_deltas แบบมี cache บนดิสก์ key ด้วย signature ของ log (ขนาด/mtime)
+    loader() ถูกเรียกเฉพาะเมื่อ cache ไม่ตรงกับ log ปัจจุบัน
+    """
+    key = json.dumps({'log': get_store().signature(series), 'value': value_col,
+                      'horizons': {k: v.total_seconds() for k, v in horizons.items()},
+                      'tolerance': DELTA_TOLERANCE.total_seconds()}, sort_keys=True, default=str)
+    data_path = os.path.join(CACHE_DIR, f'deltas_{series}.pkl')
+    key_path = os.path.join(CACHE_DIR, f'deltas_{series}.key')
+    if os.path.exists(data_path) and os.path.exists(key_path):
+        with open(key_path, 'r', encoding='utf-8') as f:
+            if f.read() == key:
+                return pd.read_pickle(data_path)
+
+    df = compute_deltas(loader(), ts_col, value_col, horizons)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_pickle(data_path + '.tmp')
+    os.replace(data_path + '.tmp', data_path)
+    with open(key_path, 'w', encoding='utf-8') as f:
+        f.write(key)
+    return df
+
+
+def load_trends(series, path, names, value_col):
+    """
+    {label: การเปลี่ยนแปลงของแถวล่าสุดเทียบ label ก่อน} ตาม TREND_HORIZONS (ไม่มีข้อมูล = ไม่มี key)
+    อ่านเฉพาะท้าย log ช่วง TREND_SPAN และใช้ cache ของ get_deltas ถ้า log ไม่เปลี่ยน
+    """
+    def loader():
+        df = load_log(series, path, names, TREND_SPAN)
+        # ค่าใน log อาจมีหน่วย/คอมมา (เช่น "1,234 cms")
+        df[value_col] = pd.to_numeric(df[value_col].astype(str).str.replace(r'\s*cms|,', '', regex=True),
+                                      errors='coerce')
+        return df
+    try:
+        deltas = get_deltas(series, loader, names[0], value_col, TREND_HORIZONS)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[WARN] คำนวณแนวโน้มของ {series} ไม่สำเร็จ: {e}")
+        return {}
+    if deltas.empty:
+        return {}
+    latest = deltas.iloc[-1]
+    return {label: latest[f'delta_{label}'] for label in TREND_HORIZONS if pd.notna(latest[f'delta_{label}'])}
+
+
+def _trend_lines(trends, unit, fmt):
+    lines = []
+    for label, diff in trends.items():
+        change_text = "เพิ่มขึ้น" if diff > 0 else "ลดลง" if diff < 0 else "คงที่"
+        lines.append(f"  • เปลี่ยนแปลงจาก {TREND_LABELS.get(label, label)} ที่แล้ว: {change_text} {abs(diff):{fmt}} {unit}")
+    return lines
+
+
+def _row_series(row, names, numeric):
+    """แถว (datetime, values) จาก rollup → pd.Series แบบเดียวกับแถวของ load_log"""
+    if row is None:
+        return None
+    dt, values = row
+    data = {names[0]: pd.Timestamp(dt)}
+    for name, value in zip(names[1:], list(values) + [None] * len(names)):
+        if name in numeric:
+            value = rollup.to_float(value)
+            data[name] = float('nan') if value is None else value
+        else:
+            data[name] = None if value in (None, 'N/A', 'None', '') else value
+    return pd.Series(data)
+
+
+def nearest_reading(series, target, value_col, tolerance=DELTA_TOLERANCE):
+    """
+    แถวจริงใน log ที่ใกล้ target ที่สุดภายใน tolerance โดย value_col ไม่เป็น N/A คืน (datetime, values) หรือ None
+    rollup.window ใช้แค่แคบช่วงให้เหลือชั่วโมงที่มีค่า แล้วอ่านแถวดิบเฉพาะช่วงนั้นจาก store
+    run (ค่าเดียวกันหลาย poll) ที่ครอบ target ถือว่าห่าง 0 และคืนเวลาปลาย run ที่ใกล้กว่า เหมือน store.nearest
+    """
+    span = rollup.window(series, target, tolerance, value_col)
+    if span is None:
+        return None
+    index = SERIES[series]['columns'].index(value_col)
+    best, best_diff = None, timedelta.max
+    for first, last, _, values in get_store().iter_runs(series, *span):
+        if rollup.to_float(values[index] if index < len(values) else None) is None:
+            continue
+        dt = first if abs(target - first) <= abs(target - last) else last
+        diff = timedelta(0) if first <= target <= last else abs(target - dt)
+        if diff <= tolerance and diff < best_diff:
+            best, best_diff = (dt, values), diff
+    return best
+
+
+def latest_with_prior(series, names, value_col, numeric, horizon=REPORT_HORIZON):
+    """
+    แถวล่าสุด (จาก rollup รายชั่วโมง อัปเดตเฉพาะแถวใหม่ก่อนอ่าน) และแถวจริงที่มีค่า value_col
+    ใกล้ (ล่าสุด - horizon) ที่สุดภายใน DELTA_TOLERANCE (nearest_reading)
+    """
+    rollup.update(series)
+    latest = rollup.latest(series)
+    if latest is None:
+        raise FileNotFoundError(series)
+    prior = nearest_reading(series, latest[0] - horizon, value_col)
+    return _row_series(latest, names, numeric), _row_series(prior, names, numeric)
+
 # ── 1) Load Chaopraya storage data ──
-latest_chaop = None
-chaop_24hr_ago = None
-try:
-    df_c = pd.read_csv(CHAOP_LOG, names=['ts','storage'], parse_dates=['ts'])
-    df_c['storage'] = df_c['storage'].str.replace(r'\s*cms','',regex=True).astype(float)
-    latest_chaop, chaop_24hr_ago, _ = get_data_with_24hr_prior(df_c, 'ts', 'storage')
-except FileNotFoundError:
-    print(f"Error: {CHAOP_LOG} not found. Skipping Chaopraya data.")
-except Exception as e:
-    print(f"Error processing {CHAOP_LOG}: {e}")
+def load_chaopraya():
+    try:
+        return latest_with_prior('chaopraya', ['ts','storage'], 'storage', {'storage'})
+    except FileNotFoundError:
+        print(f"Error: {CHAOP_LOG} not found. Skipping Chaopraya data.")
+    except Exception as e:
+        print(f"Error processing {CHAOP_LOG}: {e}")
+    return None, None
 
 # ── 2) Load Inburi water level data ──
-latest_inb = None
-inb_24hr_ago = None
-try:
-    df_i = pd.read_csv(INBURI_LOG, names=['ts','water_level','bank_level','status','below_bank','time'], parse_dates=['ts'])
-    latest_inb, inb_24hr_ago, _ = get_data_with_24hr_prior(df_i, 'ts', 'water_level')
-except FileNotFoundError:
-    print(f"Error: {INBURI_LOG} not found. Skipping Inburi data.")
-except Exception as e:
-    print(f"Error processing {INBURI_LOG}: {e}")
+def load_inburi():
+    try:
+        return latest_with_prior('inburi', ['ts','water_level','bank_level','status','below_bank','time'],
+                                 'water_level', {'water_level', 'bank_level', 'below_bank'})
+    except FileNotFoundError:
+        print(f"Error: {INBURI_LOG} not found. Skipping Inburi data.")
+    except Exception as e:
+        print(f"Error processing {INBURI_LOG}: {e}")
+    return None, None
 
 # ── 3) Next weather event (if any) ──
-next_evt = None
-try:
-    df_w = pd.read_csv(WEATHER_LOG, names=['ts','event','value'], parse_dates=['ts'])
-    now_utc = datetime.utcnow().replace(tzinfo=pytz.UTC)
-    
-    if df_w['ts'].dt.tz is None:
-        df_w['ts_utc'] = df_w['ts'].dt.tz_localize(TZ, nonexistent='NaT').dt.tz_convert(pytz.UTC)
-    else:
-        df_w['ts_utc'] = df_w['ts'].dt.tz_convert(pytz.UTC)
-
-    upcoming = df_w[df_w['ts_utc'] > now_utc].copy()
-    upcoming = upcoming.sort_values(by='ts_utc').reset_index(drop=True)
-
-    if not upcoming.empty:
-        next_evt_row = upcoming.iloc[0]
-        next_evt = {
-            'ts': next_evt_row['ts'],
-            'event': next_evt_row['event'],
-            'value': next_evt_row['value']
-        }
-except FileNotFoundError:
-    print(f"Error: {WEATHER_LOG} not found. Skipping weather data.")
-except Exception as e:
-    print(f"Error processing {WEATHER_LOG}: {e}")
+def load_next_weather_event():
+    try:
+        df_w = load_log('weather', WEATHER_LOG, ['ts','event','value','issued','location'], FORECAST_SPAN)
+        # ตารางพยากรณ์มีหลายจุด สรุปรายวันใช้เฉพาะจุดหลัก (แถวเก่าที่ไม่มี location คือจุดหลัก)
+        df_w = df_w[df_w['location'].isna() | (df_w['location'] == WEATHER_PRIMARY_LOCATION)]
+        now_utc = datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+        if df_w['ts'].dt.tz is None:
+            df_w['ts_utc'] = df_w['ts'].dt.tz_localize(TZ, nonexistent='NaT').dt.tz_convert(pytz.UTC)
+        else:
+            df_w['ts_utc'] = df_w['ts'].dt.tz_convert(pytz.UTC)
+
+        upcoming = df_w[df_w['ts_utc'] > now_utc].copy()
+        upcoming = upcoming.sort_values(by='ts_utc').reset_index(drop=True)
+
+        if not upcoming.empty:
+            next_evt_row = upcoming.iloc[0]
+            return {
+                'ts': next_evt_row['ts'],
+                'event': next_evt_row['event'],
+                'value': next_evt_row['value']
+            }
+    except FileNotFoundError:
+        print(f"Error: {WEATHER_LOG} not found. Skipping weather data.")
+    except Exception as e:
+        print(f"Error processing {WEATHER_LOG}: {e}")
+    return None
 
 # ── 4) Build message ──
-lines = [
-    "📊 **สรุปรายงานสถานการณ์น้ำและอากาศ**",
-    f"🗓️ วันที่: {datetime.now(TZ).strftime('%d/%m/%Y %H:%M น.')}",
-    "",
-]
-
-# --- เขื่อนเจ้าพระยา ---
-lines.append("🌊 **สถานการณ์น้ำเขื่อนเจ้าพระยา**")
-if latest_chaop is not None and pd.notna(latest_chaop['storage']):
-    lines.append(f"  • ปริมาณน้ำท้ายเขื่อนล่าสุด: {latest_chaop['storage']:.1f} ลบ.ม./วินาที ณ {latest_chaop['ts'].strftime('%H:%M น.')}")
-    if chaop_24hr_ago is not None and pd.notna(chaop_24hr_ago['storage']):
-        diff_chaop = latest_chaop['storage'] - chaop_24hr_ago['storage']
-        change_text = "เพิ่มขึ้น" if diff_chaop > 0 else "ลดลง" if diff_chaop < 0 else "คงที่"
-        lines.append(f"  • เปลี่ยนแปลงจาก 24 ชม. ที่แล้ว: {change_text} {abs(diff_chaop):.1f} ลบ.ม./วินาที")
+def build_message(latest_chaop, chaop_24hr_ago, latest_inb, inb_24hr_ago, next_evt,
+                  chaop_trends=None, inb_trends=None):
+    lines = [
+        "📊 **สรุปรายงานสถานการณ์น้ำและอากาศ**",
+        f"🗓️ วันที่: {datetime.now(TZ).strftime('%d/%m/%Y %H:%M น.')}",
+        "",
+    ]
+
+    # --- เขื่อนเจ้าพระยา ---
+    lines.append("🌊 **สถานการณ์น้ำเขื่อนเจ้าพระยา**")
+    if latest_chaop is not None and pd.notna(latest_chaop['storage']):
+        lines.append(f"  • ปริมาณน้ำท้ายเขื่อนล่าสุด: {latest_chaop['storage']:.1f} ลบ.ม./วินาที ณ {latest_chaop['ts'].strftime('%H:%M น.')}")
+        if chaop_24hr_ago is not None and pd.notna(chaop_24hr_ago['storage']):
+            diff_chaop = latest_chaop['storage'] - chaop_24hr_ago['storage']
+            change_text = "เพิ่มขึ้น" if diff_chaop > 0 else "ลดลง" if diff_chaop < 0 else "คงที่"
+            lines.append(f"  • เปลี่ยนแปลงจาก 24 ชม. ที่แล้ว: {change_text} {abs(diff_chaop):.1f} ลบ.ม./วินาที")
+        else:
+            lines.append("  • ไม่มีข้อมูลเปรียบเทียบ 24 ชม. ที่แล้ว")
+        lines.extend(_trend_lines(chaop_trends or {}, "ลบ.ม./วินาที", ".1f"))
     else:
-        lines.append("  • ไม่มีข้อมูลเปรียบเทียบ 24 ชม. ที่แล้ว")
-else:
-    lines.append("  • ไม่มีข้อมูลปริมาณน้ำท้ายเขื่อน")
-lines.append("")
-
-# --- อินทร์บุรี ---
-lines.append("🏞️ **สถานการณ์น้ำสะพานอินทร์บุรี**")
-if latest_inb is not None and pd.notna(latest_inb['water_level']):
-    status_text = f" ({latest_inb.get('status', 'ไม่ระบุสถานะ')})" if latest_inb.get('status') else ""
-    lines.append(f"  • ระดับน้ำล่าสุด: {latest_inb['water_level']:.2f} ม.รทก.{status_text} ณ {latest_inb['ts'].strftime('%H:%M น.')}")
-
-    if pd.notna(latest_inb.get('below_bank')):
-         lines.append(f"  • ห่างจากตลิ่ง: {latest_inb['below_bank']:.2f} ม.")
-
-    if inb_24hr_ago is not None and pd.notna(inb_24hr_ago['water_level']):
-        diff_inb = latest_inb['water_level'] - inb_24hr_ago['water_level']
-        change_text = "เพิ่มขึ้น" if diff_inb > 0 else "ลดลง" if diff_inb < 0 else "คงที่"
-        lines.append(f"  • เปลี่ยนแปลงจาก 24 ชม. ที่แล้ว: {change_text} {abs(diff_inb):.2f} ม.")
+        lines.append("  • ไม่มีข้อมูลปริมาณน้ำท้ายเขื่อน")
+    lines.append("")
+
+    # --- อินทร์บุรี ---
+    lines.append("🏞️ **สถานการณ์น้ำสะพานอินทร์บุรี**")
+    if latest_inb is not None and pd.notna(latest_inb['water_level']):
+        status_text = f" ({latest_inb.get('status', 'ไม่ระบุสถานะ')})" if latest_inb.get('status') else ""
+        lines.append(f"  • ระดับน้ำล่าสุด: {latest_inb['water_level']:.2f} ม.รทก.{status_text} ณ {latest_inb['ts'].strftime('%H:%M น.')}")
+
+        if pd.notna(latest_inb.get('below_bank')):
+             lines.append(f"  • ห่างจากตลิ่ง: {latest_inb['below_bank']:.2f} ม.")
+
+        if inb_24hr_ago is not None and pd.notna(inb_24hr_ago['water_level']):
+            diff_inb = latest_inb['water_level'] - inb_24hr_ago['water_level']
+            change_text = "เพิ่มขึ้น" if diff_inb > 0 else "ลดลง" if diff_inb < 0 else "คงที่"
+            lines.append(f"  • เปลี่ยนแปลงจาก 24 ชม. ที่แล้ว: {change_text} {abs(diff_inb):.2f} ม.")
+        else:
+            lines.append("  • ไม่มีข้อมูลเปรียบเทียบ 24 ชม. ที่แล้ว")
+        lines.extend(_trend_lines(inb_trends or {}, "ม.", ".2f"))
     else:
-        lines.append("  • ไม่มีข้อมูลเปรียบเทียบ 24 ชม. ที่แล้ว")
-else:
-    lines.append("  • ไม่มีข้อมูลระดับน้ำสะพานอินทร์บุรี")
-lines.append("")
+        lines.append("  • ไม่มีข้อมูลระดับน้ำสะพานอินทร์บุรี")
+    lines.append("")
 
-# --- พยากรณ์อากาศ ---
-lines.append("⛅ **พยากรณ์อากาศ**")
-if next_evt is not None:
-    lines.append(f"  • เหตุการณ์ถัดไป: {next_evt['event']} (ค่า: {next_evt['value']})")
-    lines.append(f"  • เวลา: {next_evt['ts'].strftime('%d/%m/%Y %H:%M น.')}")
-else:
-    lines.append("  • ไม่มีเหตุการณ์สำคัญใน 12 ชั่วโมงข้างหน้า")
+    # --- พยากรณ์อากาศ ---
+    lines.append("⛅ **พยากรณ์อากาศ**")
+    if next_evt is not None:
+        lines.append(f"  • เหตุการณ์ถัดไป: {next_evt['event']} (ค่า: {next_evt['value']})")
+        lines.append(f"  • เวลา: {next_evt['ts'].strftime('%d/%m/%Y %H:%M น.')}")
+    else:
+        lines.append("  • ไม่มีเหตุการณ์สำคัญใน 12 ชั่วโมงข้างหน้า")
 
-text = "\n".join(lines)
+    return "\n".join(lines)
 
 # ── 5) Push via LINE ──
-if not (LINE_TOKEN and LINE_TARGET):
-    print("Error: LINE_TOKEN/LINE_TARGET ไม่ครบ! ข้ามการแจ้งเตือน LINE.")
-    exit()
-
-push_url = 'https://api.line.me/v2/bot/message/push'
-headers = {
-    'Authorization': f"Bearer {LINE_TOKEN}",
-    'Content-Type':  "application/json"
-}
-payload = {
-    "to": LINE_TARGET,
-    "messages": [
-        {"type":"text", "text": text}
-    ]
-}
-try:
-    resp = requests.post(push_url, headers=headers, json=payload)
-    resp.raise_for_status()
-    print("Daily summary sent.")
-except requests.exceptions.RequestException as e:
-    print(f"Failed to send LINE message: {e}")
+def send_summary(text):
+    if not (LINE_TOKEN and LINE_TARGET):
+        print("Error: LINE_TOKEN/LINE_TARGET ไม่ครบ! ข้ามการแจ้งเตือน LINE.")
+        return
+
+    # ส่งผ่าน outbox ของ workflow นี้ (LINE_OUTBOX_PATH): ข้อความสรุปที่ค้างจากรอบก่อนจะถูกส่งไปพร้อมกัน
+    line_delivery.enqueue(text)
+    sent, pending = line_delivery.flush()
+    if pending:
+        print(f"Failed to send LINE message: ค้างใน outbox {pending} ข้อความ จะส่งซ้ำรอบถัดไป")
+    else:
+        print("Daily summary sent.")
+
+
+@metrics.instrumented('summary_report')
+def main():
+    with metrics.stage('summary.load_chaopraya'):
+        latest_chaop, chaop_24hr_ago = load_chaopraya()
+    with metrics.stage('summary.load_inburi'):
+        latest_inb, inb_24hr_ago = load_inburi()
+    with metrics.stage('summary.load_weather'):
+        next_evt = load_next_weather_event()
+    with metrics.stage('summary.trends'):
+        chaop_trends = load_trends('chaopraya', CHAOP_LOG, ['ts','storage'], 'storage')
+        inb_trends = load_trends('inburi', INBURI_LOG, ['ts','water_level'], 'water_level')
+    text = build_message(latest_chaop, chaop_24hr_ago, latest_inb, inb_24hr_ago, next_evt,
+                         chaop_trends, inb_trends)
+    with metrics.stage('summary.line_push'):
+        send_summary(text)
+
+    # กราฟ chaop_summary.png ที่ workflow commit (import เฉพาะตอนใช้ เพราะ matplotlib โหลดช้า)
+    try:
+        with metrics.stage('summary.chart'):
+            import chart
+            path = chart.render_summary()
+        print(f"[INFO] บันทึกกราฟ {path} เรียบร้อย")
+    except Exception as e:
+        print(f"[WARN] สร้างกราฟไม่สำเร็จ: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+ชั้นดึงข้อมูลจาก upstream ที่ใช้ร่วมกันทุกแหล่ง (tiwrm, thaiwater, OpenWeatherMap)
+
+- latency budget ต่อรอบ: ทุก request ในรอบเดียวกันใช้เวลารวมไม่เกิน FETCH_BUDGET_S วินาที
+  (collector เริ่มรอบใหม่ด้วย start_cycle(); สคริปต์เดี่ยวเริ่มรอบเองเมื่อ request แรก)
+- hedged request: ถ้า request แรกยังไม่ตอบภายใน p95 ของ latency ที่ผ่านมาของ endpoint นั้น
+  จะยิง request ซ้ำอีกตัวแล้วใช้ผลที่มาก่อน (เฉพาะ GET) แต่ละ request รันใน daemon thread
+  และ get() ตัด body ที่อ่านไม่เสร็จภายใน timeout ตัวที่แพ้จึงไม่ยืดเวลาจบของ process
+- retry แบบ exponential back-off + jitter เมื่อ timeout / connection error / 429 / 5xx
+- circuit breaker ต่อ endpoint: ล้มเหลว (หลัง retry ครบ) ติดกัน BREAKER_FAILURES ครั้ง จะหยุดเรียก endpoint นั้น
+  BREAKER_COOLDOWN_S วินาที (ระหว่างนี้ผู้เรียกใช้ค่าล่าสุดที่ดึงได้ โดยติดป้าย stale)
+  หลังพักครบจะปล่อยให้ลองใหม่ ถ้ายังล้มเหลวจะเปิดใหม่ทันที
+
+สถานะ breaker และ latency ล่าสุดเก็บใน STATE_DIR/<endpoint>.json ไฟล์ละ endpoint
+เพื่อให้แต่ละ workflow commit เฉพาะไฟล์ของตัวเองได้โดยไม่ชนกัน
+BREAKER_COOLDOWN_S ควรยาวกว่าช่วงห่างระหว่างรอบ ไม่เช่นนั้น breaker จะปิดเองก่อนรอบถัดไปเสมอ:
+ค่าเริ่มต้น 900s เหมาะกับ daemon.py (รอบละ 5 นาที) ส่วน workflow ที่รันวันละครั้งตั้งเป็น 36 ชม.
+
+ใช้งาน:
+  resp = upstream.get("tiwrm", URL, timeout=30, headers=headers)
+  python upstream.py            # แสดงสถานะ breaker / p95 ของทุก endpoint
+  python upstream.py reset tiwrm
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+import requests
+
+import metrics
+from http_client import get_session
+
+# --- ค่าคงที่ ---
+STATE_DIR        = os.getenv("UPSTREAM_STATE_DIR", "upstream_state")
+CYCLE_BUDGET     = float(os.getenv("FETCH_BUDGET_S", "25"))    # เวลารวมสูงสุดของการดึงข้อมูลต่อรอบ
+MAX_ATTEMPTS     = int(os.getenv("FETCH_ATTEMPTS", "3"))
+BACKOFF_BASE     = float(os.getenv("FETCH_BACKOFF_S", "0.5"))  # รอ 0.5, 1, 2 ... วินาที (±50%)
+HEDGE            = os.getenv("FETCH_HEDGE", "1").lower() in ("1", "true")
+HEDGE_MIN_DELAY  = 0.2     # ไม่ hedge เร็วกว่านี้ แม้ p95 จะต่ำมาก
+HEDGE_DEFAULT    = 2.0     # ใช้เมื่อยังมีตัวอย่าง latency ไม่พอ
+HEDGE_MIN_SAMPLES = 10
+LATENCY_SAMPLES  = 50      # จำนวน latency ล่าสุดที่เก็บต่อ endpoint
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN_S", "900"))
+RETRY_STATUS     = (429, 500, 502, 503, 504)
+READ_CHUNK       = 64 * 1024   # bytes ต่อครั้งที่อ่าน body (ตรวจ timeout ระหว่างอ่าน)
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """breaker ของ endpoint เปิดอยู่ จึงไม่ได้ส่ง request"""
+
+
+class BudgetExceeded(requests.exceptions.Timeout):
+    """ใช้ latency budget ของรอบนี้หมดแล้ว"""
+
+
+_lock = threading.Lock()
+_states = {}        # endpoint -> state (โหลดจากไฟล์เมื่อใช้ครั้งแรก)
+_dirty = set()
+_deadline = None
+_atexit_registered = False
+
+
+# ── latency budget ──
+def start_cycle(budget=CYCLE_BUDGET):
+    """เริ่มรอบใหม่: request ทั้งหมดหลังจากนี้ต้องเสร็จภายใน budget วินาที"""
+    global _deadline
+    _deadline = time.monotonic() + budget
+
+
+def remaining():
+    """วินาทีที่เหลือใน budget ของรอบนี้ (เริ่มรอบให้เองถ้ายังไม่ได้เริ่ม)"""
+    if _deadline is None:
+        start_cycle()
+    return max(0.0, _deadline - time.monotonic())
+
+
+# ── state ──
+def _state_path(name):
+    return os.path.join(STATE_DIR, f"{name}.json")
+
+
+def _state(name):
+    global _atexit_registered
+    if name not in _states:
+        try:
+            with open(_state_path(name), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("failures", 0)
+        state.setdefault("opened_until", 0)
+        state.setdefault("latencies", [])
+        _states[name] = state
+        if not _atexit_registered:
+            atexit.register(save_state)
+            _atexit_registered = True
+    return _states[name]
+
+
+def save_state():
+    """เขียนสถานะของ endpoint ที่เปลี่ยนไปลงไฟล์ (atomic ต่อไฟล์)"""
+    with _lock:
+        names, states = list(_dirty), {n: dict(_states[n]) for n in _dirty}
+        _dirty.clear()
+    if names:
+        os.makedirs(STATE_DIR, exist_ok=True)
+    for name in names:
+        tmp = _state_path(name) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(states[name], f, ensure_ascii=False)
+        os.replace(tmp, _state_path(name))
+
+
+def is_open(name):
+    """breaker ของ endpoint นี้เปิดอยู่หรือไม่ (ยังอยู่ในช่วงพัก)"""
+    with _lock:
+        return _state(name)["opened_until"] > time.time()
+
+
+def hedge_delay(name):
+    """เวลารอก่อนยิง request ซ้ำ = p95 ของ latency ล่าสุดของ endpoint"""
+    with _lock:
+        samples = list(_state(name)["latencies"])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT
+    return max(HEDGE_MIN_DELAY, metrics.percentile(samples, 0.95))
+
+
+def _record_success(name, latency):
+    with _lock:
+        state = _state(name)
+        if state["failures"] >= BREAKER_FAILURES:
+            print(f"[INFO] {name}: circuit breaker ปิดแล้ว (upstream กลับมาใช้ได้)")
+        state["failures"], state["opened_until"] = 0, 0
+        state["latencies"] = (state["latencies"] + [round(latency, 3)])[-LATENCY_SAMPLES:]
+        _dirty.add(name)
+
+
+def _record_failure(name):
+    with _lock:
+        state = _state(name)
+        state["failures"] += 1
+        if state["failures"] >= BREAKER_FAILURES:
+            state["opened_until"] = time.time() + BREAKER_COOLDOWN
+            print(f"[WARN] {name}: ล้มเหลวติดกัน {state['failures']} ครั้ง → เปิด circuit breaker "
+                  f"{BREAKER_COOLDOWN:.0f}s")
+            metrics.count(f"{name}.breaker_opened")
+        _dirty.add(name)
+
+
+# ── request ──
+def _timed(fn, timeout):
+    started = time.monotonic()
+    result = fn(timeout)
+    return result, time.monotonic() - started
+
+
+def _spawn(fn, timeout):
+    """
+    รัน _timed(fn, timeout) ใน daemon thread คืน Future
+    request ที่แพ้ hedge หรือเลย timeout จะไม่ถูกรอตอน interpreter จบ (ThreadPoolExecutor join ทุก thread)
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_timed(fn, timeout))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="upstream", daemon=True).start()
+    return future
+
+
+def _attempt(name, fn, timeout, hedge):
+    """ลอง 1 ครั้ง (อาจมี request ซ้ำ 1 ตัว) รอไม่เกิน timeout คืน (ผลลัพธ์, latency)"""
+    deadline = time.monotonic() + timeout
+    pending = [_spawn(fn, timeout)]
+    delay = hedge_delay(name) if hedge else None
+    error = None
+    while pending:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        wait_for = min(left, delay) if delay is not None else left
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        if not done and delay is not None:
+            # request แรกช้ากว่า p95 → ยิงซ้ำ แล้วรอตัวที่เสร็จก่อน (ตัวที่ช้าจะจบเองตาม timeout)
+            delay = None
+            metrics.count(f"{name}.hedged")
+            pending.append(_spawn(fn, deadline - time.monotonic()))
+    if error is not None and not pending:
+        raise error
+    raise requests.exceptions.Timeout(f"{name}: ไม่ตอบภายใน {timeout:.1f}s")
+
+
+def call(name, fn, timeout, hedge=False, attempts=MAX_ATTEMPTS):
+    """
+    เรียก fn(timeout) ผ่าน breaker / budget / retry ของ endpoint name
+    fn ต้อง raise เมื่อผลใช้ไม่ได้ (exception ใดๆ ถือว่า retry ได้) คืนผลลัพธ์ของ fn
+    """
+    if is_open(name):
+        metrics.count(f"{name}.breaker_skip")
+        raise CircuitOpen(f"{name}: circuit breaker เปิดอยู่")
+
+    error = None
+    for attempt in range(attempts):
+        left = remaining()
+        if left <= 0:
+            if error is None:
+                # budget หมดเพราะแหล่งอื่น ไม่นับเป็นความล้มเหลวของ endpoint นี้
+                raise BudgetExceeded(f"{name}: ใช้ latency budget ของรอบนี้หมดแล้ว")
+            break
+        try:
+            result, latency = _attempt(name, fn, min(timeout, left), hedge)
+        except Exception as e:
+            error = e
+            metrics.count(f"{name}.attempt_error")
+            if attempt + 1 >= attempts:
+                break
+            backoff = BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+            if backoff >= remaining():
+                break
+            print(f"[WARN] {name}: {e} → ลองใหม่ใน {backoff:.1f}s ({attempt + 2}/{attempts})")
+            metrics.count(f"{name}.retry")
+            time.sleep(backoff)
+            continue
+        _record_success(name, latency)
+        return result
+
+    _record_failure(name)
+    raise error
+
+
+def get(name, url, timeout=10, hedge=HEDGE, attempts=MAX_ATTEMPTS, **kwargs):
+    """GET ผ่าน session กลาง: 429/5xx นับเป็นความล้มเหลว (retry ได้) ส่วนสถานะอื่นคืนให้ผู้เรียก"""
+    session = get_session()
+
+    def fetch(t):
+        # timeout ของ requests นับต่อการอ่านแต่ละครั้ง server ที่ส่ง body มาทีละน้อยจึงลากได้ไม่จำกัด:
+        # อ่าน body เองแล้วตัดเมื่อเวลารวมเกิน t
+        deadline = time.monotonic() + t
+        resp = session.get(url, timeout=t, stream=True, **kwargs)
+        try:
+            body = []
+            for chunk in resp.iter_content(READ_CHUNK):
+                if time.monotonic() > deadline:
+                    raise requests.exceptions.Timeout(f"{name}: อ่าน response ไม่เสร็จภายใน {t:.1f}s")
+                body.append(chunk)
+            resp._content = b"".join(body)
+        finally:
+            resp.close()
+        if resp.status_code in RETRY_STATUS:
+            raise requests.exceptions.HTTPError(f"{resp.status_code} จาก {name}", response=resp)
+        return resp
+
+    return call(name, fetch, timeout, hedge=hedge, attempts=attempts)
+
+
+def reset(name):
+    with _lock:
+        state = _state(name)
+        state["failures"], state["opened_until"] = 0, 0
+        _dirty.add(name)
+    save_state()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "reset":
+        for name in argv[1:]:
+            reset(name)
+            print(f"[INFO] reset circuit breaker ของ {name}")
+        return 0
+    names = sorted(f[:-5] for f in os.listdir(STATE_DIR) if f.endswith(".json")) if os.path.isdir(STATE_DIR) else []
+    for name in names:
+        state = _state(name)
+        left = state["opened_until"] - time.time()
+        status = f"เปิด (อีก {left:.0f}s)" if left > 0 else "ปิด"
+        print(f"{name:<12} breaker {status:<16} ล้มเหลวติดกัน {state['failures']:>2}  "
+              f"hedge หลัง {hedge_delay(name):.2f}s  ({len(state['latencies'])} ตัวอย่าง)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,36 @@
 #!/usr/bin/env python3
 import os
 import json
+import math
+import time
 import requests
-from datetime import datetime, timedelta, timezone # เพิ่ม timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone # เพิ่ม timezone
 import pytz
-import pandas as pd
+
+import metrics
+import upstream
+from storage import WEATHER_PRIMARY_LOCATION, get_store, parse_ts, weather_location
 
 # -------- CONFIGURATION --------
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 WEATHER_LOG_FILE    = "weather_log.csv"
 DATA_FILE           = "weather_data.json" # เพื่อเก็บสถานะการแจ้งเตือนภายใน (ไม่ได้ใช้สำหรับ LINE)
+FETCH_CACHE_FILE    = "weather_fetch_cache.json"
+FETCH_CACHE_TTL     = int(os.getenv("WEATHER_CACHE_TTL", str(3 * 3600)))  # พยากรณ์ของ OWM เป็นช่วงละ 3 ชม.
 
 # ENV FLAGS
 DRY_RUN = os.getenv("DRY_RUN", "").lower() in ("1", "true")
 
-# ตั้งค่าพิกัดสำหรับ อินทร์บุรี จ.สิงห์บุรี
-LATITUDE  = 14.8966 # ละติจูดของสิงห์บุรี
-LONGITUDE = 100.3892 # ลองจิจูดของสิงห์บุรี
-LOCATION_NAME = 'อินทร์บุรี จ.สิงห์บุรี'
+# registry ของจุดพยากรณ์: key -> (ละติจูด, ลองจิจูด, ชื่อ) ค่าเริ่มต้นมีจุดเดียว (พิกัดเดิมของสิงห์บุรี)
+# เพิ่ม/แก้จุดได้ด้วยไฟล์ JSON ที่ WEATHER_LOCATIONS_PATH: {"key": [lat, lon, "ชื่อ"], ...}
+DEFAULT_LOCATIONS = {
+    "inburi": (14.8966, 100.3892, "อินทร์บุรี จ.สิงห์บุรี"),
+}
+LOCATIONS_FILE = os.getenv("WEATHER_LOCATIONS_PATH")
+GRID_DEG       = float(os.getenv("WEATHER_GRID_DEG", "0.25"))  # ขนาด grid cell (องศา) ≈ ความละเอียดของแบบจำลองโลก (GFS)
+FETCH_WORKERS  = int(os.getenv("WEATHER_WORKERS", "4"))        # จำนวน request พร้อมกันสูงสุด
+FORECAST_URL   = os.getenv("OPENWEATHER_URL", "http://api.openweathermap.org/data/2.5/forecast")
 
 # ตั้งค่า timezone
 TZ = pytz.timezone('Asia/Bangkok')
@@ -36,98 +49,252 @@ def send_line_message(msg: str):
     print("[INFO] send_line_message ถูกปิดการใช้งานใน weather_forecaster.py")
 
 
-def fetch_weather_forecast():
-    """ดึงข้อมูลพยากรณ์อากาศ 5 วัน / 3 ชั่วโมงจาก OpenWeatherMap"""
+def load_locations(path=LOCATIONS_FILE):
+    """registry ของจุดพยากรณ์ {key: (lat, lon, ชื่อ)}: ค่าเริ่มต้น + จุดจากไฟล์ (ถ้าตั้งไว้ key ซ้ำใช้ค่าจากไฟล์)"""
+    locations = dict(DEFAULT_LOCATIONS)
+    if not path:
+        return locations
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    locations.update({key: (float(v[0]), float(v[1]), v[2] if len(v) > 2 else key) for key, v in raw.items()})
+    return locations
+
+
+def grid_cell(lat, lon, grid=GRID_DEG):
+    """key ของ grid cell ที่ (lat, lon) ตกอยู่ (grid <= 0 = ไม่รวม cell)"""
+    if grid <= 0:
+        return f"{lat:.4f},{lon:.4f}"
+    # + 1e-9 กันพิกัดที่อยู่บนเส้นขอบพอดีตกไป cell ข้างๆ เพราะ floating point
+    clat = round((math.floor(lat / grid + 1e-9) + 0.5) * grid, 4)
+    clon = round((math.floor(lon / grid + 1e-9) + 0.5) * grid, 4)
+    return f"{clat:.4f},{clon:.4f}"
+
+
+def group_by_cell(locations, grid=GRID_DEG):
+    """
+    {cell key: ((lat, lon) ที่ใช้ดึง, [location key, ...])}
+    ดึงที่พิกัดจริงของจุดหลัก (WEATHER_PRIMARY_LOCATION) ถ้าอยู่ใน cell นั้น ไม่เช่นนั้นใช้จุดแรกของ cell
+    """
+    cells = {}
+    for key, (lat, lon, _) in locations.items():
+        cell = cells.setdefault(grid_cell(lat, lon, grid), [(lat, lon), []])
+        if key == WEATHER_PRIMARY_LOCATION:
+            cell[0] = (lat, lon)
+        cell[1].append(key)
+    return {key: tuple(cell) for key, cell in cells.items()}
+
+
+def _load_fetch_cache():
+    try:
+        with open(FETCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # cache รูปแบบเดิม (จุดเดียว) ไม่มี "cells" จะถูกดึงใหม่รอบแรก
+    return cache.get('cells', {}) if isinstance(cache, dict) else {}
+
+
+def _save_fetch_cache(cells):
+    tmp = FETCH_CACHE_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'grid': GRID_DEG, 'cells': cells}, f, ensure_ascii=False)
+    os.replace(tmp, FETCH_CACHE_FILE)
+
+
+def _fetch_cell(cell, point):
+    lat, lon = point
+    url = f"{FORECAST_URL}?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
+    try:
+        print(f"[DEBUG] ดึงข้อมูลจาก OpenWeatherMap (cell {cell}): {url.replace(OPENWEATHER_API_KEY, '***')}")
+        with metrics.stage("weather.http_fetch"):
+            response = upstream.get("owm", url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"[ERROR] ไม่สามารถดึงข้อมูลพยากรณ์อากาศของ cell {cell} ได้: {e}")
+        return None
+    data['_fetched_at'] = time.time()
+    return data
+
+
+def fetch_weather_forecast(max_age=FETCH_CACHE_TTL, locations=None):
+    """
+    ดึงข้อมูลพยากรณ์อากาศ 5 วัน / 3 ชั่วโมงจาก OpenWeatherMap ของทุกจุดใน registry
+    จุดที่อยู่ใน grid cell เดียวกันใช้ request เดียว และ cell ที่เคยดึงสำเร็จภายใน max_age วินาที
+    ใช้ผลเดิมจาก cache ส่วน cell ที่เหลือดึงพร้อมกันไม่เกิน FETCH_WORKERS request
+    ถ้า circuit breaker ของ OpenWeatherMap เปิดอยู่ cell ที่ดึงไม่ได้จะใช้ผลเดิมจาก cache (ติด "_stale")
+    คืน {location: ผลของ cell นั้น} ("_fetched_at" (epoch) ใช้เป็นเวลาออกพยากรณ์) หรือ None ถ้าไม่ได้อะไรเลย
+    """
     if not OPENWEATHER_API_KEY:
         print("[ERROR] OPENWEATHER_API_KEY ไม่ได้ตั้งค่า! ไม่สามารถดึงข้อมูลพยากรณ์อากาศได้.")
         return None
 
-    url = (
-        f"http://api.openweathermap.org/data/2.5/forecast?"
-        f"lat={LATITUDE}&lon={LONGITUDE}&appid={OPENWEATHER_API_KEY}&units=metric"
-    )
-    try:
-        print(f"[DEBUG] ดึงข้อมูลจาก OpenWeatherMap: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] ไม่สามารถดึงข้อมูลพยากรณ์อากาศได้: {e}")
-        return None
+    locations = load_locations() if locations is None else locations
+    cells = group_by_cell(locations)
+    metrics.gauge("weather.locations", len(locations))
+    metrics.gauge("weather.cells", len(cells))
+
+    cache = _load_fetch_cache()
+    results, stale = {}, []
+    for cell in cells:
+        data = cache.get(cell)
+        age = time.time() - data.get('_fetched_at', 0) if data else None
+        if age is not None and 0 <= age < max_age:
+            metrics.count("weather.cache_hit")
+            results[cell] = data
+        else:
+            stale.append(cell)
+    if results:
+        print(f"[INFO] ใช้ผลพยากรณ์จาก cache {len(results)}/{len(cells)} cell")
 
+    if stale:
+        workers = max(1, min(FETCH_WORKERS, len(stale)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weather") as pool:
+            fetched = pool.map(lambda cell: _fetch_cell(cell, cells[cell][0]), stale)
+            fetched = dict(zip(stale, fetched))
+        fresh = {cell: data for cell, data in fetched.items() if data is not None}
+        if fresh:
+            results.update(fresh)
+            # เก็บเฉพาะ cell ที่ยังอยู่ใน registry; cell ที่ดึงไม่สำเร็จคงผลเก่าไว้ใช้รอบหน้า
+            _save_fetch_cache({cell: results.get(cell, cache.get(cell)) for cell in cells
+                               if cell in results or cell in cache})
+        if upstream.is_open("owm"):
+            # breaker เปิด: ใช้ผลเดิมของ cell ที่ดึงไม่ได้ ("_fetched_at" เดิม จึงไม่ทับพยากรณ์ที่ใหม่กว่า)
+            old = {cell: dict(cache[cell], _stale=True) for cell in stale if cell not in results and cell in cache}
+            if old:
+                print(f"[WARN] circuit breaker ของ OpenWeatherMap เปิดอยู่ → ใช้ผลเดิม {len(old)} cell (stale)")
+                metrics.count("weather.stale", len(old))
+                results.update(old)
 
-def parse_weather_data(forecast_data):
-    """Parse ข้อมูลพยากรณ์อากาศเพื่อหาเหตุการณ์สำคัญ"""
+    forecasts = {loc: results[cell] for cell, (_, locs) in cells.items() if cell in results for loc in locs}
+    print(f"[INFO] พยากรณ์ {len(forecasts)}/{len(locations)} จุด จาก {len(cells)} cell "
+          f"(ดึงใหม่ {len(stale)})")
+    return forecasts or None
+
+
+def upsert_forecasts(batches):
+    """
+    บันทึกพยากรณ์ชุดใหม่ลงตาราง weather ร่วมของทุกจุดแบบ keyed upsert ใน replace_range ครั้งเดียว
+    batches = {location: (issued, rows)} key คือ (location, เวลาที่พยากรณ์ถึง, เวลาออกพยากรณ์):
+    ช่วงเวลาที่ชุดใหม่ของจุดหนึ่งครอบคลุมจะถูกแทนที่เฉพาะแถวของจุดนั้น แถวของจุดอื่นคงเดิม
+    ส่วนช่วงที่ผ่านไปแล้วยังคงเก็บพยากรณ์ล่าสุดของช่วงนั้นไว้เป็นประวัติ
+    ชุดที่ออกก่อนข้อมูลที่มีอยู่ (เช่น payload เก่า) จะไม่ทับของใหม่ คืนจำนวนแถวที่เขียน
+    """
+    windows = {loc: (min(ts for ts, _ in rows), max(ts for ts, _ in rows))
+               for loc, (_, rows) in batches.items() if rows}
+    if not windows:
+        return 0
+    store = get_store()
+    start = min(lo for lo, _ in windows.values())
+    end = max(hi for _, hi in windows.values())
+    existing = list(store.range('weather', start, end))
+
+    accepted = dict(windows)
+    for _, values in existing:
+        loc = weather_location(values)
+        if loc in accepted and len(values) > 2 and values[2] not in ('', 'N/A') \
+                and parse_ts(values[2]) > batches[loc][0]:
+            print(f"[WARN] {loc}: มีพยากรณ์ที่ใหม่กว่า ({values[2]}) อยู่แล้ว "
+                  f"ข้ามชุดที่ออกเมื่อ {batches[loc][0].isoformat()}")
+            del accepted[loc]
+    if not accepted:
+        return 0
+
+    def replaced(ts, values):
+        window = accepted.get(weather_location(values))
+        return window is not None and window[0] <= ts <= window[1]
+
+    merged = [(ts, values) for ts, values in existing if not replaced(ts, values)]
+    for loc in accepted:
+        merged.extend(batches[loc][1])
+    merged.sort(key=lambda row: row[0])   # stable: แถวเดิมมาก่อนแถวใหม่ที่เวลาเดียวกัน
+    store.replace_range('weather', start, end, merged)
+    return sum(len(batches[loc][1]) for loc in accepted)
+
+
+def forecast_rows(forecast_data, location=WEATHER_PRIMARY_LOCATION):
+    """แปลงผลของ OpenWeatherMap เป็น (issued, [(เวลาที่พยากรณ์ถึง, [event, value, issued, location]), ...])"""
+    fetched_at = forecast_data.get("_fetched_at")
+    issued = datetime.fromtimestamp(fetched_at, TZ) if fetched_at else datetime.now(TZ)
+    issued = issued.replace(microsecond=0)
+    issued_text = issued.isoformat()
+
+    rows = []
+    for item in forecast_data["list"]:
+        dt_txt = item["dt_txt"] # เวลา UTC (string)
+
+        # แปลง string เป็น datetime object ก่อน
+        dt_utc = datetime.strptime(dt_txt, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        dt_local = dt_utc.astimezone(TZ) # แปลงเป็นเวลาท้องถิ่น
+
+        weather_main = item["weather"][0]["main"].lower()
+
+        temp_max = item.get('main', {}).get('temp_max', None)
+
+        event_type = None
+        event_value = None
+
+        if "rain" in weather_main or "drizzle" in weather_main:
+            event_type = "ฝนตก"
+            event_value = item.get("rain", {}).get("3h", 0.0)
+        elif "thunderstorm" in weather_main:
+            event_type = "พายุฝนฟ้าคะนอง"
+            event_value = item.get("rain", {}).get("3h", 0.0)
+        elif "clear" in weather_main:
+            event_type = "ท้องฟ้าแจ่มใส"
+            event_value = item.get("clouds", {}).get("all", 0)
+        elif "clouds" in weather_main:
+            event_type = "มีเมฆ"
+            event_value = item.get("clouds", {}).get("all", 0)
+
+        # บันทึกเหตุการณ์สภาพอากาศหลัก
+        if event_type:
+            rows.append((dt_local, [event_type, event_value, issued_text, location]))
+
+        # ถ้ามีอุณหภูมิร้อนจัด ก็บันทึกเพิ่ม
+        if temp_max is not None and temp_max >= HEAT_THRESHOLD:
+            rows.append((dt_local, ["อากาศร้อนจัด", temp_max, issued_text, location]))
+    return issued, rows
+
+
+def parse_weather_data(forecasts, location=WEATHER_PRIMARY_LOCATION):
+    """
+    Parse ข้อมูลพยากรณ์อากาศเพื่อหาเหตุการณ์สำคัญ แล้วบันทึกลงตาราง weather
+    forecasts เป็น {location: ผลของ OpenWeatherMap} หรือผลของจุดเดียว (บันทึกเป็น location)
+    """
     events = []
-    if not forecast_data or "list" not in forecast_data:
+    if forecasts and "list" in forecasts:
+        forecasts = {location: forecasts}
+    batches = {loc: forecast_rows(data, loc) for loc, data in (forecasts or {}).items()
+               if data and "list" in data}
+    if not batches:
         return events
 
-    # ล้าง weather_log.csv ก่อนบันทึกข้อมูลพยากรณ์ใหม่
-    if os.path.exists(WEATHER_LOG_FILE):
-        os.remove(WEATHER_LOG_FILE)
-        print(f"[INFO] ลบไฟล์ {WEATHER_LOG_FILE} เดิมทิ้งก่อนบันทึกใหม่")
-
-    with open(WEATHER_LOG_FILE, 'a', encoding='utf-8') as f:
-        for item in forecast_data["list"]:
-            dt_txt = item["dt_txt"] # เวลา UTC (string)
-
-            # แปลง string เป็น datetime object ก่อน
-            dt_utc = datetime.strptime(dt_txt, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-            dt_local = dt_utc.astimezone(TZ) # แปลงเป็นเวลาท้องถิ่น
-
-            weather_main = item["weather"][0]["main"].lower()
-            weather_desc = item["weather"][0]["description"].lower()
-
-            temp_max = item.get('main', {}).get('temp_max', None)
-
-            event_type = None
-            event_value = None
-
-            if "rain" in weather_main or "drizzle" in weather_main:
-                event_type = "ฝนตก"
-                event_value = item.get("rain", {}).get("3h", 0.0)
-            elif "thunderstorm" in weather_main:
-                event_type = "พายุฝนฟ้าคะนอง"
-                event_value = item.get("rain", {}).get("3h", 0.0)
-            elif "clear" in weather_main:
-                event_type = "ท้องฟ้าแจ่มใส"
-                event_value = item.get("clouds", {}).get("all", 0)
-            elif "clouds" in weather_main:
-                event_type = "มีเมฆ"
-                event_value = item.get("clouds", {}).get("all", 0)
-
-            # บันทึกเหตุการณ์สภาพอากาศหลัก
-            if event_type:
-                f.write(f"{dt_local.isoformat()},{event_type},{event_value}\n")
-
-            # ถ้ามีอุณหภูมิร้อนจัด ก็บันทึกเพิ่ม
-            if temp_max is not None and temp_max >= HEAT_THRESHOLD:
-                f.write(f"{dt_local.isoformat()},อากาศร้อนจัด,{temp_max}\n")
-
-    print(f"[INFO] อัปเดต {WEATHER_LOG_FILE} เรียบร้อย")
+    with metrics.stage("weather.upsert"):
+        written = upsert_forecasts(batches)
+    if written:
+        issued = max(issued for issued, _ in batches.values()).isoformat()
+        print(f"[INFO] อัปเดต {WEATHER_LOG_FILE} เรียบร้อย ({written} แถว, ออกพยากรณ์ {issued})")
     return events
 
 
-def main():
-    print("=== เริ่ม weather_forecaster ===")
-
-    forecast_data = fetch_weather_forecast()
+def process_forecast(forecast_data):
+    """บันทึกผลพยากรณ์ลง weather log (ดึงไม่สำเร็จจะคงข้อมูลเดิมไว้)"""
     if not forecast_data:
-        print("[ERROR] ไม่สามารถดึงข้อมูลพยากรณ์อากาศได้, ข้ามการประมวลผล")
-        # ถ้ามีข้อผิดพลาดในการดึงข้อมูล จะล้างไฟล์และบันทึก N/A เพื่อให้ summary_report ทราบว่ามีปัญหา
-        if os.path.exists(WEATHER_LOG_FILE):
-            os.remove(WEATHER_LOG_FILE)
-        TZ_TH = pytz.timezone('Asia/Bangkok')
-        now_th = datetime.now(TZ_TH)
-        with open(WEATHER_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{now_th.isoformat()},N/A,N/A\n")
-        print(f"[INFO] อัปเดต {WEATHER_LOG_FILE} เรียบร้อย (มีข้อผิดพลาดในการดึงข้อมูล)")
+        # เก็บพยากรณ์เดิมไว้ตามเดิม (ยังใช้ได้จนกว่าจะหมดช่วงเวลา) แทนการล้างไฟล์
+        print(f"[ERROR] ไม่สามารถดึงข้อมูลพยากรณ์อากาศได้, ข้ามการประมวลผล ({WEATHER_LOG_FILE} ไม่ถูกแก้ไข)")
         return
 
     events = parse_weather_data(forecast_data)
 
     # ส่วนนี้เป็น logic การแจ้งเตือนที่ถูกปิดการใช้งานแล้ว
+    return events
 
+
+@metrics.instrumented("weather_forecaster")
+def main():
+    print("=== เริ่ม weather_forecaster ===")
+    process_forecast(fetch_weather_forecast())
     print("=== จบ weather_forecaster ===")
 
 